@@ -1,10 +1,13 @@
-from werkzeug.security import check_password_hash
 from .models import User
+from .password_service import check_password, hash_password, needs_rehash
 
 def authenticate_user(username, password):
     """
     Authenticate a user by username and password.
 
+    A correct password stored with an outdated hashing method is re-hashed with the current
+    "user" profile (see authorization.password_service).
+
     Args:
     - username (str): The username of the user.
     - password (str): The password to authenticate.
@@ -19,7 +22,10 @@ def authenticate_user(username, password):
         user = User.objects.get(username=username)
 
         try:
-            if check_password_hash(user.password, password):
+            if check_password(user.password, password):
+                if needs_rehash(user.password):
+                    user.password = hash_password(password)
+                    user.save(update_fields=["password"])
                 return {"authenticated": True, "user": user, "message": "Login successful."}
             else:
                 return {"authenticated": False, "message": "Password is incorrect."}
@@ -14,7 +14,7 @@ class User(AbstractUser):
 
     Methods:
     - __str__(): Returns the username of the user.
-    - save(): set default values.
+    - save(): set default profile values when the user is created.
     """
 
     password = models.CharField(max_length=512)
@@ -25,7 +25,8 @@ class User(AbstractUser):
         return f'{self.username}'
 
     def save(self, *args, **kwargs):
-        self.rank_points = BASIC_RANK_POINTS
-        self.image_number = BASIC_IMAGE_NUMBER
+        if self._state.adding:
+            self.rank_points = BASIC_RANK_POINTS
+            self.image_number = BASIC_IMAGE_NUMBER
 
         super().save(*args, **kwargs)
\ No newline at end of file
@@ -0,0 +1,87 @@
+"""
+Password hashing for user and room passwords.
+
+Every kind of password has its own werkzeug method string in AUTHORIZATION_PASSWORD_PROFILES,
+e.g. "scrypt:32768:8:1" for users and a cheaper pbkdf2 for short-lived room passwords.
+
+Hashing and checking run in a process pool of AUTHORIZATION_PASSWORD_WORKERS processes, so a
+login burst keeps that many cores busy instead of holding the GIL of the request workers.
+At most AUTHORIZATION_PASSWORD_MAX_PENDING hashes are queued; further callers wait for a slot.
+With 0 workers everything runs inline in the calling thread.
+
+A stored hash whose method differs from its profile is upgraded on the next successful login
+(see authorization.login_service).
+"""
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+_lock = threading.Lock()
+_executor = None
+_slots = None
+
+
+def get_method(profile):
+    return settings.AUTHORIZATION_PASSWORD_PROFILES[profile]
+
+
+def get_executor():
+    """Return the shared process pool, created on first use, or None if hashing runs inline."""
+    global _executor, _slots
+
+    if not settings.AUTHORIZATION_PASSWORD_WORKERS:
+        return None
+
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.AUTHORIZATION_PASSWORD_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _slots = threading.BoundedSemaphore(settings.AUTHORIZATION_PASSWORD_MAX_PENDING)
+        return _executor
+
+
+def shutdown():
+    """Stop the process pool; the next call starts a new one."""
+    global _executor
+
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+
+def run(function, *args):
+    executor = get_executor()
+    if executor is None:
+        return function(*args)
+
+    slots = _slots
+    slots.acquire()
+    try:
+        future = executor.submit(function, *args)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return future.result()
+
+
+def hash_password(password, profile="user"):
+    """Hash the password with the method of the profile ("user" or "room")."""
+    return run(generate_password_hash, password, get_method(profile))
+
+
+def check_password(password_hash, password):
+    """Return True if the password matches the hash, whatever method produced it."""
+    return run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash, profile="user"):
+    """Return True if the hash was not produced with the current method of the profile."""
+    return password_hash.split("$", 1)[0] != get_method(profile)
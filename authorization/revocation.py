@@ -0,0 +1,137 @@
+"""
+Revoked JWTs.
+
+Redis keeps the revoked token ids (`jti`) in a sorted set scored by the token's `exp`
+(AUTHORIZATION_REVOKED_KEY), plus a counter bumped by every revocation. Each process mirrors
+the set in a Bloom filter, so checking a token that was never revoked costs a few bit lookups
+and no I/O. Only a filter hit is confirmed with one ZSCORE, which rules out false positives.
+
+The filter is rebuilt when the counter moved, checked at most every
+AUTHORIZATION_REVOCATION_REFRESH seconds, so a revocation reaches other processes within that
+delay. Expired ids are pruned from Redis on every rebuild.
+"""
+
+import hashlib
+import threading
+import time
+from django.conf import settings
+from game_rooms.redis_client import get_redis, get_async_redis
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter of strings.
+
+    Methods:
+    - add(item): Adds the item.
+    - __contains__(item): Returns False if the item was never added, True if it probably was.
+    """
+
+    __slots__ = ("bits", "size", "hashes")
+
+    def __init__(self, size, hashes):
+        self.bits = bytearray((size + 7) // 8)
+        self.size = size
+        self.hashes = hashes
+
+    def positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=4 * self.hashes).digest()
+        return [int.from_bytes(digest[4 * i:4 * i + 4], "big") % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self.positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(item))
+
+
+class RevokedTokens:
+    """
+    Per-process mirror of the revoked token ids.
+
+    Methods:
+    - revoke(jti, expires_at): Revokes the token id until the token expires.
+    - is_revoked(jti) / ais_revoked(jti): Returns True if the token id was revoked.
+    - reset(): Forgets the local filter; the next check rebuilds it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.bloom = self.create_bloom()
+        self.version = None
+        self.checked_at = float("-inf")
+
+    @staticmethod
+    def create_bloom():
+        return BloomFilter(settings.AUTHORIZATION_REVOCATION_BLOOM_BITS, settings.AUTHORIZATION_REVOCATION_BLOOM_HASHES)
+
+    @staticmethod
+    def get_version_key():
+        return f"{settings.AUTHORIZATION_REVOKED_KEY}:version"
+
+    def needs_refresh(self):
+        return time.monotonic() - self.checked_at >= settings.AUTHORIZATION_REVOCATION_REFRESH
+
+    def read_revoked(self, pipe):
+        pipe.zremrangebyscore(settings.AUTHORIZATION_REVOKED_KEY, "-inf", time.time())
+        pipe.zrange(settings.AUTHORIZATION_REVOKED_KEY, 0, -1)
+
+    def apply(self, version, revoked=None):
+        with self.lock:
+            if revoked is not None:
+                bloom = self.create_bloom()
+                for jti in revoked:
+                    bloom.add(jti.decode())
+                self.bloom = bloom
+                self.version = version
+            self.checked_at = time.monotonic()
+
+    def refresh(self):
+        redis = get_redis()
+        version = redis.get(self.get_version_key())
+        if version == self.version:
+            return self.apply(version)
+
+        pipe = redis.pipeline(transaction=True)
+        self.read_revoked(pipe)
+        self.apply(version, pipe.execute()[-1])
+
+    async def arefresh(self):
+        redis = get_async_redis()
+        version = await redis.get(self.get_version_key())
+        if version == self.version:
+            return self.apply(version)
+
+        async with redis.pipeline(transaction=True) as pipe:
+            self.read_revoked(pipe)
+            self.apply(version, (await pipe.execute())[-1])
+
+    def is_revoked(self, jti):
+        if self.needs_refresh():
+            self.refresh()
+        if jti not in self.bloom:
+            return False
+        return get_redis().zscore(settings.AUTHORIZATION_REVOKED_KEY, jti) is not None
+
+    async def ais_revoked(self, jti):
+        if self.needs_refresh():
+            await self.arefresh()
+        if jti not in self.bloom:
+            return False
+        return await get_async_redis().zscore(settings.AUTHORIZATION_REVOKED_KEY, jti) is not None
+
+    def revoke(self, jti, expires_at):
+        pipe = get_redis().pipeline(transaction=True)
+        pipe.zadd(settings.AUTHORIZATION_REVOKED_KEY, {jti: expires_at})
+        pipe.incr(self.get_version_key())
+        pipe.execute()
+
+        with self.lock:
+            self.bloom.add(jti)
+
+
+revoked_tokens = RevokedTokens()
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 from .models import User
+from .password_service import hash_password
 
 class UserSerializer(serializers.Serializer):
     """
@@ -14,7 +15,8 @@ class UserSerializer(serializers.Serializer):
 
     Methods:
     - validate_password(value): Validates that the password is at least 5 characters long.
-    - create(validated_data): Creates a new User instance with the validated data.
+    - create(validated_data): Creates a new User instance with the validated data in a single INSERT,
+      the password already hashed.
     - update(instance, validated_data): Updates the password of an existing User instance and saves the changes.
     """
 
@@ -34,7 +36,7 @@ class UserSerializer(serializers.Serializer):
     def create(self, validated_data):
             user = User.objects.create(
                 username=validated_data["username"],
-                password=validated_data["password"],
+                password=hash_password(validated_data["password"]),
             )
 
             return user
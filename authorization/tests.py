@@ -1,8 +1,18 @@
 from django.test import TestCase
+from django.test.utils import override_settings, CaptureQueriesContext
+from django.db import connection
+from django.conf import settings
 from rest_framework.test import APIClient
 from rest_framework import status
+from unittest import mock
 from .models import User
+from . import token_service, password_service
+from .login_service import authenticate_user
+from config.custom_middleware import TokenAuthenticationMiddleware
+from game_rooms.redis_client import get_redis, aclose_async_redis
 from werkzeug.security import check_password_hash, generate_password_hash
+import jwt
+import time
 
 
 class SignUpViewTest(TestCase):
@@ -34,6 +44,27 @@ class SignUpViewTest(TestCase):
         user = User.objects.get(username=self.username)
         self.assertTrue(check_password_hash(user.password, self.password))
 
+    def test_signup_writes_user_once(self):
+        data = {
+            "username": self.username,
+            "password": self.password
+        }
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        writes = [query["sql"] for query in queries if query["sql"].startswith(("INSERT", "UPDATE"))]
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(writes[0].startswith('INSERT INTO "authorization_user"'))
+
+    def test_save_keeps_profile_fields(self):
+        user = User.objects.create(username=self.username, password=self.password)
+        user.rank_points = 1200
+        user.save()
+
+        self.assertEqual(User.objects.get(pk=user.pk).rank_points, 1200)
+
     def test_unsuccessful_post_request(self):
         data = {
             "username": self.username,
@@ -116,4 +147,158 @@ class LoginViewTest(TestCase):
         self.assertEqual(response.data['errors'], 'Invalid data')
 
 
+class TokenServiceTest(TestCase):
+
+    def setUp(self):
+        token_service.clear()
+        self.user = User.objects.create(username="username", password="password123")
+        self.token = token_service.issue_token(self.user)
+
+    def test_verified_token_is_cached(self):
+        token_service.verify_token(self.token)
+
+        with mock.patch("jwt.decode") as decode:
+            self.assertEqual(token_service.verify_token(self.token)["user_id"], self.user.pk)
+
+        decode.assert_not_called()
+
+    def test_cached_token_never_outlives_exp(self):
+        token = jwt.encode({"user_id": self.user.pk, "iat": int(time.time()), "exp": int(time.time()) + 2,
+                            "jti": "short"}, settings.SECRET_KEY, algorithm="HS256")
+        token_service.verify_token(token)
+
+        with mock.patch("time.time", return_value=time.time() + 3), \
+                mock.patch("jwt.decode", side_effect=jwt.ExpiredSignatureError) as decode:
+            with self.assertRaises(jwt.ExpiredSignatureError):
+                token_service.verify_token(token)
+
+        decode.assert_called_once()
+
+    def test_cached_user_needs_no_query(self):
+        token_service.authenticate(self.token)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(token_service.authenticate(self.token), self.user)
+
+    def test_user_save_invalidates_cache(self):
+        token_service.get_user(self.user.pk)
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = "renamed"
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(token_service.get_user(self.user.pk).first_name, "renamed")
+
+    @override_settings(AUTHORIZATION_USER_CACHE_RECHECK=0)
+    def test_version_change_in_other_process_reloads_user(self):
+        token_service.get_user(self.user.pk)
+
+        with self.assertNumQueries(0):
+            token_service.get_user(self.user.pk)
+
+        get_redis().hincrby(settings.AUTHORIZATION_USER_VERSION_KEY, self.user.pk, 1)
+        with self.assertNumQueries(1):
+            token_service.get_user(self.user.pk)
+
+    async def test_async_authentication_uses_cache(self):
+        self.assertEqual(await token_service.aauthenticate(self.token), self.user)
+
+        with mock.patch.object(User.objects, "filter") as filter:
+            self.assertEqual(await token_service.aauthenticate(self.token), self.user)
+
+        filter.assert_not_called()
+        await aclose_async_redis()
+
+    def test_token_without_required_claims_is_refused(self):
+        token = jwt.encode({"user_id": self.user.pk, "username": self.user.username},
+                           settings.SECRET_KEY, algorithm="HS256")
+
+        with self.assertRaises(jwt.InvalidTokenError):
+            token_service.verify_token(token)
+
+
+class PasswordServiceTest(TestCase):
+
+    def test_profiles_use_their_own_method(self):
+        for profile in ("user", "room"):
+            password_hash = password_service.hash_password("password123", profile=profile)
+
+            self.assertFalse(password_service.needs_rehash(password_hash, profile=profile))
+            self.assertTrue(password_service.check_password(password_hash, "password123"))
+
+    def test_outdated_hash_is_upgraded_on_login(self):
+        user = User.objects.create(username="username", password="unused")
+        User.objects.filter(pk=user.pk).update(password=generate_password_hash("password123", "pbkdf2:sha256:1000"))
+
+        self.assertTrue(authenticate_user("username", "password123")["authenticated"])
+
+        password_hash = User.objects.get(pk=user.pk).password
+        self.assertFalse(password_service.needs_rehash(password_hash))
+        self.assertTrue(authenticate_user("username", "password123")["authenticated"])
+
+    @override_settings(AUTHORIZATION_PASSWORD_WORKERS=0)
+    def test_zero_workers_hash_inline(self):
+        password_service.shutdown()
+
+        with mock.patch.object(password_service, "ProcessPoolExecutor") as executor:
+            password_hash = password_service.hash_password("password123")
+
+        executor.assert_not_called()
+        self.assertTrue(check_password_hash(password_hash, "password123"))
+
+
+class TokenRevocationTest(TestCase):
+
+    def setUp(self):
+        token_service.clear()
+        self.user = User.objects.create(username="username", password="password123")
+        self.token = token_service.issue_token(self.user)
+
+    def test_logout_revokes_token(self):
+        token_service.verify_token(self.token)
+
+        response = self.client.post("/api/auth/logout/", headers={"Authorization": self.token})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with self.assertRaises(jwt.InvalidTokenError):
+            token_service.verify_token(self.token)
+
+    def test_revocation_from_other_process_is_seen_after_refresh(self):
+        other = token_service.issue_token(self.user)
+        token_service.verify_token(self.token)
+        jti = jwt.decode(other, options={"verify_signature": False})["jti"]
+        get_redis().zadd(settings.AUTHORIZATION_REVOKED_KEY, {jti: time.time() + 60})
+        get_redis().incr(f"{settings.AUTHORIZATION_REVOKED_KEY}:version")
+
+        with override_settings(AUTHORIZATION_REVOCATION_REFRESH=0):
+            with self.assertRaises(jwt.InvalidTokenError):
+                token_service.verify_token(other)
+
+    def test_check_of_not_revoked_token_needs_no_redis(self):
+        token_service.verify_token(self.token)
+
+        with mock.patch("authorization.revocation.get_redis") as redis, self.assertNumQueries(0):
+            token_service.verify_token(self.token)
+
+        redis.assert_not_called()
+
+    async def test_socket_handshake_builds_principal_from_claims(self):
+        scopes = []
+
+        async def application(scope, receive, send):
+            scopes.append(scope)
+
+        middleware = TokenAuthenticationMiddleware(application)
+        scope = {"type": "websocket", "headers": [(b"authorization", self.token.encode())]}
+
+        with mock.patch.object(token_service, "aget_user") as aget_user:
+            await middleware(scope, None, None)
+
+        aget_user.assert_not_called()
+        principal = scopes[0]["user"]
+        self.assertEqual((principal.pk, principal.username, principal.rank_points), (self.user.pk, "username", 1000))
+        self.assertEqual(await principal.aget_user(), self.user)
+        await aclose_async_redis()
 
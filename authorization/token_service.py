@@ -0,0 +1,255 @@
+"""
+JWT authentication shared by the REST views (game_rooms.decorators.jwt_required) and the
+WebSocket handshake (config.custom_middleware.TokenAuthenticationMiddleware).
+
+Two per-process caches keep the database and the signature check off the hot path:
+- verified tokens: an LRU keyed on the SHA-256 of the token. An entry lives at most
+  AUTHORIZATION_TOKEN_CACHE_TTL seconds and never past the `exp` claim of its token.
+- users: an LRU of User rows tagged with the user's version. Every save or delete of a user
+  increments its version in Redis (AUTHORIZATION_USER_VERSION_KEY) once the transaction
+  commits. A cached user is trusted for AUTHORIZATION_USER_CACHE_RECHECK seconds, then its
+  version is compared with Redis and the row is reloaded only if it changed.
+
+Cached users are shared between requests of the process and must be treated as read-only.
+
+Tokens carry `exp`, `iat` and `jti` claims besides the user's id, username and profile fields.
+A revoked `jti` (see authorization.revocation) is refused even while its verified token is cached.
+WebSocket handshakes need no user row at all: the middleware puts a `TokenUser` built from the
+claims into the scope, and the consumer loads the full user only if it asks for it.
+"""
+
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import jwt
+from django.conf import settings
+from game_rooms.redis_client import get_redis, get_async_redis
+from .models import User
+from .revocation import revoked_tokens
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used mapping with a maximum size.
+
+    Methods:
+    - get(key): Returns the value and marks it as recently used, or None.
+    - set(key, value): Stores the value, evicting the least recently used entry when full.
+    - pop(key): Removes the entry if present.
+    - clear(): Removes all entries.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def pop(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+tokens = LRUCache(settings.AUTHORIZATION_TOKEN_CACHE_SIZE)
+users = LRUCache(settings.AUTHORIZATION_USER_CACHE_SIZE)
+
+
+def clear():
+    """Empty the token and user caches and the revocation filter of this process."""
+    tokens.clear()
+    users.clear()
+    revoked_tokens.reset()
+
+
+def get_token_key(token):
+    return hashlib.sha256(token.encode()).digest()
+
+
+class TokenUser:
+    """
+    Authenticated principal built from the claims of a verified token, without a database query.
+
+    Methods:
+    - from_payload(payload): Builds the principal from a token payload.
+    - get_user(): Returns the full User (from the user cache or the database), or None.
+    - aget_user(): Async counterpart of `get_user`.
+    """
+
+    __slots__ = ("pk", "username", "rank_points", "image_number", "jti", "expires_at", "_user")
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, pk, username, rank_points, image_number, jti, expires_at):
+        self.pk = pk
+        self.username = username
+        self.rank_points = rank_points
+        self.image_number = image_number
+        self.jti = jti
+        self.expires_at = expires_at
+        self._user = None
+
+    @classmethod
+    def from_payload(cls, payload):
+        return cls(payload["user_id"], payload["username"], payload.get("rank_points"),
+                   payload.get("image_number"), payload["jti"], payload["exp"])
+
+    @property
+    def id(self):
+        return self.pk
+
+    def __str__(self):
+        return self.username
+
+    def get_user(self):
+        if self._user is None:
+            self._user = get_user(self.pk)
+        return self._user
+
+    async def aget_user(self):
+        if self._user is None:
+            self._user = await aget_user(self.pk)
+        return self._user
+
+
+def issue_token(user):
+    """Return a signed token for the user, valid for AUTHORIZATION_TOKEN_LIFETIME seconds."""
+    issued_at = int(time.time())
+    payload = {
+        "user_id": user.pk,
+        "username": user.username,
+        "rank_points": user.rank_points,
+        "image_number": user.image_number,
+        "iat": issued_at,
+        "exp": issued_at + settings.AUTHORIZATION_TOKEN_LIFETIME,
+        "jti": uuid.uuid4().hex,
+    }
+    return jwt.encode(payload=payload, key=settings.SECRET_KEY, algorithm='HS256')
+
+
+def decode_token(token):
+    """
+    Return the payload of a correctly signed, unexpired token, without checking revocation.
+
+    Raises jwt.ExpiredSignatureError or jwt.InvalidTokenError like jwt.decode.
+    """
+    if not isinstance(token, str) or not token:
+        raise jwt.InvalidTokenError("Token is missing.")
+
+    key = get_token_key(token)
+    now = time.time()
+    cached = tokens.get(key)
+    if cached is not None:
+        payload, expires_at = cached
+        if now < expires_at:
+            return payload
+        tokens.pop(key)
+
+    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'],
+                         options={"require": ["exp", "iat", "jti"]})
+    tokens.set(key, (payload, min(now + settings.AUTHORIZATION_TOKEN_CACHE_TTL, payload["exp"])))
+
+    return payload
+
+
+def verify_token(token):
+    """Return the payload of a valid, not revoked token. Raises like `decode_token`."""
+    payload = decode_token(token)
+    if revoked_tokens.is_revoked(payload["jti"]):
+        raise jwt.InvalidTokenError("Token has been revoked.")
+    return payload
+
+
+async def averify_token(token):
+    """Async counterpart of `verify_token`."""
+    payload = decode_token(token)
+    if await revoked_tokens.ais_revoked(payload["jti"]):
+        raise jwt.InvalidTokenError("Token has been revoked.")
+    return payload
+
+
+def revoke_token(payload):
+    """Refuse the token of this payload from now until it expires."""
+    revoked_tokens.revoke(payload["jti"], payload["exp"])
+
+
+def get_cached_user(user_id):
+    """Return (user, version, checked_at) of a cached user, or None."""
+    return users.get(user_id)
+
+
+def is_fresh(cached):
+    return time.monotonic() - cached[2] < settings.AUTHORIZATION_USER_CACHE_RECHECK
+
+
+def parse_version(version):
+    return int(version or 0)
+
+
+def get_user(user_id):
+    """Return the user with this pk, from the cache when it is still current, or None if it does not exist."""
+    cached = get_cached_user(user_id)
+    if cached is not None and is_fresh(cached):
+        return cached[0]
+
+    version = parse_version(get_redis().hget(settings.AUTHORIZATION_USER_VERSION_KEY, user_id))
+    if cached is not None and cached[1] == version:
+        users.set(user_id, (cached[0], version, time.monotonic()))
+        return cached[0]
+
+    user = User.objects.filter(pk=user_id).first()
+    if user is not None:
+        users.set(user_id, (user, version, time.monotonic()))
+    return user
+
+
+async def aget_user(user_id):
+    """Async counterpart of `get_user`; a cache hit does not leave the event loop."""
+    cached = get_cached_user(user_id)
+    if cached is not None and is_fresh(cached):
+        return cached[0]
+
+    version = parse_version(await get_async_redis().hget(settings.AUTHORIZATION_USER_VERSION_KEY, user_id))
+    if cached is not None and cached[1] == version:
+        users.set(user_id, (cached[0], version, time.monotonic()))
+        return cached[0]
+
+    user = await User.objects.filter(pk=user_id).afirst()
+    if user is not None:
+        users.set(user_id, (user, version, time.monotonic()))
+    return user
+
+
+def authenticate(token):
+    """Return the user of a valid token, or None if the user does not exist. Raises like `verify_token`."""
+    return get_user(verify_token(token)["user_id"])
+
+
+async def aauthenticate(token):
+    """Async counterpart of `authenticate`."""
+    return await aget_user((await averify_token(token))["user_id"])
+
+
+def invalidate_user(user_id):
+    """Drop the user from every process' cache. Called once a save or delete of the user commits."""
+    users.pop(user_id)
+    get_redis().hincrby(settings.AUTHORIZATION_USER_VERSION_KEY, user_id, 1)
@@ -1,7 +1,8 @@
 from django.urls import path
-from .views import SignUpView, LoginView
+from .views import SignUpView, LoginView, LogoutView
 
 urlpatterns = [
     path('signup/', SignUpView.as_view()),
     path('login/', LoginView.as_view()),
+    path('logout/', LogoutView.as_view()),
 ]
\ No newline at end of file
@@ -2,10 +2,9 @@ from django.shortcuts import render
 from rest_framework.views import APIView, Response
 from rest_framework import status
 from .serializers import UserSerializer
-from werkzeug.security import generate_password_hash
 import jwt
-from django.conf import settings
 from .login_service import authenticate_user
+from .token_service import issue_token, verify_token, revoke_token
 
 
 class SignUpView(APIView):
@@ -15,7 +14,7 @@ class SignUpView(APIView):
     Methods:
     - get(request): Handles GET requests and returns a 405 Method Not Allowed error.
     - post(request): Handles POST requests for user registration. Validates input data using UserSerializer,
-      hashes the password, creates a new User instance, and returns a success message along with a JWT token
+      creates a new User instance with the hashed password in a single INSERT, and returns a success message along with a JWT token
       for the newly created user. If validation fails, returns a 400 Bad Request with validation errors.
     """
 
@@ -26,17 +25,9 @@ class SignUpView(APIView):
         serializer = UserSerializer(data=request.data)
 
         if serializer.is_valid():
-            hashed_password = generate_password_hash(request.data["password"])
-
             user = serializer.save()
-            user.password = hashed_password
-            user.save()
 
-            payload = {
-                "user_id": user.pk,
-                "username": user.username
-            }
-            token = jwt.encode(payload=payload, key=settings.SECRET_KEY, algorithm='HS256')
+            token = issue_token(user)
 
             return Response(data={"message": f"{user.username} was created.", "token": token}, status=status.HTTP_201_CREATED)
 
@@ -70,14 +61,34 @@ class LoginView(APIView):
             if user_data["authenticated"]:
 
                 user = user_data["user"]
-                payload = {
-                    "user_id": user.pk,
-                    "username": user.username
-                }
-                token = jwt.encode(payload=payload, key=settings.SECRET_KEY, algorithm='HS256')
+                token = issue_token(user)
                 return Response(data={"message": user_data["message"], "token": token}, status=status.HTTP_200_OK)
 
             else:
                 return Response(data={"message": user_data["message"]}, status=status.HTTP_401_UNAUTHORIZED)
         except KeyError:
             return Response(data={"errors": "Invalid data"}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class LogoutView(APIView):
+    """
+    API view revoking the JWT token of the request.
+
+    Methods:
+    - post(request): Handles POST requests with the token in the `Authorization` header.
+    - If the token is valid, revokes it until it expires and returns a 200 OK response; it is then refused
+      by REST views and WebSocket handshakes.
+    - If the token is expired or invalid, returns a 401 Unauthorized response with an error message.
+    """
+
+    def post(self, request):
+        try:
+            payload = verify_token(request.headers.get("Authorization"))
+        except jwt.ExpiredSignatureError:
+            return Response(data={"errors": "Token has expired."}, status=status.HTTP_401_UNAUTHORIZED)
+        except jwt.InvalidTokenError:
+            return Response(data={"errors": "Invalid token."}, status=status.HTTP_401_UNAUTHORIZED)
+
+        revoke_token(payload)
+        return Response(data={"message": "Logged out."}, status=status.HTTP_200_OK)
+
@@ -0,0 +1,48 @@
+"""
+Load tests and benchmarks.
+
+Every module is runnable from the project root, e.g. `python -m benchmarks.lobby_sockets`.
+They use the database, Redis and channel layer configured in `config.settings`; data is
+seeded into a throwaway test database that is dropped when the run ends.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+
+def setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    """Create a fresh test database for the duration of a benchmark."""
+    from django.db import connection
+
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+@contextmanager
+def timer(results, name):
+    """Add the wall-clock seconds spent in the block to `results[name]`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        results[name] = results.get(name, 0) + time.perf_counter() - start
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
@@ -0,0 +1,113 @@
+"""
+Authentication overhead per REST request and per WebSocket handshake.
+
+Compares the old path (jwt.decode + User.objects.get on every call, through
+database_sync_to_async for sockets) with authorization.token_service, for --users distinct
+users whose tokens are verified --calls times in total. Also reports the cost of a whole
+TokenAuthenticationMiddleware handshake in front of a no-op application.
+
+    python -m benchmarks.auth_overhead --users 100 --calls 20000
+"""
+
+import argparse
+import asyncio
+import time
+from . import setup_django, test_database
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--calls", type=int, default=20000)
+    return parser.parse_args()
+
+
+def create_tokens(count):
+    from authorization.models import User
+    from authorization.token_service import issue_token
+
+    users = User.objects.bulk_create(
+        [User(username=f"bench_{number}", password="bench") for number in range(count)]
+    )
+    return [issue_token(user) for user in users]
+
+
+def legacy_authenticate(token):
+    import jwt
+    from django.conf import settings
+    from authorization.models import User
+
+    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
+    return User.objects.get(pk=payload["user_id"])
+
+
+def measure(authenticate, tokens, calls):
+    start = time.perf_counter()
+    for number in range(calls):
+        authenticate(tokens[number % len(tokens)])
+    return (time.perf_counter() - start) / calls
+
+
+async def ameasure(authenticate, tokens, calls):
+    start = time.perf_counter()
+    for number in range(calls):
+        await authenticate(tokens[number % len(tokens)])
+    return (time.perf_counter() - start) / calls
+
+
+async def handshake(middleware, token):
+    scope = {"type": "websocket", "path": "/ws/room/", "headers": [(b"authorization", token.encode())]}
+
+    async def receive():
+        return {"type": "websocket.connect"}
+
+    async def send(message):
+        pass
+
+    await middleware(scope, receive, send)
+
+
+async def run_async(tokens, calls):
+    from asgiref.sync import sync_to_async
+    from channels.db import database_sync_to_async
+    from django.db import connections
+    from config.custom_middleware import TokenAuthenticationMiddleware
+    from game_rooms.redis_client import aclose_async_redis
+    from authorization import token_service
+
+    async def application(scope, receive, send):
+        pass
+
+    middleware = TokenAuthenticationMiddleware(application)
+    results = {
+        "socket legacy": await ameasure(database_sync_to_async(legacy_authenticate), tokens, calls),
+        "socket cached": await ameasure(token_service.aauthenticate, tokens, calls),
+        "handshake cached": await ameasure(lambda token: handshake(middleware, token), tokens, calls),
+    }
+    await sync_to_async(connections.close_all)()
+    await aclose_async_redis()
+    return results
+
+
+def main():
+    args = parse_args()
+    setup_django()
+
+    from authorization import token_service
+
+    with test_database():
+        tokens = create_tokens(args.users)
+        results = {
+            "rest legacy": measure(legacy_authenticate, tokens, args.calls),
+            "rest cached": measure(token_service.authenticate, tokens, args.calls),
+        }
+        token_service.clear()
+        results.update(asyncio.run(run_async(tokens, args.calls)))
+
+    print(f"{'path':>18} {'us/call':>10}")
+    for name, seconds in results.items():
+        print(f"{name:>18} {seconds * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Evaluating every candidate bid of a table: NumPy tables (game.probability) vs a naive loop.
+
+For tables of 2 to 6 players with 5 dice each, reports the microseconds needed to compute
+the probability of every bid following the opening one, as seen by a player, and the time
+of a whole bot decision. The naive version sums the binomial terms in Python for every bid.
+Needs no database.
+
+    python -m benchmarks.bid_probability --repeat 2000
+"""
+
+import argparse
+import math
+import random
+import time
+from . import setup_django
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=2000)
+    return parser.parse_args()
+
+
+def naive_bid_probabilities(state, player):
+    from game import engine
+
+    unknown = state.total_dice() - state.dice[player]
+    results = []
+    for quantity in range(1, state.total_dice() + 1):
+        for face in range(1, engine.FACES + 1):
+            bid = engine.encode_bid(quantity, face)
+            if bid <= state.bid:
+                continue
+            p = (2 if state.wild_ones and face != 1 else 1) / engine.FACES
+            needed = quantity - engine.count_matching(state.hands[player], face, state.wild_ones)
+            results.append((bid, sum(math.comb(unknown, k) * p ** k * (1 - p) ** (unknown - k)
+                                     for k in range(max(needed, 0), unknown + 1))))
+    return results
+
+
+def microseconds(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    args = parse_args()
+    setup_django()
+
+    from game import engine, bots
+    from game.probability import bid_probabilities
+
+    rng = random.Random(1)
+    print(f"{'players':>8} {'bids':>5} {'naive us':>9} {'numpy us':>9} {'speed-up':>9} {'bot move us':>12}")
+    for players in range(2, 7):
+        state = engine.place_bid(engine.new_game(players, rng), 0, engine.encode_bid(1, 2))
+        player = state.turn
+        bids = len(bid_probabilities(state, player)[0])
+
+        naive = microseconds(lambda: naive_bid_probabilities(state, player), args.repeat)
+        vectorized = microseconds(lambda: bid_probabilities(state, player), args.repeat)
+        bot = microseconds(lambda: bots.choose_move(state, player, rng), args.repeat)
+        print(f"{players:>8} {bids:>5} {naive:>9.1f} {vectorized:>9.1f} {naive / vectorized:>8.1f}x {bot:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+CPU time of one lobby broadcast against the number of subscribed sockets.
+
+Opens lobby WebSockets in steps against a single in-process ASGI application and measures the
+CPU time (time.process_time) from sending one lobby message to its arrival on every socket:
+- "forwarded": the message is encoded once by the sender and every consumer forwards the
+  frame as is (game_rooms.lobby and game_rooms.wire),
+- "re-encoded": the message travels as a dict and every consumer runs json.dumps on it, as
+  the lobby consumers did before.
+
+The message is a batch of --rooms room deltas, the usual shape of an outbox flush.
+
+    python -m benchmarks.broadcast_cpu --steps 100,500,1000,2000 --rooms 10
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from . import setup_django, test_database
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", default="100,500,1000,2000")
+    parser.add_argument("--rooms", type=int, default=10, help="room deltas in the broadcast batch")
+    parser.add_argument("--repeat", type=int, default=5, help="broadcasts measured per step and mode")
+    return parser.parse_args()
+
+
+def get_consumer_class():
+    from game_rooms.consumers import AsyncRoomConsumer
+
+    class ReencodingConsumer(AsyncRoomConsumer):
+        async def chat_message(self, event):
+            if "frames" in event:
+                return await super().chat_message(event)
+            await self.send(text_data=json.dumps({"message": event["message"]}))
+
+    return ReencodingConsumer
+
+
+def build_batch(rooms, first_version=1):
+    deltas = [
+        {"message": f"Room room {number} updated.", "type": "update", "version": first_version + number, "data": {
+            "name": f"room {number}", "max_players": 6, "id_code": f"A{number % 10}B0C0", "is_started": False,
+            "is_private": False, "players_list": ["author", "player_1", "player_2"], "author": 1,
+        }}
+        for number in range(rooms)
+    ]
+    return {"message": f"{rooms} rooms changed.", "type": "batch", "version": first_version + rooms - 1, "data": deltas}
+
+
+async def broadcast_cpu_seconds(sockets, build_message):
+    """CPU seconds to build a group message (including its encoding by the sender) and deliver it to every socket."""
+    from channels.layers import get_channel_layer
+    from django.conf import settings
+
+    start = time.process_time()
+    await get_channel_layer().group_send(settings.GAME_ROOMS_CHANNEL_GROUP_NAME, build_message())
+    await asyncio.gather(*(socket.receive_from(timeout=60) for socket in sockets))
+    return time.process_time() - start
+
+
+async def open_socket(application):
+    from channels.testing import WebsocketCommunicator
+
+    communicator = WebsocketCommunicator(application, "/ws/room/")
+    connected, _ = await communicator.connect(timeout=60)
+    if not connected:
+        raise RuntimeError("Lobby socket was rejected")
+    await communicator.receive_from(timeout=60)
+    return communicator
+
+
+async def run(steps, rooms, repeat):
+    from asgiref.sync import sync_to_async
+    from game_rooms.lobby import get_lobby_message, get_lobby_version
+
+    application = get_consumer_class().as_asgi()
+    batch = build_batch(rooms)
+    # Forwarded batches continue the versions of the snapshot, as the sockets skip older ones.
+    versions = iter(range(await sync_to_async(get_lobby_version)() + 1, 1 << 30, rooms))
+    sockets = []
+
+    print(f"{'sockets':>8} {'re-encoded ms':>14} {'forwarded ms':>13} {'saved us/socket':>16}")
+    for target in steps:
+        sockets.extend(await asyncio.gather(*(open_socket(application) for _ in range(target - len(sockets)))))
+
+        reencoded = forwarded = 0.0
+        for _ in range(repeat):
+            reencoded += await broadcast_cpu_seconds(sockets, lambda: {"type": "chat.message", "message": batch})
+            forwarded += await broadcast_cpu_seconds(
+                sockets, lambda: get_lobby_message(build_batch(rooms, next(versions)), "all")
+            )
+
+        reencoded, forwarded = reencoded / repeat, forwarded / repeat
+        print(f"{len(sockets):>8} {reencoded * 1000:>14.1f} {forwarded * 1000:>13.1f} "
+              f"{(reencoded - forwarded) / len(sockets) * 1e6:>16.1f}")
+
+    await asyncio.gather(*(socket.disconnect() for socket in sockets))
+    await close_connections()
+
+
+async def close_connections():
+    from asgiref.sync import sync_to_async
+    from channels.layers import get_channel_layer
+    from django.db import connections
+    from game_rooms.redis_client import aclose_async_redis
+
+    await sync_to_async(connections.close_all)()
+    await aclose_async_redis()
+    await get_channel_layer().close_pools()
+
+
+def main():
+    args = parse_args()
+    setup_django()
+
+    from game_rooms import lobby_cache
+
+    with test_database():
+        lobby_cache.clear()
+        asyncio.run(run([int(step) for step in args.steps.split(",")], args.rooms, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Throughput and footprint of the Liar's Dice engine (game.engine).
+
+Reports bid validations per second, bids placed and rounds resolved per second, and the
+memory held by --tables concurrent 6-player tables. Needs no database.
+
+    python -m benchmarks.game_engine --validations 5000000 --tables 10000
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+from . import setup_django
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--validations", type=int, default=5000000)
+    parser.add_argument("--rounds", type=int, default=100000)
+    parser.add_argument("--tables", type=int, default=10000)
+    return parser.parse_args()
+
+
+def measure_validations(count):
+    from game.engine import is_valid_bid, encode_bid
+
+    bids = [encode_bid(quantity, face) for quantity in range(1, 31) for face in range(1, 8)]
+    current = encode_bid(7, 3)
+    calls = (count // len(bids)) * len(bids)
+
+    start = time.perf_counter()
+    for _ in range(count // len(bids)):
+        for bid in bids:
+            is_valid_bid(bid, current, 30)
+    return calls / (time.perf_counter() - start)
+
+
+def measure_rounds(count, rng):
+    from game import engine
+
+    state = engine.new_game(6, rng)
+    bids = 0
+    start = time.perf_counter()
+    for _ in range(count):
+        for quantity in range(1, min(3, state.total_dice()) + 1):
+            state = engine.place_bid(state, state.turn, engine.encode_bid(quantity, rng.randint(1, 6)))
+            bids += 1
+        state = engine.resolve_round(state, engine.challenge(state, state.turn), rng)
+        if engine.winner(state) is not None:
+            state = engine.new_game(6, rng)
+    elapsed = time.perf_counter() - start
+    return bids / elapsed, count / elapsed
+
+
+def measure_tables(count, rng):
+    from game import engine
+
+    tracemalloc.start()
+    tables = [engine.new_game(6, rng) for _ in range(count)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size / len(tables)
+
+
+def main():
+    args = parse_args()
+    setup_django()
+    rng = random.Random(1)
+
+    validations = measure_validations(args.validations)
+    bids, rounds = measure_rounds(args.rounds, rng)
+    table_bytes = measure_tables(args.tables, rng)
+
+    print(f"bid validations/s:  {validations:>12,.0f}")
+    print(f"bids placed/s:      {bids:>12,.0f}")
+    print(f"rounds resolved/s:  {rounds:>12,.0f}")
+    print(f"bytes per table:    {table_bytes:>12,.0f} ({args.tables} tables of 6 players)")
+
+
+if __name__ == "__main__":
+    main()
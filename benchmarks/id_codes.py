@@ -0,0 +1,113 @@
+"""
+Room insert latency at 10%, 50% and 90% fill of the 'A1B2C3' code space.
+
+Compares the old allocator (random code + SELECT until an unused one is found) with the
+sequence + permutation allocator of `IdCodeField`. The table is filled with COPY up to
+every fill level; seeding 90% of the 17.6M codes takes a few minutes.
+
+    python -m benchmarks.id_codes --fills 0.1,0.5,0.9 --inserts 500
+"""
+
+import argparse
+import io
+import random
+import time
+from . import setup_django, test_database, percentile
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fills", default="0.1,0.5,0.9")
+    parser.add_argument("--inserts", type=int, default=500)
+    parser.add_argument("--copy-chunk", type=int, default=200000)
+    return parser.parse_args()
+
+
+def legacy_code(model):
+    """The allocator IdCodeField used before: random codes checked with a SELECT each."""
+    from game_rooms.fields import LETTERS, DIGITS
+
+    round_trips = 0
+    while True:
+        round_trips += 1
+        code = "".join(random.choice(LETTERS) + random.choice(DIGITS) for _ in range(3))
+        if not model.objects.filter(id_code=code).exists():
+            return code, round_trips
+
+
+def seed(connection, field, author_id, start, stop, chunk):
+    """COPY rooms with the codes of sequence values start..stop-1, as the allocator would hand them out."""
+    from game_rooms.fields import encode_code, permute, get_round_keys
+
+    table = field.model._meta.db_table
+    round_keys = get_round_keys()
+    columns = ("name, id_code, max_players, player_count, is_private, password, author_id, is_started, "
+               "created_at, delete_at")
+
+    with connection.cursor() as cursor:
+        for chunk_start in range(start, stop, chunk):
+            buffer = io.StringIO()
+            for number in range(chunk_start, min(stop, chunk_start + chunk)):
+                code = encode_code(permute(number, round_keys))
+                buffer.write(f"seed\t{code}\t2\t0\tf\t\t{author_id}\tt\tnow\tnow\n")
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN", buffer)
+        cursor.execute("SELECT setval(%s, %s, false)", [field.get_sequence_name(), stop])
+
+
+def measure(create, inserts):
+    latencies = []
+    for _ in range(inserts):
+        start = time.perf_counter()
+        create()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    args = parse_args()
+    setup_django()
+
+    from django.db.models.signals import post_save
+    from authorization.models import User
+    from game_rooms.fields import CODE_SPACE
+    from game_rooms.models import RoomModel
+    from game_rooms.signals import send_new_room_created
+
+    post_save.disconnect(send_new_room_created, sender=RoomModel)
+    field = RoomModel._meta.get_field("id_code")
+
+    with test_database() as connection:
+        author = User.objects.create(username="bench_author", password="bench")
+        seeded = 0
+
+        print(f"{'fill':>5} {'allocator':>10} {'p50 ms':>8} {'p99 ms':>8} {'round trips':>12}")
+        for fill in [float(fill) for fill in args.fills.split(",")]:
+            target = int(CODE_SPACE * fill)
+            seed(connection, field, author.pk, seeded, target, args.copy_chunk)
+            seeded = target
+
+            round_trips = []
+
+            def create_legacy():
+                code, trips = legacy_code(RoomModel)
+                round_trips.append(trips)
+                RoomModel.objects.create(name="bench", max_players=2, author=author, id_code=code)
+
+            def create_sequence():
+                RoomModel.objects.create(name="bench", max_players=2, author=author)
+
+            for name, create in (("random", create_legacy), ("sequence", create_sequence)):
+                latencies = measure(create, args.inserts)
+                trips = f"{sum(round_trips) / len(round_trips):.2f}" if round_trips else "1.00"
+                print(f"{fill:>5.0%} {name:>10} {percentile(latencies, 0.5) * 1000:>8.2f} "
+                      f"{percentile(latencies, 0.99) * 1000:>8.2f} {trips:>12}")
+                round_trips.clear()
+
+            RoomModel.objects.filter(name="bench").delete()
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT setval(%s, %s, false)", [field.get_sequence_name(), seeded])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+EXPLAIN ANALYZE of the hot room queries on a large table, checking that they use their indexes.
+
+Seeds --rooms rooms (--open-fraction of them not started, the rest started as old rooms pile
+up), VACUUM ANALYZEs the tables and explains:
+- "lobby": every open room as loaded by the lobby cache,
+- "page": the first page of GET /api/room/,
+- "page free": a filtered page further down the lobby,
+- "by code": the room lookup of the REST views and signals,
+- "players": the players_list rows of a room,
+- "expired": the rooms a timed start would start.
+Every plan is checked against the scans it must use (index-only scans where the index covers
+the query); the run fails listing the plans that do not.
+
+    python -m benchmarks.lobby_indexes --rooms 1000000 --open-fraction 0.1
+"""
+
+import argparse
+import json
+import sys
+from . import setup_django, test_database
+from .seeding import create_players, seed_rooms
+
+INDEX_SCANS = ("Index Scan", "Index Only Scan", "Bitmap Index Scan", "Bitmap Heap Scan")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=1000000)
+    parser.add_argument("--open-fraction", type=float, default=0.1)
+    parser.add_argument("--players", type=int, default=3, help="players in every room")
+    return parser.parse_args()
+
+
+def get_scans(plan):
+    """Return [(node type, relation or index name), ...] of the scans in a JSON plan."""
+    scans = []
+    if plan["Node Type"].endswith("Scan"):
+        scans.append((plan["Node Type"], plan.get("Index Name") or plan.get("Relation Name")))
+    for child in plan.get("Plans", ()):
+        scans.extend(get_scans(child))
+    return scans
+
+
+def explain(queryset):
+    """Return (execution ms, scans) of EXPLAIN (ANALYZE, BUFFERS) of the queryset."""
+    result = json.loads(queryset.explain(format="json", analyze=True, buffers=True))[0]
+    return result["Execution Time"], get_scans(result["Plan"])
+
+
+def get_queries(middle):
+    from django.utils import timezone
+    from game_rooms.listing import get_list_queryset, encode_cursor
+    from game_rooms.models import RoomModel
+    from game_rooms.serializers import get_summary_rows
+
+    through = RoomModel.players_list.through
+    cursor = encode_cursor(middle.created_at, middle.pk)
+    return {
+        "lobby": (get_summary_rows(RoomModel.objects.open()), ("Index Only Scan",)),
+        "page": (get_summary_rows(get_list_queryset({})[:51]), ("Index Only Scan",)),
+        "page free": (
+            get_summary_rows(get_list_queryset({"free": "true", "is_private": "false", "cursor": cursor})[:51]),
+            ("Index Only Scan",),
+        ),
+        "by code": (RoomModel.objects.filter(id_code=middle.id_code), INDEX_SCANS),
+        "players": (through.objects.filter(roommodel_id=middle.pk).values_list("user_id"), ("Index Only Scan",)),
+        "expired": (RoomModel.objects.filter(is_started=False, delete_at__lte=timezone.now()).values("id"),
+                    INDEX_SCANS),
+    }
+
+
+def main():
+    args = parse_args()
+    setup_django()
+
+    from game_rooms.models import RoomModel
+
+    with test_database() as connection:
+        players = create_players(args.players)
+        started = args.rooms - int(args.rooms * args.open_fraction)
+        seed_rooms(connection, started, players, is_started=True)
+        seed_rooms(connection, args.rooms - started, players, start=started)
+        with connection.cursor() as cursor:
+            cursor.execute(f"VACUUM ANALYZE {RoomModel._meta.db_table}")
+            cursor.execute(f"VACUUM ANALYZE {RoomModel.players_list.through._meta.db_table}")
+
+        open_rooms = RoomModel.objects.open()
+        middle = open_rooms[open_rooms.count() // 2]
+
+        failures = []
+        print(f"{args.rooms} rooms, {args.rooms - started} open")
+        print(f"{'query':>10} {'ms':>9}  scans")
+        for name, (queryset, expected) in get_queries(middle).items():
+            elapsed, scans = explain(queryset)
+            print(f"{name:>10} {elapsed:>9.2f}  " + ", ".join(f"{node} on {target}" for node, target in scans))
+            if not scans or any(node not in expected for node, _ in scans):
+                failures.append(name)
+
+    if failures:
+        sys.exit(f"Not using the expected index scans: {', '.join(failures)}")
+
+
+if __name__ == "__main__":
+    main()
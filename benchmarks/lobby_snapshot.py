@@ -0,0 +1,75 @@
+"""
+Lobby snapshot time for 1k, 10k and 50k open rooms.
+
+Compares RoomSerializer without prefetching (one players query per room), RoomSerializer
+with prefetch_related, the values()-based room summaries the lobby uses, and the encoded
+snapshot served from a warm lobby cache.
+
+    python -m benchmarks.lobby_snapshot --rooms 1000,10000,50000 --players 3
+"""
+
+import argparse
+import gc
+import time
+from . import setup_django, test_database
+from .seeding import create_players, seed_rooms
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", default="1000,10000,50000")
+    parser.add_argument("--players", type=int, default=3, help="players in every room")
+    parser.add_argument("--naive-limit", type=int, default=10000,
+                        help="skip the unprefetched serializer above this many rooms")
+    return parser.parse_args()
+
+
+def measure(connection, build):
+    from django.test.utils import CaptureQueriesContext
+
+    gc.collect()
+    connection.queries_log.clear()
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        build()
+        elapsed = time.perf_counter() - start
+    return elapsed, len(queries)
+
+
+def main():
+    args = parse_args()
+    setup_django()
+
+    from game_rooms import lobby_cache
+    from game_rooms.lobby import get_open_rooms
+    from game_rooms.models import RoomModel
+    from game_rooms.serializers import RoomSerializer
+
+    variants = {
+        "serializer": lambda: RoomSerializer(instance=RoomModel.objects.open(), many=True).data,
+        "prefetch": lambda: RoomSerializer(
+            instance=RoomModel.objects.open().prefetch_related("players_list"), many=True
+        ).data,
+        "summaries": get_open_rooms,
+        "cached": lobby_cache.get_snapshot_text,
+    }
+
+    with test_database() as connection:
+        players = create_players(args.players)
+        seeded = 0
+
+        print(f"{'rooms':>7} {'variant':>11} {'ms':>10} {'queries':>8}")
+        for rooms in [int(rooms) for rooms in args.rooms.split(",")]:
+            seeded += seed_rooms(connection, rooms - seeded, players, start=seeded)
+            lobby_cache.clear()
+            lobby_cache.get_snapshot_text()
+
+            for name, build in variants.items():
+                if name == "serializer" and rooms > args.naive_limit:
+                    continue
+                elapsed, queries = measure(connection, build)
+                print(f"{rooms:>7} {name:>11} {elapsed * 1000:>10.1f} {queries:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+How many concurrent lobby sockets can one worker hold?
+
+Opens lobby WebSockets in steps against a single in-process ASGI application (one event
+loop, i.e. one Daphne worker) and reports per-connect latency, memory per socket and the
+time it takes one lobby delta to reach every socket. The run stops at the first step
+whose p99 connect latency exceeds --max-latency.
+
+    python -m benchmarks.lobby_sockets --consumer async --steps 250,500,1000,2000,4000
+    python -m benchmarks.lobby_sockets --consumer sync --steps 250,500,1000,2000,4000
+"""
+
+import argparse
+import asyncio
+import resource
+import time
+from . import setup_django, test_database, percentile
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--consumer", choices=["async", "sync"], default="async")
+    parser.add_argument("--steps", default="250,500,1000,2000,4000")
+    parser.add_argument("--rooms", type=int, default=50, help="open rooms in every snapshot")
+    parser.add_argument("--concurrency", type=int, default=20, help="sockets connecting at the same time")
+    parser.add_argument("--max-latency", type=float, default=1.0, help="p99 connect latency limit, seconds")
+    return parser.parse_args()
+
+
+def seed_rooms(count):
+    from authorization.models import User
+    from game_rooms.models import RoomModel
+
+    author = User.objects.create(username="bench_author", password="bench")
+    for number in range(count):
+        RoomModel.objects.create(name=f"room {number}", max_players=6, author=author)
+
+
+async def open_socket(application, latencies, semaphore):
+    from channels.testing import WebsocketCommunicator
+
+    communicator = WebsocketCommunicator(application, "/ws/room/")
+    async with semaphore:
+        start = time.perf_counter()
+        connected, _ = await communicator.connect(timeout=60)
+        if not connected:
+            raise RuntimeError("Lobby socket was rejected")
+        await communicator.receive_from(timeout=60)
+        latencies.append(time.perf_counter() - start)
+    return communicator
+
+
+async def fan_out_seconds(sockets):
+    from game_rooms.lobby import send_lobby_event
+    from asgiref.sync import sync_to_async
+
+    start = time.perf_counter()
+    summary = {"id_code": "B0B0B0", "name": "benchmark", "max_players": 6, "is_started": False,
+               "is_private": False, "players_list": [], "author": None}
+    await sync_to_async(send_lobby_event)("update", "benchmark", summary)
+    await asyncio.gather(*(socket.receive_from(timeout=60) for socket in sockets))
+    return time.perf_counter() - start
+
+
+async def run(consumer_class, steps, concurrency, max_latency):
+    application = consumer_class.as_asgi()
+    semaphore = asyncio.Semaphore(concurrency)
+    sockets = []
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print(f"{'sockets':>8} {'p50 ms':>8} {'p99 ms':>8} {'KiB/socket':>11} {'fan-out ms':>11}")
+    for target in steps:
+        latencies = []
+        new_sockets = await asyncio.gather(
+            *(open_socket(application, latencies, semaphore) for _ in range(target - len(sockets)))
+        )
+        sockets.extend(new_sockets)
+
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        fan_out = await fan_out_seconds(sockets)
+        p99 = percentile(latencies, 0.99)
+        print(f"{len(sockets):>8} {percentile(latencies, 0.5) * 1000:>8.1f} {p99 * 1000:>8.1f} "
+              f"{(rss - base_rss) / len(sockets):>11.1f} {fan_out * 1000:>11.1f}")
+
+        if p99 > max_latency:
+            print(f"p99 connect latency above {max_latency}s, stopping.")
+            break
+
+    await asyncio.gather(*(socket.disconnect() for socket in sockets))
+    print(f"Held {len(sockets)} concurrent lobby sockets.")
+
+    await close_connections()
+
+
+async def close_connections():
+    from asgiref.sync import sync_to_async
+    from channels.layers import get_channel_layer
+    from django.db import connections
+    from game_rooms.redis_client import aclose_async_redis
+
+    await sync_to_async(connections.close_all)()
+    await aclose_async_redis()
+    await get_channel_layer().close_pools()
+
+
+def main():
+    args = parse_args()
+    setup_django()
+
+    from game_rooms.consumers import AsyncRoomConsumer, RoomConsumer
+
+    consumer_class = AsyncRoomConsumer if args.consumer == "async" else RoomConsumer
+    steps = [int(step) for step in args.steps.split(",")]
+
+    from game_rooms import lobby_cache
+
+    with test_database():
+        seed_rooms(args.rooms)
+        lobby_cache.clear()
+        asyncio.run(run(consumer_class, steps, args.concurrency, args.max_latency))
+
+
+if __name__ == "__main__":
+    main()
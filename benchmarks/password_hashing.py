@@ -0,0 +1,78 @@
+"""
+Logins per second, and per core, with inline hashing and with the password process pool.
+
+Runs --logins calls of `authenticate_user` from --threads concurrent request threads, once
+with AUTHORIZATION_PASSWORD_WORKERS=0 (hashing on the request thread) and once per pool size
+in --workers. "per core" divides the logins by the CPU seconds used by this process and the
+pool processes together.
+
+    python -m benchmarks.password_hashing --logins 200 --threads 8 --workers 1,2,4
+"""
+
+import argparse
+import resource
+import time
+from concurrent.futures import ThreadPoolExecutor
+from . import setup_django, test_database
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--users", type=int, default=20)
+    return parser.parse_args()
+
+
+def cpu_seconds():
+    usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    return sum(item.ru_utime + item.ru_stime for item in usage)
+
+
+def run(logins, threads, usernames):
+    from django.db import connections
+    from authorization.login_service import authenticate_user
+    from authorization import password_service
+
+    def login(number):
+        try:
+            if not authenticate_user(usernames[number % len(usernames)], "password123")["authenticated"]:
+                raise RuntimeError("Login failed")
+        finally:
+            connections.close_all()
+
+    password_service.get_executor()
+    cpu = cpu_seconds()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(login, range(logins)))
+    elapsed = time.perf_counter() - start
+
+    # Pool processes count in RUSAGE_CHILDREN only once they have exited.
+    password_service.shutdown()
+    return logins / elapsed, logins / (cpu_seconds() - cpu)
+
+
+def main():
+    args = parse_args()
+    setup_django()
+
+    from django.conf import settings
+    from authorization.models import User
+    from authorization.password_service import hash_password
+
+    with test_database():
+        password_hash = hash_password("password123")
+        usernames = [f"bench_{number}" for number in range(args.users)]
+        User.objects.bulk_create([User(username=username, password=password_hash) for username in usernames])
+
+        print(f"{'workers':>8} {'logins/s':>10} {'logins/s/core':>14}")
+        for workers in [0] + [int(workers) for workers in args.workers.split(",")]:
+            settings.AUTHORIZATION_PASSWORD_WORKERS = workers
+            per_second, per_core = run(args.logins, args.threads, usernames)
+            print(f"{workers or 'inline':>8} {per_second:>10.1f} {per_core:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
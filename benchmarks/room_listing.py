@@ -0,0 +1,88 @@
+"""
+Lobby listing queries with the denormalized player columns against the players_list join.
+
+Seeds --rooms open rooms and times, per call:
+- "page": the first page of GET /api/room/ (game_rooms.listing), read from the room table alone,
+- "page join": the same page with its players loaded through the players_list join,
+  the way summaries were built before `RoomModel.player_names`,
+- "lobby": every open room, as loaded by the lobby cache (game_rooms.serializers),
+- "lobby join": every open room with the players loaded through the join.
+
+    python -m benchmarks.room_listing --rooms 100000 --players 3 --repeat 20
+"""
+
+import argparse
+import gc
+import time
+from . import setup_django, test_database
+from .seeding import create_players, seed_rooms
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=100000)
+    parser.add_argument("--players", type=int, default=3, help="players in every room")
+    parser.add_argument("--repeat", type=int, default=20, help="calls per page variant")
+    parser.add_argument("--lobby-repeat", type=int, default=3, help="calls per whole-lobby variant")
+    return parser.parse_args()
+
+
+def load_with_join(queryset):
+    """Summaries with the players read through the join, as two queries."""
+    from game_rooms.models import RoomModel
+
+    rows = list(queryset.values("id", "name", "max_players", "id_code", "is_started", "is_private", "author_id"))
+    players = (
+        RoomModel.players_list.through.objects
+        .filter(roommodel__in=[row["id"] for row in rows])
+        .order_by("id")
+        .values_list("roommodel_id", "user__username")
+    )
+    usernames = {}
+    for room_id, username in players:
+        usernames.setdefault(room_id, []).append(username)
+    return [{**row, "players_list": usernames.get(row["id"], [])} for row in rows]
+
+
+def measure(connection, build, repeat):
+    from django.test.utils import CaptureQueriesContext
+
+    gc.collect()
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            build()
+        elapsed = (time.perf_counter() - start) / repeat
+    return elapsed, len(queries) // repeat
+
+
+def main():
+    args = parse_args()
+    setup_django()
+
+    from django.conf import settings
+    from game_rooms.listing import get_room_page
+    from game_rooms.models import RoomModel
+    from game_rooms.serializers import serialize_room_summaries
+
+    page_size = settings.GAME_ROOMS_LIST_PAGE_SIZE
+    variants = {
+        "page": (lambda: get_room_page({}), args.repeat),
+        "page join": (lambda: load_with_join(RoomModel.objects.open()[:page_size + 1]), args.repeat),
+        "lobby": (lambda: serialize_room_summaries(RoomModel.objects.open()), args.lobby_repeat),
+        "lobby join": (lambda: load_with_join(RoomModel.objects.open()), args.lobby_repeat),
+    }
+
+    with test_database() as connection:
+        players = create_players(args.players)
+        seed_rooms(connection, args.rooms, players)
+
+        print(f"{args.rooms} rooms, {args.players} players each")
+        print(f"{'variant':>11} {'ms':>10} {'queries':>8}")
+        for name, (build, repeat) in variants.items():
+            elapsed, queries = measure(connection, build, repeat)
+            print(f"{name:>11} {elapsed * 1000:>10.2f} {queries:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+10k simultaneous pending room timers on one worker.
+
+Schedules --timers room starts with the same countdown, then runs a single embedded Celery
+worker with concurrency 1 and measures how long it takes to fire all of them. With the old
+`time.sleep` timer every pending room held the only worker slot for its whole countdown,
+so draining N timers took N * countdown seconds.
+
+    python -m benchmarks.room_timers --timers 10000 --countdown 5
+"""
+
+import argparse
+import time
+from . import setup_django, test_database
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--timers", type=int, default=10000)
+    parser.add_argument("--countdown", type=float, default=5.0)
+    parser.add_argument("--timeout", type=float, default=600.0)
+    return parser.parse_args()
+
+
+def pending_timers(redis, prefix):
+    return sum(1 for _ in redis.scan_iter(match=f"{prefix}*", count=1000))
+
+
+def main():
+    args = parse_args()
+    setup_django()
+
+    from celery.contrib.testing.worker import start_worker
+    from django.conf import settings
+    from config.celery import app
+    from game_rooms.redis_client import get_redis
+    from game_rooms.timers import schedule_room_start
+
+    redis = get_redis()
+    prefix = f"{settings.GAME_ROOMS_TIMER_KEY_PREFIX}BENCH"
+
+    with test_database():
+        start = time.perf_counter()
+        for number in range(args.timers):
+            schedule_room_start(f"BENCH{number}", delay=args.countdown)
+        scheduled = time.perf_counter() - start
+        print(f"scheduled {args.timers} timers in {scheduled:.2f}s "
+              f"({args.timers / scheduled:.0f} timers/s)")
+
+        with start_worker(app, concurrency=1, pool="solo", perform_ping_check=False):
+            peak = pending_timers(redis, prefix)
+            print(f"pending timers held by one worker: {peak}")
+
+            deadline = time.perf_counter() + args.timeout
+            while pending_timers(redis, prefix) and time.perf_counter() < deadline:
+                time.sleep(0.5)
+
+        drained = time.perf_counter() - start
+        left = pending_timers(redis, prefix)
+        print(f"fired {args.timers - left} timers {drained:.2f}s after the first was scheduled")
+        print(f"a sleeping timer would need {args.timers * args.countdown:.0f}s on one slot")
+
+
+if __name__ == "__main__":
+    main()
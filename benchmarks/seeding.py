@@ -0,0 +1,50 @@
+"""Bulk seeding of rooms with COPY for benchmarks that need large tables."""
+
+import io
+
+
+def create_players(count, prefix="bench_player"):
+    from authorization.models import User
+
+    return User.objects.bulk_create(
+        [User(username=f"{prefix}_{number}", password="bench") for number in range(count)]
+    )
+
+
+def seed_rooms(connection, count, players, start=0, is_started=False, chunk=100000):
+    """
+    COPY `count` rooms authored by players[0], each with all `players` in players_list.
+
+    Rooms get sequential codes starting at code number `start`. Returns the number of rooms seeded.
+    """
+    from game_rooms.fields import encode_code
+    from game_rooms.models import RoomModel
+
+    table = RoomModel._meta.db_table
+    through_table = RoomModel.players_list.through._meta.db_table
+    columns = ("name, id_code, max_players, player_count, player_names, is_private, password, author_id, "
+               "is_started, created_at, delete_at")
+    started = "t" if is_started else "f"
+    max_players = max(6, len(players))
+    player_names = "{" + ",".join(player.username for player in players) + "}"
+
+    with connection.cursor() as cursor:
+        for chunk_start in range(start, start + count, chunk):
+            buffer = io.StringIO()
+            for number in range(chunk_start, min(start + count, chunk_start + chunk)):
+                buffer.write(f"room {number}\t{encode_code(number)}\t{max_players}\t{len(players)}\t"
+                             f"{player_names}\t{'t' if number % 4 == 0 else 'f'}\t\t"
+                             f"{players[0].pk}\t{started}\tnow\tnow\n")
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN", buffer)
+
+        cursor.execute(
+            f"INSERT INTO {through_table} (roommodel_id, user_id) "
+            f"SELECT room.id, player.id FROM {table} room CROSS JOIN unnest(%s::bigint[]) AS player(id) "
+            f"WHERE room.name LIKE 'room %%' ORDER BY room.id, player.id ON CONFLICT DO NOTHING",
+            [[player.pk for player in players]],
+        )
+        cursor.execute(f"ANALYZE {table}")
+        cursor.execute(f"ANALYZE {through_table}")
+
+    return count
@@ -0,0 +1,89 @@
+"""
+Size and encode time of a lobby snapshot in every wire format.
+
+Builds a snapshot of --rooms room summaries shaped like the lobby ones (see
+game_rooms.serializers) and reports its encoded size, and the microseconds needed to encode
+and decode it, as JSON (the `dices.json` format), orjson, MessagePack rows and MessagePack
+columns (the `dices.msgpack` format, see game_rooms.wire). orjson is skipped when it is not
+installed. Needs no database.
+
+    python -m benchmarks.wire_formats --rooms 1000 --repeat 200
+"""
+
+import argparse
+import json
+import random
+import time
+from . import setup_django
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    return parser.parse_args()
+
+
+def build_snapshot(count):
+    rng = random.Random(1)
+    rooms = []
+    for number in range(count):
+        players = rng.randint(1, 6)
+        rooms.append({
+            "name": f"room {number}",
+            "max_players": 6,
+            "id_code": f"A{number % 10}B{number // 10 % 10}C{number // 100 % 10}",
+            "is_started": False,
+            "is_private": rng.random() < 0.2,
+            "players_list": [f"player_{rng.randrange(100000)}" for _ in range(players)],
+            "author": rng.randrange(100000),
+        })
+    return {"message": {"type": "snapshot", "version": 12345, "data": rooms}}
+
+
+def get_codecs(snapshot):
+    import msgpack
+    from game_rooms import wire
+
+    columnar = {"message": {**snapshot["message"], "data": wire.get_columns(snapshot["message"]["data"])}}
+    codecs = {
+        "json": (lambda: json.dumps(snapshot), json.loads),
+        "msgpack rows": (lambda: msgpack.packb(snapshot, use_bin_type=True), msgpack.unpackb),
+        "msgpack columns": (lambda: msgpack.packb(columnar, use_bin_type=True), msgpack.unpackb),
+    }
+    try:
+        import orjson
+    except ImportError:
+        print("orjson is not installed, skipped.")
+    else:
+        codecs["orjson"] = (lambda: orjson.dumps(snapshot), orjson.loads)
+    return codecs
+
+
+def microseconds(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    args = parse_args()
+    setup_django()
+
+    snapshot = build_snapshot(args.rooms)
+    codecs = get_codecs(snapshot)
+    json_size = len(json.dumps(snapshot).encode())
+
+    print(f"{args.rooms} rooms")
+    print(f"{'format':>16} {'bytes':>9} {'vs json':>8} {'encode us':>10} {'decode us':>10}")
+    for name, (encode, decode) in codecs.items():
+        frame = encode()
+        size = len(frame.encode() if isinstance(frame, str) else frame)
+        encode_us = microseconds(encode, args.repeat)
+        decode_us = microseconds(lambda: decode(frame), args.repeat)
+        print(f"{name:>16} {size:>9} {size / json_size:>7.0%} {encode_us:>10.1f} {decode_us:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
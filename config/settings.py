@@ -43,6 +43,7 @@ INSTALLED_APPS = [
 
     "authorization",
     "game_rooms",
+    "game",
 
     'django.contrib.admin',
     'django.contrib.auth',
@@ -100,11 +101,21 @@ DATABASES = {
 }
 
 
+# At most GAME_ROOMS_CHANNEL_CAPACITY messages wait for a socket, older ones are dropped by the
+# channel layer, as are messages not received within GAME_ROOMS_CHANNEL_EXPIRY seconds. Sockets
+# leave their groups (the lobby `rooms` groups too) after GAME_ROOMS_GROUP_EXPIRY seconds.
+GAME_ROOMS_CHANNEL_CAPACITY = 100
+GAME_ROOMS_CHANNEL_EXPIRY = 60
+GAME_ROOMS_GROUP_EXPIRY = 86400
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
         "CONFIG": {
             "hosts": [('127.0.0.1', 6379)],
+            "capacity": GAME_ROOMS_CHANNEL_CAPACITY,
+            "expiry": GAME_ROOMS_CHANNEL_EXPIRY,
+            "group_expiry": GAME_ROOMS_GROUP_EXPIRY,
         },
     },
 }
@@ -162,3 +173,130 @@ CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 
 SECONDS_BEFORE_START_GAME_ROOM = 10
 GAME_ROOMS_CHANNEL_GROUP_NAME = "rooms"
+# Sockets of ws/room/<id_code>/ join the group GAME_ROOMS_ROOM_GROUP_PREFIX + id_code.
+GAME_ROOMS_ROOM_GROUP_PREFIX = "room."
+
+CACHES = {
+    "default": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": "redis://" + REDIS_HOST + ":" + REDIS_PORT + "/1",
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+        },
+    }
+}
+
+GAME_ROOMS_LOBBY_VERSION_KEY = "game_rooms:lobby:version"
+
+# "async" serves the lobby with AsyncRoomConsumer, "sync" with the thread-pool based RoomConsumer.
+GAME_ROOMS_CONSUMER = "async"
+GAME_ROOMS_LOBBY_CHUNK_SIZE = 2000
+
+GAME_ROOMS_TIMER_KEY_PREFIX = "game_rooms:timer:"
+# Extra lifetime of a timer token after its countdown, covers broker and worker delays.
+GAME_ROOMS_TIMER_TOKEN_TTL = 3600
+
+# Safety net for lost room timers: starts every room whose delete_at has passed.
+GAME_ROOMS_START_SWEEP_INTERVAL = 5
+# Rooms are purged (see game_rooms.purge) this many seconds after their start, every GAME_ROOMS_PURGE_INTERVAL
+# seconds, in batches of GAME_ROOMS_PURGE_BATCH_SIZE rooms. A run stops after GAME_ROOMS_PURGE_MAX_BATCHES
+# batches and sleeps GAME_ROOMS_PURGE_PAUSE seconds between them; a batch waits at most
+# GAME_ROOMS_PURGE_LOCK_TIMEOUT milliseconds for a lock. False deletes rooms instead of archiving them.
+GAME_ROOMS_PURGE_AFTER = 24 * 60 * 60
+# Open rooms older than this (seconds) are purged too: their timed start was cancelled and they never filled.
+GAME_ROOMS_PURGE_OPEN_AFTER = 24 * 60 * 60
+GAME_ROOMS_PURGE_INTERVAL = 60
+GAME_ROOMS_PURGE_BATCH_SIZE = 500
+GAME_ROOMS_PURGE_MAX_BATCHES = 20
+GAME_ROOMS_PURGE_PAUSE = 0.1
+GAME_ROOMS_PURGE_LOCK_TIMEOUT = 1000
+GAME_ROOMS_PURGE_ARCHIVE = True
+
+CELERY_BEAT_SCHEDULE = {
+    "start-expired-rooms": {
+        "task": "game_rooms.tasks.start_expired_rooms",
+        "schedule": GAME_ROOMS_START_SWEEP_INTERVAL,
+    },
+    "flush-lobby-outbox": {
+        "task": "game_rooms.tasks.flush_lobby_outbox",
+        "schedule": GAME_ROOMS_START_SWEEP_INTERVAL,
+    },
+    "purge-finished-rooms": {
+        "task": "game_rooms.tasks.purge_finished_rooms",
+        "schedule": GAME_ROOMS_PURGE_INTERVAL,
+    },
+}
+
+# Key of the permutation that maps the room code sequence onto 'A1B2C3' codes.
+# Changing it on a live database makes new codes collide with existing ones.
+GAME_ROOMS_ID_CODE_KEY = "dices-room-codes"
+# Sequence values tried for a new room when its code is taken (rooms from before the sequence,
+# or codes reused after the sequence cycled) before the insert fails.
+GAME_ROOMS_ID_CODE_ATTEMPTS = 5
+
+GAME_ROOMS_LOBBY_CACHE_PREFIX = "game_rooms:lobby:"
+# The cached lobby is reloaded from the database at least this often (seconds).
+GAME_ROOMS_LOBBY_CACHE_TTL = 300
+GAME_ROOMS_METRICS_KEY = "game_rooms:metrics"
+# Bearer token the scraper of GET /api/room/metrics/ must send; the endpoint is disabled (404) without one.
+GAME_ROOMS_METRICS_TOKEN = getattr(db_secrets, "METRICS_TOKEN", "")
+
+GAME_ROOMS_OUTBOX_PREFIX = "game_rooms:outbox:"
+# Room changes are collected for this long (seconds) and sent to the lobby in one message.
+GAME_ROOMS_OUTBOX_WINDOW = 0.1
+# A flush scheduled this long ago (seconds) without running is considered lost and scheduled again.
+GAME_ROOMS_OUTBOX_FLUSH_TIMEOUT = 30
+
+# Rooms per page of GET /api/room/ by default, and at most (see game_rooms.listing).
+GAME_ROOMS_LIST_PAGE_SIZE = 50
+GAME_ROOMS_LIST_MAX_PAGE_SIZE = 200
+
+# A lobby socket that has had messages queued for longer than GAME_ROOMS_LOBBY_MAX_LAG seconds (on its
+# own monotonic clock), or with more than GAME_ROOMS_LOBBY_MAX_BACKLOG messages queued, gets a fresh
+# snapshot instead of the queued deltas.
+GAME_ROOMS_LOBBY_MAX_LAG = 2.0
+GAME_ROOMS_LOBBY_MAX_BACKLOG = 50
+# A socket needing more snapshots than that within the window (seconds) is closed with a resume token.
+GAME_ROOMS_LOBBY_MAX_RESYNCS = 3
+GAME_ROOMS_LOBBY_RESYNC_WINDOW = 30
+GAME_ROOMS_LOBBY_RESUME_TTL = 300
+
+# Lifetime of issued JWTs (seconds); tokens without exp, iat and jti claims are refused.
+AUTHORIZATION_TOKEN_LIFETIME = 7 * 24 * 3600
+# Verified JWTs kept per process (see authorization.token_service); never past the token's exp.
+AUTHORIZATION_TOKEN_CACHE_SIZE = 10000
+AUTHORIZATION_TOKEN_CACHE_TTL = 300
+AUTHORIZATION_USER_CACHE_SIZE = 10000
+# A cached user is re-validated against its Redis version after this many seconds.
+AUTHORIZATION_USER_CACHE_RECHECK = 1.0
+AUTHORIZATION_USER_VERSION_KEY = "authorization:user_versions"
+
+# werkzeug method strings per kind of password, in the full form werkzeug stores
+# ("scrypt:N:r:p", "pbkdf2:hash:iterations"). Changing one upgrades user hashes on their next login.
+AUTHORIZATION_PASSWORD_PROFILES = {
+    "user": "scrypt:32768:8:1",
+    "room": "pbkdf2:sha256:50000",
+}
+# Processes hashing passwords (0 hashes inline in the request thread) and hashes allowed to wait for them.
+AUTHORIZATION_PASSWORD_WORKERS = 2
+AUTHORIZATION_PASSWORD_MAX_PENDING = 64
+
+# Revoked token ids (see authorization.revocation) and the per-process Bloom filter mirroring them:
+# 2 ** 20 bits with 4 hashes keep false positives around 1% with 100k live revocations.
+AUTHORIZATION_REVOKED_KEY = "authorization:revoked"
+AUTHORIZATION_REVOCATION_BLOOM_BITS = 2 ** 20
+AUTHORIZATION_REVOCATION_BLOOM_HASHES = 4
+AUTHORIZATION_REVOCATION_REFRESH = 1.0
+
+# Cached binomial tail tables and bid grids of game.probability (entries per cache).
+GAME_PROBABILITY_CACHE_SIZE = 512
+# Bots pick at random among bids at most this much less likely than the best one.
+GAME_BOT_BLUFF_MARGIN = 0.05
+GAME_BOT_SPOT_ON_THRESHOLD = 0.4
+
+# Game workers (python manage.py game_worker) and the consistent hash ring assigning tables to them.
+GAME_WORKERS_KEY = "game:workers"
+GAME_WORKER_HEARTBEAT = 1.0
+# A worker that missed heartbeats for this long (seconds) loses its tables to the others.
+GAME_WORKER_TTL = 5.0
+GAME_RING_REPLICAS = 64
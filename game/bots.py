@@ -0,0 +1,45 @@
+"""
+Server-side opponents filling the free seats of a table (up to RoomModel.max_players).
+
+A bot sees only its own dice. It compares the chance that the current bid is false ("liar"),
+exactly right ("spot on", which costs two dice when wrong, hence GAME_BOT_SPOT_ON_THRESHOLD)
+and the best chance of a higher bid being true, all from game.probability. Among bids within
+GAME_BOT_BLUFF_MARGIN of the best it picks one at random, so bots are not fully predictable.
+"""
+
+import random
+import numpy as np
+from django.conf import settings
+from . import engine
+from .probability import bid_probabilities, bid_probability
+
+BID = "bid"
+LIAR = "liar"
+SPOT_ON = "spot_on"
+
+
+def choose_move(state, player, rng=None):
+    """Return the move of the bot seated as `player`: (BID, bid), (LIAR, bid) or (SPOT_ON, bid)."""
+    rng = rng or random
+    bids, probabilities = bid_probabilities(state, player)
+    best = float(probabilities.max()) if len(bids) else 0.0
+
+    if state.bid != engine.NO_BID:
+        untrue = 1.0 - bid_probability(state, state.bid, player)
+        exact = bid_probability(state, state.bid, player, exactly=True)
+
+        if exact >= settings.GAME_BOT_SPOT_ON_THRESHOLD and exact > max(best, untrue):
+            return SPOT_ON, state.bid
+        if untrue > best or not len(bids):
+            return LIAR, state.bid
+
+    candidates = np.flatnonzero(probabilities >= best - settings.GAME_BOT_BLUFF_MARGIN)
+    return BID, int(bids[candidates[rng.randrange(len(candidates))]])
+
+
+def play_move(state, player, move):
+    """Apply a move to the state. Returns (state, RoundResult or None)."""
+    kind, bid = move
+    if kind == BID:
+        return engine.place_bid(state, player, bid), None
+    return state, engine.challenge(state, player, spot_on=kind == SPOT_ON)
@@ -0,0 +1,241 @@
+"""
+Liar's Dice rules on a compact table state (see the rules in readme.txt).
+
+Representation:
+- a hand is one int: the count of every face packed in 5-bit fields, face 1 in the lowest
+  bits. A whole table holds at most 30 dice, so adding the hands of all players gives the
+  packed counts of the table without any carry between fields.
+- the dice left per player are a bytearray, a player with 0 dice is out of the game.
+- a bid is one int, `(quantity << 3) | face`. Comparing two encoded bids compares them by
+  the rules: a higher quantity wins, and for the same quantity a higher face wins.
+
+Every operation is a function of its arguments: bidding and resolving return a new
+`GameState` and never change the one they were given, and rolling takes the random
+generator to use.
+"""
+
+import random
+
+FACES = 6
+FACE_BITS = 3
+FACE_MASK = (1 << FACE_BITS) - 1
+COUNT_BITS = 5
+COUNT_MASK = (1 << COUNT_BITS) - 1
+DICE_PER_PLAYER = 5
+NO_BID = 0
+
+# Packed hand of a single die of every face, indexed by face.
+FACE_UNITS = tuple(0 if face == 0 else 1 << (COUNT_BITS * (face - 1)) for face in range(FACES + 1))
+
+
+class GameError(ValueError):
+    """Raised for a move the rules do not allow."""
+
+
+def encode_bid(quantity, face):
+    return (quantity << FACE_BITS) | face
+
+
+def decode_bid(bid):
+    """Return (quantity, face) of an encoded bid."""
+    return bid >> FACE_BITS, bid & FACE_MASK
+
+
+def is_valid_bid(bid, current, total_dice):
+    """Return True if `bid` may follow `current` (NO_BID at the start of a round) on a table with `total_dice` dice."""
+    return current < bid and 0 < bid & FACE_MASK <= FACES and 1 <= bid >> FACE_BITS <= total_dice
+
+
+def roll_hand(dice, rng):
+    """Roll `dice` dice and return them as a packed hand."""
+    hand = 0
+    for _ in range(dice):
+        hand += FACE_UNITS[rng.randint(1, FACES)]
+    return hand
+
+
+def count_face(counts, face):
+    """Return how many dice of `face` a packed hand (or the sum of several) holds."""
+    return (counts >> (COUNT_BITS * (face - 1))) & COUNT_MASK
+
+
+def count_matching(counts, face, wild_ones):
+    """Return how many dice count for a bid on `face`, ones included when they are wild."""
+    matching = count_face(counts, face)
+    if wild_ones and face != 1:
+        matching += count_face(counts, 1)
+    return matching
+
+
+def hand_faces(hand):
+    """Return the faces of a packed hand in ascending order, e.g. to reveal it."""
+    return [face for face in range(1, FACES + 1) for _ in range(count_face(hand, face))]
+
+
+def next_player(dice, player):
+    """Return the next player clockwise from `player` who still has dice."""
+    players = len(dice)
+    for step in range(1, players + 1):
+        candidate = (player + step) % players
+        if dice[candidate]:
+            return candidate
+    raise GameError("No player has dice left.")
+
+
+class GameState:
+    """
+    State of one table.
+
+    Attributes:
+    - hands: packed hand of every player (0 for players out of the game).
+    - dice: bytearray of the dice left per player.
+    - bid: the current encoded bid, NO_BID before the first bid of a round.
+    - bidder: the player who made the current bid (-1 before the first bid).
+    - turn: the player expected to bid or challenge.
+    - round: number of the current round, from 1.
+    - wild_ones: whether ones count for every face.
+
+    Methods:
+    - total_dice: Returns the number of dice left on the table.
+    - counts: Returns the packed counts of all dice on the table.
+    - copy(**changes): Returns a copy with some attributes replaced.
+    """
+
+    __slots__ = ("hands", "dice", "bid", "bidder", "turn", "round", "wild_ones")
+
+    def __init__(self, hands, dice, bid=NO_BID, bidder=-1, turn=0, round=1, wild_ones=True):
+        self.hands = hands
+        self.dice = dice
+        self.bid = bid
+        self.bidder = bidder
+        self.turn = turn
+        self.round = round
+        self.wild_ones = wild_ones
+
+    def total_dice(self):
+        return sum(self.dice)
+
+    def counts(self):
+        return sum(self.hands)
+
+    def copy(self, **changes):
+        state = GameState(self.hands, self.dice, self.bid, self.bidder, self.turn, self.round, self.wild_ones)
+        for name, value in changes.items():
+            setattr(state, name, value)
+        return state
+
+
+class RoundResult:
+    """
+    Outcome of a challenge, applied by `resolve_round`.
+
+    Attributes:
+    - challenger, bidder: the players involved.
+    - bid: the challenged bid; actual: how many dice matched it.
+    - spot_on: whether the challenger called "spot on" instead of "liar".
+    - losses: bytearray of the dice lost per player.
+    - starter: the player who starts the next round (if still in the game).
+    """
+
+    __slots__ = ("challenger", "bidder", "bid", "actual", "spot_on", "losses", "starter")
+
+    def __init__(self, challenger, bidder, bid, actual, spot_on, losses, starter):
+        self.challenger = challenger
+        self.bidder = bidder
+        self.bid = bid
+        self.actual = actual
+        self.spot_on = spot_on
+        self.losses = losses
+        self.starter = starter
+
+
+def roll(state, rng):
+    """Return the state with every player still in the game holding freshly rolled dice."""
+    return state.copy(hands=[roll_hand(dice, rng) for dice in state.dice])
+
+
+def new_game(players, rng=None, dice=DICE_PER_PLAYER, wild_ones=True, starter=0):
+    """Return the rolled first round of a table of `players` players."""
+    if not 2 <= players <= 6:
+        raise GameError("Liar's Dice is played by 2 to 6 players.")
+
+    state = GameState(hands=[], dice=bytearray([dice] * players), turn=starter, wild_ones=wild_ones)
+    return roll(state, rng or random)
+
+
+def place_bid(state, player, bid):
+    """Return the state after `player` bid `bid`."""
+    if player != state.turn:
+        raise GameError("It is not this player's turn.")
+    if not is_valid_bid(bid, state.bid, state.total_dice()):
+        raise GameError("The bid must be higher than the current one.")
+
+    return state.copy(bid=bid, bidder=player, turn=next_player(state.dice, player))
+
+
+def challenge(state, player, spot_on=False):
+    """
+    Reveal the dice on the current bid, called "liar" (or "spot on") by `player`.
+
+    "liar": the bidder loses a die if fewer dice match than bid, the challenger otherwise.
+    "spot on": if exactly as many dice match as bid, everyone else loses a die, otherwise the
+    challenger loses two. Returns a RoundResult; the state itself is unchanged.
+    """
+    if player != state.turn:
+        raise GameError("It is not this player's turn.")
+    if state.bid == NO_BID:
+        raise GameError("There is no bid to challenge.")
+
+    quantity, face = decode_bid(state.bid)
+    actual = count_matching(state.counts(), face, state.wild_ones)
+    losses = bytearray(len(state.dice))
+
+    starter = player
+    if spot_on:
+        if actual == quantity:
+            for other, dice in enumerate(state.dice):
+                if dice and other != player:
+                    losses[other] = 1
+        else:
+            losses[player] = 2
+    elif actual < quantity:
+        losses[state.bidder] = 1
+        starter = state.bidder
+    else:
+        losses[player] = 1
+
+    return RoundResult(player, state.bidder, state.bid, actual, spot_on, losses, starter)
+
+
+def resolve_round(state, result, rng=None):
+    """Return the next, rolled round after applying the dice lost in `result`."""
+    dice = bytearray(max(0, left - lost) for left, lost in zip(state.dice, result.losses))
+    starter = result.starter if dice[result.starter] else next_player(dice, result.starter)
+    next_state = state.copy(dice=dice, bid=NO_BID, bidder=-1, turn=starter, round=state.round + 1)
+
+    return roll(next_state, rng or random)
+
+
+def winner(state):
+    """Return the only player with dice left, or None while the game goes on."""
+    players = [player for player, dice in enumerate(state.dice) if dice]
+    return players[0] if len(players) == 1 else None
+
+
+def dump_state(state):
+    """Return the state as a JSON-compatible dict, e.g. for a checkpoint."""
+    return {
+        "hands": list(state.hands),
+        "dice": list(state.dice),
+        "bid": state.bid,
+        "bidder": state.bidder,
+        "turn": state.turn,
+        "round": state.round,
+        "wild_ones": state.wild_ones,
+    }
+
+
+def load_state(data):
+    """Inverse of `dump_state`."""
+    return GameState(hands=list(data["hands"]), dice=bytearray(data["dice"]), bid=data["bid"],
+                     bidder=data["bidder"], turn=data["turn"], round=data["round"], wild_ones=data["wild_ones"])
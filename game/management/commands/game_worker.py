@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from game.worker import get_default_worker_id, run_worker
+
+
+class Command(BaseCommand):
+    help = "Run a game worker owning a share of the started tables (see game.sharding)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--worker-id", default=None, help="Unique id of the worker, hostname-pid by default.")
+
+    def handle(self, *args, **options):
+        try:
+            run_worker(options["worker_id"] or get_default_worker_id())
+        except KeyboardInterrupt:
+            pass
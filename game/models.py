@@ -0,0 +1,31 @@
+from django.db import models
+from game_rooms.models import RoomModel
+
+
+class GameCheckpoint(models.Model):
+    """
+    Last round boundary of a started room's game, written by the worker owning the table.
+
+    The table lives in the memory of one game worker (see game.sharding); the checkpoint is
+    what another worker restores when the table's ownership moves to it.
+
+    Fields:
+    - room (OneToOneField): The started room.
+    - seats (JSONField): User id of every seat in turn order, null for a bot.
+    - state (JSONField): The game state at the start of the round (game.engine.dump_state).
+    - round (IntegerField): The round of `state`.
+    - owner (CharField): Id of the worker that wrote the checkpoint.
+    - is_finished (BooleanField): Whether the game has a winner.
+    - updated_at (DateTimeField): Time of the last checkpoint.
+    """
+
+    room = models.OneToOneField(RoomModel, on_delete=models.CASCADE, related_name="checkpoint")
+    seats = models.JSONField()
+    state = models.JSONField()
+    round = models.IntegerField()
+    owner = models.CharField(max_length=64)
+    is_finished = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.room_id}: round {self.round}"
@@ -0,0 +1,105 @@
+"""
+Probability that Liar's Dice bids are true, for every legal bid of a table at once.
+
+A bid "q of face f" is true when the dice showing f (plus the ones, when they are wild)
+reach q. Seen by a player, their own dice are known and the other `unknown` dice are
+independent, so the bid holds with the binomial tail P(X >= q - known) where
+X ~ Bin(unknown, p) and p is 1/6, or 2/6 for a wild-counted face.
+
+Both inputs of that lookup are cached with LRU eviction (GAME_PROBABILITY_CACHE_SIZE
+entries each): the tail tables per (unknown dice, wild ones) and the grid of every bid per
+number of dice on the table. Evaluating all bids is then one searchsorted and one fancy
+index into NumPy arrays.
+"""
+
+import math
+from functools import lru_cache
+import numpy as np
+from django.conf import settings
+from . import engine
+
+FACE_SHIFTS = engine.COUNT_BITS * np.arange(engine.FACES, dtype=np.int64)
+
+
+def freeze(*arrays):
+    """Make cached arrays read-only, so no caller can alter them for the others."""
+    for array in arrays:
+        array.setflags(write=False)
+
+
+@lru_cache(maxsize=settings.GAME_PROBABILITY_CACHE_SIZE)
+def get_tail_table(unknown, wild_ones):
+    """
+    Return a read-only array `table[f, k]`: the probability that at least k of `unknown` dice
+    count for face f, for faces 0..6 (row 0 unused) and k in 0..unknown + 1.
+    """
+    k = np.arange(unknown + 1)
+    combinations = np.array([math.comb(unknown, i) for i in range(unknown + 1)], dtype=np.float64)
+    table = np.zeros((engine.FACES + 1, unknown + 2))
+
+    for face in range(1, engine.FACES + 1):
+        p = (2 if wild_ones and face != 1 else 1) / engine.FACES
+        pmf = combinations * p ** k * (1 - p) ** (unknown - k)
+        table[face, :unknown + 1] = np.minimum(pmf[::-1].cumsum()[::-1], 1.0)
+
+    freeze(table)
+    return table
+
+
+@lru_cache(maxsize=settings.GAME_PROBABILITY_CACHE_SIZE)
+def get_bid_grid(total_dice):
+    """Return read-only (quantities, faces, bids) of every bid on a table of `total_dice` dice, in ascending order."""
+    quantities = np.repeat(np.arange(1, total_dice + 1), engine.FACES)
+    faces = np.tile(np.arange(1, engine.FACES + 1), total_dice)
+    bids = (quantities << engine.FACE_BITS) | faces
+    freeze(quantities, faces, bids)
+    return quantities, faces, bids
+
+
+def get_known_matching(hand, wild_ones):
+    """Return the dice of a packed hand that count for every face, indexed 0..6."""
+    counts = np.zeros(engine.FACES + 1, dtype=np.int64)
+    counts[1:] = (hand >> FACE_SHIFTS) & engine.COUNT_MASK
+    if wild_ones:
+        counts[2:] += counts[1]
+    return counts
+
+
+def get_view(state, player):
+    """Return (unknown dice, known matching counts) as seen by `player`, or by an observer when None."""
+    total = state.total_dice()
+    if player is None:
+        return total, np.zeros(engine.FACES + 1, dtype=np.int64)
+    return total - state.dice[player], get_known_matching(state.hands[player], state.wild_ones)
+
+
+def bid_probabilities(state, player=None):
+    """
+    Return (bids, probabilities) of every bid that may follow the current one.
+
+    Probabilities are seen by `player`, who knows their own dice; by default they are the ones
+    shown to spectators, who know none.
+    """
+    unknown, known = get_view(state, player)
+    quantities, faces, bids = get_bid_grid(state.total_dice())
+    start = np.searchsorted(bids, state.bid, side="right")
+
+    faces = faces[start:]
+    needed = np.clip(quantities[start:] - known[faces], 0, unknown + 1)
+    return bids[start:], get_tail_table(unknown, state.wild_ones)[faces, needed]
+
+
+def bid_probability(state, bid, player=None, exactly=False):
+    """Return the probability that `bid` is true (or exactly matched, for "spot on") as seen by `player`."""
+    unknown, known = get_view(state, player)
+    quantity, face = engine.decode_bid(bid)
+    table = get_tail_table(unknown, state.wild_ones)
+
+    needed = quantity - int(known[face])
+    if needed < 0:
+        return 0.0 if exactly else 1.0
+    if needed > unknown:
+        return 0.0
+    if exactly:
+        return float(table[face, needed] - table[face, needed + 1])
+    return float(table[face, needed])
@@ -0,0 +1,265 @@
+"""
+The tables owned by one game worker process, kept in memory.
+
+A worker handles the `game.command` messages sent to its channel (see game.sharding) one at a
+time. Bids and challenges only change the in-memory state; the database is written at round
+boundaries only, when a table opens and when a challenge resolves a round (GameCheckpoint).
+
+A command for a table the worker does not hold restores it from its checkpoint, which is how
+a table moves to a new owner when its previous one died: play resumes at the start of the last
+checkpointed round. A command for a started room that has no checkpoint opens its table, so a
+room whose `start` never reached a worker (none was alive, or the channel layer dropped the
+message) still gets its game. When the ring gives a table to another worker, the local copy is dropped,
+so a table whose ownership comes back is restored from the newest checkpoint instead of played
+on from a stale copy. A checkpoint is only written over the one the table was loaded from (same
+owner, no newer round): a worker still holding a stale copy cannot overwrite the checkpoint of
+the worker that took the table over, its move is refused and the copy dropped.
+
+Seats without a player are taken by bots (game.bots) up to two seats, and bot turns are
+played right after the command that handed them the turn.
+
+Commands: `start`, `bid` (user_id, bid), `challenge` (user_id, spot_on), `state`. With a
+`reply_channel`, the worker answers with a `game.reply` message carrying the public state, and
+the dice of the player when the command has a `user_id` seated at the table.
+
+Every move is also sent to the sockets of the room (game_rooms.room_events): `bid`, then
+`challenge` revealing every hand, and `roll` with the public state of each new round.
+"""
+
+import logging
+import random
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.utils import timezone
+from game_rooms.room_events import asend_room_event
+from . import engine, bots, sharding
+
+logger = logging.getLogger(__name__)
+
+MIN_SEATS = 2
+
+
+class Table:
+    """
+    One game in memory.
+
+    Attributes:
+    - id_code, room_id: code and pk of the room.
+    - seats: user id of every seat, None for a bot.
+    - state: the current game.engine.GameState.
+    - checkpoint_owner: owner of the checkpoint the table was loaded from or last wrote, None
+      before its first checkpoint.
+    """
+
+    __slots__ = ("id_code", "room_id", "seats", "state", "checkpoint_owner")
+
+    def __init__(self, id_code, room_id, seats, state, checkpoint_owner=None):
+        self.id_code = id_code
+        self.room_id = room_id
+        self.seats = seats
+        self.state = state
+        self.checkpoint_owner = checkpoint_owner
+
+    def get_seat(self, user_id):
+        try:
+            return self.seats.index(user_id)
+        except ValueError:
+            raise engine.GameError("This user does not play at this table.")
+
+    def get_hand(self, user_id):
+        if user_id not in self.seats:
+            return None
+        return engine.hand_faces(self.state.hands[self.seats.index(user_id)])
+
+    def get_public_state(self):
+        state = self.state
+        return {
+            "seats": self.seats,
+            "dice": list(state.dice),
+            "bid": engine.decode_bid(state.bid) if state.bid else None,
+            "turn": state.turn,
+            "round": state.round,
+            "winner": engine.winner(state),
+        }
+
+
+@database_sync_to_async
+def load_room_seats(id_code):
+    """Return (room pk, seats) of a room; the players in the order they joined, then bots."""
+    from game_rooms.models import RoomModel
+
+    room_id = RoomModel.objects.filter(id_code=id_code).values_list("pk", flat=True).first()
+    if room_id is None:
+        raise engine.GameError("This room does not exist.")
+    through = RoomModel.players_list.through
+    seats = list(through.objects.filter(roommodel_id=room_id).order_by("id").values_list("user_id", flat=True))
+    return room_id, seats + [None] * max(0, MIN_SEATS - len(seats))
+
+
+@database_sync_to_async
+def is_room_started(id_code):
+    from game_rooms.models import RoomModel
+
+    return RoomModel.objects.filter(id_code=id_code, is_started=True).exists()
+
+
+@database_sync_to_async
+def save_checkpoint(table, owner):
+    """
+    Write the checkpoint of the table, unless another worker checkpointed it since the table was
+    loaded. Returns whether it was written.
+    """
+    from .models import GameCheckpoint
+
+    fields = {
+        "seats": table.seats,
+        "state": engine.dump_state(table.state),
+        "round": table.state.round,
+        "owner": owner,
+        "is_finished": engine.winner(table.state) is not None,
+    }
+    if table.checkpoint_owner is None:
+        _, written = GameCheckpoint.objects.get_or_create(room_id=table.room_id, defaults=fields)
+    else:
+        written = GameCheckpoint.objects.filter(
+            room_id=table.room_id, round__lte=table.state.round, owner=table.checkpoint_owner,
+        ).update(updated_at=timezone.now(), **fields)
+    if written:
+        table.checkpoint_owner = owner
+    return bool(written)
+
+
+@database_sync_to_async
+def load_checkpoint(id_code):
+    from .models import GameCheckpoint
+
+    checkpoint = GameCheckpoint.objects.filter(room__id_code=id_code).first()
+    if checkpoint is None:
+        return None
+    return Table(id_code, checkpoint.room_id, checkpoint.seats, engine.load_state(checkpoint.state), checkpoint.owner)
+
+
+class GameShard:
+    """
+    Tables of one worker and the handling of their commands.
+
+    Methods:
+    - handle(message): Runs one `game.command` message and answers its reply channel.
+    - set_workers(workers): Sets the live workers, refreshed by the heartbeat of the worker process
+      and before a command is forwarded to the worker this one believes to own it, and drops the
+      tables the ring no longer gives to this worker.
+    - open_table(id_code): Creates the table of a started room and checkpoints its first round, on `start`
+      or on the first command of a started room whose `start` was lost.
+    - restore_table(id_code): Loads the table from its checkpoint, or returns None.
+    - play(table, seat, move): Applies a move, then the moves of bots whose turn follows.
+    """
+
+    def __init__(self, worker_id, rng=None):
+        self.worker_id = worker_id
+        self.workers = [worker_id]
+        self.tables = {}
+        self.rng = rng or random.Random()
+
+    async def handle(self, message):
+        id_code = message["id_code"]
+        reply = {"type": "game.reply", "id_code": id_code, "owner": self.worker_id}
+
+        owner = sharding.get_ring(self.workers).get_owner(id_code)
+        if owner not in (None, self.worker_id):
+            # The sender saw another ring: refresh ours before forwarding, or a command sent
+            # right after an owner died would go back to the dead owner until the next heartbeat.
+            self.set_workers(await sharding.aget_live_workers() or self.workers)
+            owner = sharding.get_ring(self.workers).get_owner(id_code)
+        if owner not in (None, self.worker_id):
+            await get_channel_layer().send(sharding.get_worker_channel(owner), message)
+            return
+
+        try:
+            table = await self.run(id_code, message)
+            reply.update(ok=True, state=table.get_public_state())
+            if message.get("user_id") is not None:
+                reply["hand"] = table.get_hand(message["user_id"])
+        except engine.GameError as error:
+            reply.update(ok=False, error=str(error))
+
+        if message.get("reply_channel"):
+            await get_channel_layer().send(message["reply_channel"], reply)
+
+    def set_workers(self, workers):
+        self.workers = workers
+        ring = sharding.get_ring(workers)
+        for id_code in [id_code for id_code in self.tables if ring.get_owner(id_code) not in (None, self.worker_id)]:
+            del self.tables[id_code]
+
+    async def run(self, id_code, message):
+        command = message["command"]
+        table = self.tables.get(id_code) or await self.restore_table(id_code)
+        if command == "start":
+            return table or await self.open_table(id_code)
+        if table is None:
+            if not await is_room_started(id_code):
+                raise engine.GameError("This room has no game.")
+            table = await self.open_table(id_code)
+
+        if command == "bid":
+            seat = table.get_seat(message["user_id"])
+            await self.play(table, seat, (bots.BID, message["bid"]))
+        elif command == "challenge":
+            seat = table.get_seat(message["user_id"])
+            kind = bots.SPOT_ON if message.get("spot_on") else bots.LIAR
+            await self.play(table, seat, (kind, table.state.bid))
+        elif command != "state":
+            raise engine.GameError(f"Unknown command '{command}'.")
+        return table
+
+    async def open_table(self, id_code):
+        room_id, seats = await load_room_seats(id_code)
+        table = Table(id_code, room_id, seats, engine.new_game(len(seats), self.rng))
+        if not await save_checkpoint(table, self.worker_id):
+            raise engine.GameError("This game was opened by another worker.")
+        self.tables[id_code] = table
+        await asend_room_event(id_code, "roll", table.get_public_state())
+        await self.play_bots(table)
+        return table
+
+    async def restore_table(self, id_code):
+        table = await load_checkpoint(id_code)
+        if table is not None:
+            logger.info("Worker %s restored table %s at round %s", self.worker_id, id_code, table.state.round)
+            self.tables[id_code] = table
+            await self.play_bots(table)
+        return table
+
+    async def play(self, table, seat, move):
+        if engine.winner(table.state) is not None:
+            raise engine.GameError("The game is over.")
+
+        await self.apply(table, seat, move)
+        await self.play_bots(table)
+
+    async def play_bots(self, table):
+        while engine.winner(table.state) is None and table.seats[table.state.turn] is None:
+            seat = table.state.turn
+            await self.apply(table, seat, bots.choose_move(table.state, seat, self.rng))
+
+    async def apply(self, table, seat, move):
+        state, result = bots.play_move(table.state, seat, move)
+        table.state = state
+        if result is None:
+            await asend_room_event(table.id_code, "bid", {"seat": seat, "bid": engine.decode_bid(state.bid)})
+            return
+
+        await asend_room_event(table.id_code, "challenge", {
+            "challenger": result.challenger,
+            "bidder": result.bidder,
+            "bid": engine.decode_bid(result.bid),
+            "actual": result.actual,
+            "spot_on": result.spot_on,
+            "losses": list(result.losses),
+            "hands": [engine.hand_faces(hand) for hand in state.hands],
+        })
+        table.state = engine.resolve_round(state, result, self.rng)
+        if not await save_checkpoint(table, self.worker_id):
+            self.tables.pop(table.id_code, None)
+            raise engine.GameError("This table was taken over by another worker.")
+        await asend_room_event(table.id_code, "roll", table.get_public_state())
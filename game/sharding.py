@@ -0,0 +1,124 @@
+"""
+Ownership of started tables by game worker processes.
+
+Every game worker (`python manage.py game_worker`) registers in a Redis sorted set
+(GAME_WORKERS_KEY) scored by the time its registration expires, and renews it every
+GAME_WORKER_HEARTBEAT seconds. A worker that stops renewing is dropped after GAME_WORKER_TTL.
+
+The owner of a room is chosen by consistent hashing of its id_code over the live workers, each
+placed GAME_RING_REPLICAS times on the ring. Adding a worker moves only about 1/N of the tables
+to it, and the tables of a dead worker spread over the others. Commands reach the owner over
+the channel layer on its own channel, see game.shard.
+"""
+
+import bisect
+import hashlib
+import time
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from game_rooms.redis_client import get_redis, get_async_redis
+
+
+def get_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring of worker ids.
+
+    Methods:
+    - get_owner(key): Returns the worker owning the key, or None if the ring is empty.
+    """
+
+    def __init__(self, workers, replicas):
+        points = sorted((get_hash(f"{worker}#{replica}"), worker) for worker in workers for replica in range(replicas))
+        self.hashes = [point for point, _ in points]
+        self.workers = [worker for _, worker in points]
+
+    def get_owner(self, key):
+        if not self.hashes:
+            return None
+        index = bisect.bisect(self.hashes, get_hash(key)) % len(self.hashes)
+        return self.workers[index]
+
+
+_rings = {}
+
+
+def get_ring(workers):
+    """Return the ring of these workers, built once per distinct set of live workers."""
+    key = tuple(sorted(workers))
+    ring = _rings.get(key)
+    if ring is None:
+        _rings.clear()
+        ring = _rings[key] = HashRing(key, settings.GAME_RING_REPLICAS)
+    return ring
+
+
+def get_worker_channel(worker_id):
+    return f"game-worker.{worker_id}"
+
+
+def parse_workers(members):
+    return [member.decode() for member in members]
+
+
+def get_live_workers():
+    return parse_workers(get_redis().zrangebyscore(settings.GAME_WORKERS_KEY, time.time(), "+inf"))
+
+
+async def aget_live_workers():
+    return parse_workers(await get_async_redis().zrangebyscore(settings.GAME_WORKERS_KEY, time.time(), "+inf"))
+
+
+def get_owner(id_code, workers=None):
+    """Return the id of the worker owning the room's table, or None if no worker is alive."""
+    return get_ring(get_live_workers() if workers is None else workers).get_owner(id_code)
+
+
+async def aheartbeat(worker_id):
+    """Register the worker, or renew its registration, drop the expired ones and return the live workers."""
+    now = time.time()
+    async with get_async_redis().pipeline(transaction=True) as pipe:
+        pipe.zadd(settings.GAME_WORKERS_KEY, {worker_id: now + settings.GAME_WORKER_TTL})
+        pipe.zremrangebyscore(settings.GAME_WORKERS_KEY, "-inf", now)
+        pipe.zrange(settings.GAME_WORKERS_KEY, 0, -1)
+        return parse_workers((await pipe.execute())[-1])
+
+
+async def aunregister(worker_id):
+    await get_async_redis().zrem(settings.GAME_WORKERS_KEY, worker_id)
+
+
+def get_command(id_code, command, **data):
+    return {"type": "game.command", "id_code": id_code, "command": command, **data}
+
+
+def send_command(id_code, command, **data):
+    """Send a command to the worker owning the room. Returns that worker's id, or None if no worker is alive."""
+    owner = get_owner(id_code)
+    if owner is not None:
+        async_to_sync(get_channel_layer().send)(get_worker_channel(owner), get_command(id_code, command, **data))
+    return owner
+
+
+async def asend_command(id_code, command, **data):
+    """Async counterpart of `send_command`."""
+    owner = get_ring(await aget_live_workers()).get_owner(id_code)
+    if owner is not None:
+        await get_channel_layer().send(get_worker_channel(owner), get_command(id_code, command, **data))
+    return owner
+
+
+def start_tables(id_codes):
+    """Tell the owners of just started rooms to open their tables."""
+    workers = get_live_workers()
+    if not workers:
+        return
+
+    channel_layer = get_channel_layer()
+    for id_code in id_codes:
+        owner = get_owner(id_code, workers)
+        async_to_sync(channel_layer.send)(get_worker_channel(owner), get_command(id_code, "start"))
@@ -0,0 +1,344 @@
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.db import connections
+from unittest import mock
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from authorization.models import User
+from game_rooms.models import RoomModel
+from game_rooms.redis_client import aclose_async_redis
+from game_rooms.tasks import flush_lobby_outbox
+import asyncio
+import math
+import multiprocessing
+import random
+import time
+from . import engine, bots, sharding
+from .engine import encode_bid, GameError, GameState
+from .models import GameCheckpoint
+from .probability import bid_probabilities, bid_probability, get_tail_table
+from .shard import GameShard
+from .worker import run_worker
+
+
+def hand(*faces):
+    return sum(engine.FACE_UNITS[face] for face in faces)
+
+
+class BidEncodingTest(TestCase):
+
+    def test_encoded_bids_compare_by_the_rules(self):
+        self.assertGreater(encode_bid(2, 3), encode_bid(2, 2))
+        self.assertGreater(encode_bid(3, 3), encode_bid(2, 3))
+        self.assertGreater(encode_bid(4, 2), encode_bid(3, 3))
+        self.assertGreater(encode_bid(5, 4), encode_bid(4, 2))
+        self.assertEqual(engine.decode_bid(encode_bid(5, 4)), (5, 4))
+
+    def test_bid_validation(self):
+        self.assertTrue(engine.is_valid_bid(encode_bid(1, 6), engine.NO_BID, 10))
+        self.assertFalse(engine.is_valid_bid(encode_bid(2, 2), encode_bid(2, 3), 10))
+        self.assertFalse(engine.is_valid_bid(encode_bid(2, 7), encode_bid(2, 3), 10))
+        self.assertFalse(engine.is_valid_bid(encode_bid(11, 2), engine.NO_BID, 10))
+        self.assertFalse(engine.is_valid_bid(encode_bid(0, 6), engine.NO_BID, 10))
+
+
+class GameEngineTest(TestCase):
+
+    def setUp(self):
+        # Table counts: three 1's, two 3's, one 5.
+        self.state = GameState(hands=[hand(1, 1, 3), hand(1, 3, 5)], dice=bytearray([3, 3]))
+
+    def test_counts_include_wild_ones(self):
+        self.assertEqual(engine.count_matching(self.state.counts(), 3, wild_ones=True), 5)
+        self.assertEqual(engine.count_matching(self.state.counts(), 3, wild_ones=False), 2)
+        self.assertEqual(engine.count_matching(self.state.counts(), 1, wild_ones=True), 3)
+        self.assertEqual(engine.hand_faces(self.state.hands[1]), [1, 3, 5])
+
+    def test_bid_out_of_turn_is_refused(self):
+        with self.assertRaises(GameError):
+            engine.place_bid(self.state, 1, encode_bid(2, 3))
+
+    def test_zero_quantity_bid_is_refused(self):
+        with self.assertRaises(GameError):
+            engine.place_bid(self.state, 0, encode_bid(0, 6))
+
+    def test_place_bid_returns_new_state(self):
+        state = engine.place_bid(self.state, 0, encode_bid(2, 3))
+
+        self.assertEqual((state.bid, state.bidder, state.turn), (encode_bid(2, 3), 0, 1))
+        self.assertEqual(self.state.bid, engine.NO_BID)
+
+    def test_liar_on_true_bid_costs_the_challenger(self):
+        state = engine.place_bid(self.state, 0, encode_bid(5, 3))
+        result = engine.challenge(state, 1)
+
+        self.assertEqual(result.actual, 5)
+        self.assertEqual(list(result.losses), [0, 1])
+
+    def test_liar_on_false_bid_costs_the_bidder(self):
+        state = engine.place_bid(self.state, 0, encode_bid(6, 3))
+        result = engine.challenge(state, 1)
+
+        self.assertEqual(list(result.losses), [1, 0])
+        self.assertEqual(result.starter, 0)
+
+    def test_spot_on(self):
+        state = engine.place_bid(self.state, 0, encode_bid(5, 3))
+        self.assertEqual(list(engine.challenge(state, 1, spot_on=True).losses), [1, 0])
+
+        state = engine.place_bid(self.state, 0, encode_bid(4, 3))
+        self.assertEqual(list(engine.challenge(state, 1, spot_on=True).losses), [0, 2])
+
+    def test_game_ends_with_one_player_left(self):
+        rng = random.Random(7)
+        state = engine.new_game(3, rng)
+        self.assertEqual(sum(engine.count_face(state.counts(), face) for face in range(1, 7)), 15)
+
+        while engine.winner(state) is None:
+            state = engine.place_bid(state, state.turn, encode_bid(state.total_dice(), 6))
+            result = engine.challenge(state, state.turn)
+            state = engine.resolve_round(state, result, rng)
+            self.assertEqual([len(engine.hand_faces(hand)) for hand in state.hands], list(state.dice))
+
+        self.assertEqual(state.dice[engine.winner(state)], state.total_dice())
+
+
+def naive_tail(unknown, needed, p):
+    return sum(math.comb(unknown, k) * p ** k * (1 - p) ** (unknown - k) for k in range(max(needed, 0), unknown + 1))
+
+
+class BidProbabilityTest(TestCase):
+
+    def setUp(self):
+        self.state = GameState(hands=[hand(1, 3, 3, 5, 6), hand(2, 2, 4, 4, 6), hand(1, 1, 2, 3, 4)],
+                               dice=bytearray([5, 5, 5]), bid=encode_bid(4, 3), bidder=2)
+
+    def test_every_following_bid_matches_naive_binomial(self):
+        bids, probabilities = bid_probabilities(self.state, 0)
+
+        self.assertEqual(len(bids), 15 * 6 - (4 * 6 - 3))
+        self.assertTrue(all(bid > self.state.bid for bid in bids))
+        for bid, probability in zip(bids.tolist(), probabilities.tolist()):
+            quantity, face = engine.decode_bid(bid)
+            known = engine.count_matching(self.state.hands[0], face, wild_ones=True)
+            p = 1 / 6 if face == 1 else 1 / 3
+            self.assertAlmostEqual(probability, naive_tail(10, quantity - known, p))
+
+    def test_spectators_know_no_dice(self):
+        expected = naive_tail(15, 5, 1 / 3)
+
+        self.assertAlmostEqual(bid_probability(self.state, encode_bid(5, 3)), expected)
+        self.assertAlmostEqual(bid_probability(self.state, encode_bid(3, 3), player=0), 1.0)
+
+    def test_tables_are_cached_and_read_only(self):
+        table = get_tail_table(10, True)
+
+        self.assertIs(get_tail_table(10, True), table)
+        with self.assertRaises(ValueError):
+            table[1, 1] = 0
+
+
+class BotTest(TestCase):
+
+    def test_bot_calls_liar_on_impossible_bid(self):
+        state = GameState(hands=[hand(2, 2), hand(4, 4)], dice=bytearray([2, 2]), bid=encode_bid(4, 6), bidder=1)
+
+        self.assertEqual(bots.choose_move(state, 0), (bots.LIAR, encode_bid(4, 6)))
+
+    def test_bot_opens_with_a_safe_bid(self):
+        state = GameState(hands=[hand(3, 3, 3), hand(4, 4, 4)], dice=bytearray([3, 3]))
+
+        kind, bid = bots.choose_move(state, 0, random.Random(1))
+
+        self.assertEqual(kind, bots.BID)
+        self.assertEqual(bid_probability(state, bid, player=0), 1.0)
+
+    def test_bots_play_a_game_to_the_end(self):
+        rng = random.Random(3)
+        state = engine.new_game(4, rng)
+
+        while engine.winner(state) is None:
+            state, result = bots.play_move(state, state.turn, bots.choose_move(state, state.turn, rng))
+            if result is not None:
+                state = engine.resolve_round(state, result, rng)
+
+        self.assertGreater(state.round, 5)
+
+
+class HashRingTest(TestCase):
+
+    def test_keys_spread_over_workers(self):
+        ring = sharding.HashRing(["a", "b", "c", "d"], 64)
+        owners = [ring.get_owner(f"room{i}") for i in range(4000)]
+
+        for worker in "abcd":
+            self.assertGreater(owners.count(worker), 600)
+        self.assertIsNone(sharding.HashRing([], 64).get_owner("room"))
+
+    def test_adding_a_worker_moves_its_share_only(self):
+        before = sharding.HashRing(["a", "b", "c", "d"], 64)
+        after = sharding.HashRing(["a", "b", "c", "d", "e"], 64)
+        keys = [f"room{i}" for i in range(4000)]
+
+        moved = [key for key in keys if before.get_owner(key) != after.get_owner(key)]
+
+        self.assertTrue(all(after.get_owner(key) == "e" for key in moved))
+        self.assertLess(len(moved), len(keys) * 0.35)
+
+
+@mock.patch.object(flush_lobby_outbox, "apply_async")
+class GameShardTest(TransactionTestCase):
+
+    def setUp(self):
+        self.author = User.objects.create(username="author", password="password123")
+        self.player = User.objects.create(username="player", password="password123")
+        self.room = RoomModel.objects.create(name="room_name", max_players=3, author=self.author)
+        self.room.add_user_to_list(self.player.pk)
+        self.shard = GameShard("worker", random.Random(1))
+
+    def run_command(self, command, shard=None, **data):
+        shard = shard or self.shard
+
+        async def run():
+            try:
+                return await shard.run(self.room.id_code, sharding.get_command(self.room.id_code, command, **data))
+            finally:
+                await get_channel_layer().close_pools()
+
+        return async_to_sync(run)()
+
+    def test_rounds_are_checkpointed_at_their_boundaries(self, apply_async):
+        table = self.run_command("start")
+        self.assertEqual(table.seats, [self.author.pk, self.player.pk])
+        self.assertEqual(GameCheckpoint.objects.get(room=self.room).round, 1)
+
+        bidder = table.seats[table.state.turn]
+        with self.assertNumQueries(0):
+            self.run_command("bid", user_id=bidder, bid=encode_bid(1, 2))
+        challenger = table.seats[table.state.turn]
+        self.run_command("challenge", user_id=challenger)
+
+        checkpoint = GameCheckpoint.objects.get(room=self.room)
+        self.assertEqual(checkpoint.round, 2)
+        self.assertEqual(checkpoint.owner, "worker")
+        self.assertEqual(engine.load_state(checkpoint.state).dice, table.state.dice)
+
+    def test_commands_are_checked(self, apply_async):
+        with self.assertRaisesMessage(GameError, "This room has no game."):
+            self.run_command("state")
+        table = self.run_command("start")
+
+        with self.assertRaisesMessage(GameError, "This user does not play at this table."):
+            self.run_command("bid", user_id=0, bid=encode_bid(1, 2))
+        waiting = table.seats[1 - table.state.turn]
+        with self.assertRaises(GameError):
+            self.run_command("bid", user_id=waiting, bid=encode_bid(1, 2))
+
+    def test_started_room_without_start_command_gets_its_game(self, apply_async):
+        RoomModel.objects.filter(pk=self.room.pk).update(is_started=True)
+
+        table = self.run_command("state")
+        self.assertEqual(table.seats, [self.author.pk, self.player.pk])
+        self.assertEqual(table.state.round, 1)
+        self.assertEqual(GameCheckpoint.objects.get(room=self.room).round, 1)
+
+    def test_free_seats_are_taken_by_bots(self, apply_async):
+        self.room.delete_user_from_list(self.player.pk)
+        table = self.run_command("start")
+
+        self.assertEqual(table.seats, [self.author.pk, None])
+        self.assertEqual(table.seats[table.state.turn], self.author.pk)
+
+    def play_round(self, shard):
+        table = self.run_command("state", shard=shard)
+        self.run_command("bid", shard=shard, user_id=table.seats[table.state.turn], bid=encode_bid(1, 2))
+        return self.run_command("challenge", shard=shard, user_id=table.seats[table.state.turn])
+
+    def test_table_whose_ownership_comes_back_is_restored(self, apply_async):
+        self.run_command("start")
+        other = GameShard("other", random.Random(2))
+
+        # The ring moves the table to the other worker, which plays a round, then gives it back.
+        self.shard.set_workers(["other"])
+        self.assertNotIn(self.room.id_code, self.shard.tables)
+        self.assertEqual(self.play_round(other).state.round, 2)
+        self.shard.set_workers(["worker"])
+
+        table = self.run_command("state")
+        self.assertEqual(table.state.round, 2)
+        self.assertEqual(table.state.dice, other.tables[self.room.id_code].state.dice)
+        self.assertEqual(self.play_round(self.shard).state.round, 3)
+        self.assertEqual(GameCheckpoint.objects.get(room=self.room).owner, "worker")
+
+    def test_stale_copy_does_not_overwrite_a_newer_checkpoint(self, apply_async):
+        self.run_command("start")
+        other = GameShard("other", random.Random(2))
+        self.play_round(other)
+
+        with self.assertRaisesMessage(GameError, "This table was taken over by another worker."):
+            self.play_round(self.shard)
+        self.assertNotIn(self.room.id_code, self.shard.tables)
+        checkpoint = GameCheckpoint.objects.get(room=self.room)
+        self.assertEqual((checkpoint.owner, checkpoint.round), ("other", 2))
+        self.assertEqual(self.run_command("state").state.round, 2)
+
+
+@override_settings(GAME_WORKERS_KEY="game:workers:test", GAME_WORKER_HEARTBEAT=0.1, GAME_WORKER_TTL=2.0)
+@mock.patch.object(flush_lobby_outbox, "apply_async")
+class GameWorkerHandoffTest(TransactionTestCase):
+    """Two worker processes; the owner of a table dies and the other one resumes it from its checkpoint."""
+
+    def setUp(self):
+        sharding.get_redis().delete("game:workers:test")
+        self.author = User.objects.create(username="author", password="password123")
+        self.player = User.objects.create(username="player", password="password123")
+        self.room = RoomModel.objects.create(name="room_name", max_players=3, author=self.author)
+        self.room.add_user_to_list(self.player.pk)
+
+    def start_worker(self, worker_id):
+        connections.close_all()
+        process = multiprocessing.get_context("fork").Process(target=run_worker, args=(worker_id,), daemon=True)
+        process.start()
+        self.addCleanup(process.kill)
+        return process
+
+    def wait_for_workers(self, expected):
+        deadline = time.monotonic() + 10
+        while set(sharding.get_live_workers()) != expected:
+            self.assertLess(time.monotonic(), deadline, "Game workers did not register in time.")
+            time.sleep(0.05)
+
+    def send(self, command, **data):
+        async def call():
+            channel_layer = get_channel_layer()
+            try:
+                reply_channel = await channel_layer.new_channel()
+                await sharding.asend_command(self.room.id_code, command, reply_channel=reply_channel, **data)
+                return await asyncio.wait_for(channel_layer.receive(reply_channel), 20)
+            finally:
+                await aclose_async_redis()
+                await channel_layer.close_pools()
+
+        reply = async_to_sync(call)()
+        self.assertTrue(reply["ok"], reply.get("error"))
+        return reply
+
+    def test_survivor_resumes_the_table_of_a_dead_owner(self, apply_async):
+        workers = {"worker-a": self.start_worker("worker-a"), "worker-b": self.start_worker("worker-b")}
+        self.wait_for_workers(set(workers))
+
+        reply = self.send("start")
+        owner, state = reply["owner"], reply["state"]
+        self.send("bid", user_id=state["seats"][state["turn"]], bid=encode_bid(1, 2))
+        state = self.send("state")["state"]
+        state = self.send("challenge", user_id=state["seats"][state["turn"]])["state"]
+        self.assertEqual(state["round"], 2)
+
+        workers.pop(owner).kill()
+        survivor, = workers
+        self.wait_for_workers({survivor})
+
+        reply = self.send("state")
+        self.assertEqual(reply["owner"], survivor)
+        self.assertEqual(reply["state"]["round"], 2)
+        self.assertEqual(reply["state"]["dice"], state["dice"])
+        self.assertEqual(GameCheckpoint.objects.get(room=self.room).owner, owner)
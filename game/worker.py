@@ -0,0 +1,51 @@
+"""
+Game worker process: serves the tables it owns (game.shard) on its channel of the channel layer.
+
+    python manage.py game_worker --worker-id game-1
+"""
+
+import asyncio
+import logging
+import os
+import socket
+from channels.layers import get_channel_layer
+from django.conf import settings
+from . import sharding
+from .shard import GameShard
+
+logger = logging.getLogger(__name__)
+
+
+def get_default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+async def keep_alive(shard):
+    while True:
+        await asyncio.sleep(settings.GAME_WORKER_HEARTBEAT)
+        shard.set_workers(await sharding.aheartbeat(shard.worker_id))
+
+
+async def serve(worker_id):
+    """Register the worker and handle the commands sent to it until cancelled."""
+    shard = GameShard(worker_id)
+    shard.set_workers(await sharding.aheartbeat(worker_id))
+    heartbeat = asyncio.create_task(keep_alive(shard))
+    channel_layer = get_channel_layer()
+    channel = sharding.get_worker_channel(worker_id)
+    logger.info("Game worker %s listening on %s", worker_id, channel)
+
+    try:
+        while True:
+            message = await channel_layer.receive(channel)
+            try:
+                await shard.handle(message)
+            except Exception:
+                logger.exception("Game worker %s failed on %s", worker_id, message)
+    finally:
+        heartbeat.cancel()
+        await sharding.aunregister(worker_id)
+
+
+def run_worker(worker_id):
+    asyncio.run(serve(worker_id))
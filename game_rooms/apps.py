@@ -1,4 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def create_id_code_sequences(sender, using, **kwargs):
+    from .fields import IdCodeField
+
+    for model in sender.get_models():
+        for field in model._meta.local_fields:
+            if isinstance(field, IdCodeField):
+                field.create_sequence(using)
 
 
 class GameRoomsConfig(AppConfig):
@@ -6,4 +16,5 @@ class GameRoomsConfig(AppConfig):
     name = 'game_rooms'
 
     def ready(self) -> None:
-        import game_rooms.signals
\ No newline at end of file
+        import game_rooms.signals
+        post_migrate.connect(create_id_code_sequences, sender=self)
@@ -0,0 +1,134 @@
+"""
+Per-connection send accounting of lobby sockets.
+
+The channel layer buffers the messages of every socket in a queue bounded by
+GAME_ROOMS_CHANNEL_CAPACITY and silently drops the oldest ones once it is full, so a client
+that does not keep up would first lag behind the lobby and then miss deltas.
+
+Every lobby socket keeps a `LobbyStream`: the version it was last sent and the versions of
+the incoming message (see game_rooms.lobby). A message is forwarded while the socket keeps up.
+It is coalesced into a fresh snapshot instead when:
+- its versions show that deltas were lost on the way (`lobby_deltas_dropped`),
+- more than GAME_ROOMS_LOBBY_MAX_BACKLOG messages wait behind it for this socket, or messages
+  kept waiting for more than GAME_ROOMS_LOBBY_MAX_LAG seconds: the socket has not caught up
+  (found no message waiting behind the one it handles) for that long.
+Lag is measured on the socket's own monotonic clock, never against the clock of the host that
+sent the message, so skew between hosts cannot look like lag.
+The snapshot makes every delta still queued for the socket obsolete; they are skipped without
+being sent (`lobby_deltas_coalesced`). A socket needing more than GAME_ROOMS_LOBBY_MAX_RESYNCS
+snapshots within GAME_ROOMS_LOBBY_RESYNC_WINDOW seconds is closed with a resume token
+(`lobby_slow_disconnects`): reconnecting with `?resume=<token>` skips the snapshot when the
+lobby did not change in the meantime.
+"""
+
+import time
+from urllib.parse import parse_qs
+from django.conf import settings
+from django.core import signing
+
+FORWARD = "forward"
+SKIP = "skip"
+RESYNC = "resync"
+
+RESUME_SALT = "game_rooms.lobby.resume"
+SLOW_CONSUMER_CLOSE_CODE = 4008
+
+
+def get_backlog(channel_layer, channel_name):
+    """
+    Return how many messages wait in this process for the socket, or None if the channel layer does not tell.
+
+    Channel layers have no API for it. channels_redis buffers the messages it pulled for the sockets
+    of a process in `receive_buffer` ({channel: queue}); it is read when it has that shape and
+    ignored otherwise, leaving only the version checks.
+    """
+    buffers = getattr(channel_layer, "receive_buffer", None)
+    if not isinstance(buffers, dict):
+        return None
+    queue = buffers.get(channel_name)
+    if queue is None:
+        return 0
+    qsize = getattr(queue, "qsize", None)
+    return qsize() if callable(qsize) else None
+
+
+class LobbyStream:
+    """
+    What one lobby socket was sent, and whether it keeps up.
+
+    Methods:
+    - reset(version): Records that a snapshot of `version` was sent.
+    - get_action(event, backlog): Returns FORWARD, SKIP or RESYNC for a lobby message, and counts dropped deltas.
+      `backlog` is the result of get_backlog; a socket with nothing waiting (or an unknown backlog) has caught up.
+    - must_disconnect(): Whether the socket needed too many snapshots lately.
+    - pop_counters(): Returns and resets {metric: amount} counted since the last call.
+    """
+
+    __slots__ = ("version", "caught_up_at", "resyncs", "counters")
+
+    def __init__(self):
+        self.version = 0
+        self.caught_up_at = time.monotonic()
+        self.resyncs = []
+        self.counters = {}
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def reset(self, version):
+        self.version = version
+        self.caught_up_at = time.monotonic()
+
+    def get_action(self, event, backlog=None):
+        first, last = event["first_version"], event["version"]
+        if last <= self.version:
+            self.count("lobby_deltas_coalesced")
+            return SKIP
+
+        if first > self.version + 1:
+            self.count("lobby_deltas_dropped", first - self.version - 1)
+            return self.resync()
+
+        now = time.monotonic()
+        if not backlog:
+            self.caught_up_at = now
+        elif backlog > settings.GAME_ROOMS_LOBBY_MAX_BACKLOG \
+                or now - self.caught_up_at > settings.GAME_ROOMS_LOBBY_MAX_LAG:
+            self.count("lobby_deltas_coalesced")
+            return self.resync()
+
+        self.version = last
+        return FORWARD
+
+    def resync(self):
+        now = time.monotonic()
+        self.resyncs = [at for at in self.resyncs if now - at < settings.GAME_ROOMS_LOBBY_RESYNC_WINDOW]
+        self.resyncs.append(now)
+        self.count("lobby_snapshots_resent")
+        return RESYNC
+
+    def must_disconnect(self):
+        return len(self.resyncs) > settings.GAME_ROOMS_LOBBY_MAX_RESYNCS
+
+    def pop_counters(self):
+        counters, self.counters = self.counters, {}
+        return counters
+
+
+def get_resume_token(view, version):
+    return signing.dumps({"view": view, "version": version}, salt=RESUME_SALT)
+
+
+def read_resume_token(token):
+    """Return (view, version) of a resume token, or None if it is invalid or older than GAME_ROOMS_LOBBY_RESUME_TTL."""
+    try:
+        data = signing.loads(token, salt=RESUME_SALT, max_age=settings.GAME_ROOMS_LOBBY_RESUME_TTL)
+    except signing.BadSignature:
+        return None
+    return data["view"], data["version"]
+
+
+def get_requested_resume(scope):
+    """Return (view, version) of the resume token in the query string of a socket (`?resume=`), or None."""
+    tokens = parse_qs(scope.get("query_string", b"").decode()).get("resume")
+    return read_resume_token(tokens[-1]) if tokens else None
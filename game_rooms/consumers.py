@@ -1,59 +1,310 @@
-from channels.generic.websocket import WebsocketConsumer
+from channels.generic.websocket import WebsocketConsumer, AsyncWebsocketConsumer
 import json
 from asgiref.sync import async_to_sync
+from .backpressure import (
+    FORWARD, RESYNC, SLOW_CONSUMER_CLOSE_CODE, LobbyStream, get_backlog, get_requested_resume, get_resume_token,
+)
+from .lobby import get_lobby_version, aget_lobby_version
+from .lobby_cache import get_snapshot, aget_snapshot
+from .lobby_views import VIEWS, get_group_name, get_requested_view
+from .metrics import incr_many, aincr_many
 from .models import RoomModel
-from .serializers import RoomSerializer
-from django.conf import settings
+from .room_events import get_room_group_name
+from . import wire
+
+
+def parse_message(text_data=None, bytes_data=None):
+    """Return the object sent by a client as a JSON text or MessagePack binary frame, or None if it is not one."""
+    try:
+        content = json.loads(text_data) if bytes_data is None else wire.decode_msgpack(bytes_data)
+    except (TypeError, ValueError):
+        return None
+    return content if isinstance(content, dict) else None
 
 
 class RoomConsumer(WebsocketConsumer):
     """
     WebSocket consumer for managing real-time updates for game rooms.
 
+    The client follows one view of the lobby (see game_rooms.lobby_views), chosen with `?view=`
+    in the URL, `all` by default. A socket asking for an unknown view is rejected. Messages are
+    sent in the wire format negotiated as the subprotocol (see game_rooms.wire), JSON by default.
+    A client that falls behind gets a fresh snapshot instead of its queued deltas, and is closed
+    with a resume token if that keeps happening (see game_rooms.backpressure).
+
     Methods:
     - connect(self): Handles WebSocket connection requests.
-        - Adds the channel to the 'rooms' group and accepts the connection.
-        - Retrieves all rooms that have not yet started and sends this data to all members of the 'rooms' group.
+        - Adds the channel to the group of the view and accepts the connection with the selected subprotocol.
+        - Sends the snapshot of the view to the joining client only, or `resumed` when `?resume=`
+          carries a token of the current version of the view.
 
     - disconnect(self, code): Handles WebSocket disconnection requests.
-        - Removes the channel from the 'rooms' group.
+        - Removes the channel from the group of the view.
         - Logs a message when a user disconnects.
 
-    - chat_message(self, event): Handles messages from the 'rooms' group.
-        - Receives a message event and sends the message data back to the WebSocket client.
+    - receive(self, text_data, bytes_data): Handles messages from the client.
+        - {"type": "snapshot"} asks for a fresh snapshot, e.g. after the client noticed a version gap.
+        - {"type": "subscribe", "view": "free"} switches to another view and sends its snapshot.
 
-    - get_all_rooms(self): Retrieves all rooms that have not yet started from the database.
-        - Serializes the data using `RoomSerializer` and returns it.
-    """
+    - chat_message(self, event): Handles messages from the group of the view.
+        - Forwards the already encoded frame of a versioned delta event in the wire format of the client,
+          or coalesces it into a fresh snapshot when the client fell behind.
 
+    - send_snapshot(self): Sends the versioned snapshot of the view, already encoded in the lobby cache, to this client.
 
-    room_group_name = settings.GAME_ROOMS_CHANNEL_GROUP_NAME
+    - close_slow(self): Sends a resume token to a client that keeps falling behind and closes the connection.
+    """
+
+    view = None
+    wire_format = wire.DEFAULT_FORMAT
 
     def connect(self):
+        resume = get_requested_resume(self.scope)
+        view = resume[0] if resume is not None else get_requested_view(self.scope)
+        if view is None:
+            self.close()
+            return
+
+        self.view = view
+        self.stream = LobbyStream()
+        subprotocol = wire.select_subprotocol(self.scope)
+        self.wire_format = subprotocol or wire.DEFAULT_FORMAT
+        async_to_sync(self.channel_layer.group_add)(get_group_name(view), self.channel_name)
+        self.accept(subprotocol)
 
-        async_to_sync(self.channel_layer.group_add)(
-            self.room_group_name, self.channel_name
-        )
-        self.accept()
-        rooms = self.get_all_rooms()
-        async_to_sync(self.channel_layer.group_send)(
-            self.room_group_name, {"type": "chat.message", "message": rooms}
-            )
+        if resume is not None and get_lobby_version(view) == resume[1]:
+            self.stream.reset(resume[1])
+            self.send_message({"type": "resumed", "version": resume[1]})
+        else:
+            self.send_snapshot()
 
     def disconnect(self, code):
-        async_to_sync(self.channel_layer.group_discard)(
-            self.room_group_name, self.channel_name
-        )
+        if self.view is not None:
+            async_to_sync(self.channel_layer.group_discard)(get_group_name(self.view), self.channel_name)
         print("User disconnected")
 
+    def receive(self, text_data=None, bytes_data=None):
+        content = parse_message(text_data, bytes_data)
+        if content is None or self.view is None:
+            return
+
+        if content.get("type") == "snapshot":
+            self.send_snapshot()
+        elif content.get("type") == "subscribe" and content.get("view") in VIEWS:
+            async_to_sync(self.channel_layer.group_discard)(get_group_name(self.view), self.channel_name)
+            self.view = content["view"]
+            async_to_sync(self.channel_layer.group_add)(get_group_name(self.view), self.channel_name)
+            self.send_snapshot()
+
     def chat_message(self, event):
-        message = event['message']
+        if event["view"] != self.view:
+            return
+
+        action = self.stream.get_action(event, get_backlog(self.channel_layer, self.channel_name))
+        if action == FORWARD:
+            self.send(**wire.get_frame_kwargs(event['frames'][self.wire_format]))
+        elif action == RESYNC:
+            if self.stream.must_disconnect():
+                self.close_slow()
+            else:
+                self.send_snapshot()
+
+        counters = self.stream.pop_counters()
+        if counters:
+            incr_many(counters)
+
+    def send_snapshot(self):
+        version, frame = get_snapshot(self.view, self.wire_format)
+        self.stream.reset(version)
+        self.send(**wire.get_frame_kwargs(frame))
+
+    def send_message(self, message):
+        self.send(**wire.get_frame_kwargs(wire.encode({'message': message}, self.wire_format)))
+
+    def close_slow(self):
+        self.stream.count("lobby_slow_disconnects")
+        version = self.stream.version
+        self.send_message({"type": "resume", "token": get_resume_token(self.view, version), "version": version})
+        async_to_sync(self.channel_layer.group_discard)(get_group_name(self.view), self.channel_name)
+        self.view = None
+        self.close(code=SLOW_CONSUMER_CLOSE_CODE)
+
+
+class AsyncRoomConsumer(AsyncWebsocketConsumer):
+    """
+    Native asyncio version of `RoomConsumer` with the same protocol.
+
+    Group membership and the cached snapshot are awaited on the event loop, and a cold cache is
+    loaded with the async ORM, so an idle lobby socket does not hold a thread from the
+    `sync_to_async` pool.
+    Selected with `settings.GAME_ROOMS_CONSUMER = "async"`.
+
+    Methods:
+    - connect(self): Adds the channel to the group of the requested view, accepts the connection with the selected
+      subprotocol and sends the snapshot, or `resumed` for a resume token of the current version.
+    - disconnect(self, code): Removes the channel from the group of the view.
+    - receive(self, text_data, bytes_data): {"type": "snapshot"} asks for a fresh snapshot,
+      {"type": "subscribe", "view": ...} switches to another view.
+    - chat_message(self, event): Forwards the frame of a versioned delta event from the group of the view to the client,
+      or coalesces it into a fresh snapshot when the client fell behind.
+    - send_snapshot(self): Sends the versioned snapshot of the view to this client.
+    - close_slow(self): Sends a resume token to a client that keeps falling behind and closes the connection.
+    """
+
+    view = None
+    wire_format = wire.DEFAULT_FORMAT
+
+    async def connect(self):
+        resume = get_requested_resume(self.scope)
+        view = resume[0] if resume is not None else get_requested_view(self.scope)
+        if view is None:
+            await self.close()
+            return
+
+        self.view = view
+        self.stream = LobbyStream()
+        subprotocol = wire.select_subprotocol(self.scope)
+        self.wire_format = subprotocol or wire.DEFAULT_FORMAT
+        await self.channel_layer.group_add(get_group_name(view), self.channel_name)
+        await self.accept(subprotocol)
+
+        if resume is not None and await aget_lobby_version(view) == resume[1]:
+            self.stream.reset(resume[1])
+            await self.send_message({"type": "resumed", "version": resume[1]})
+        else:
+            await self.send_snapshot()
+
+    async def disconnect(self, code):
+        if self.view is not None:
+            await self.channel_layer.group_discard(get_group_name(self.view), self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        content = parse_message(text_data, bytes_data)
+        if content is None or self.view is None:
+            return
+
+        if content.get("type") == "snapshot":
+            await self.send_snapshot()
+        elif content.get("type") == "subscribe" and content.get("view") in VIEWS:
+            await self.channel_layer.group_discard(get_group_name(self.view), self.channel_name)
+            self.view = content["view"]
+            await self.channel_layer.group_add(get_group_name(self.view), self.channel_name)
+            await self.send_snapshot()
+
+    async def chat_message(self, event):
+        if event["view"] != self.view:
+            return
+
+        action = self.stream.get_action(event, get_backlog(self.channel_layer, self.channel_name))
+        if action == FORWARD:
+            await self.send(**wire.get_frame_kwargs(event['frames'][self.wire_format]))
+        elif action == RESYNC:
+            if self.stream.must_disconnect():
+                await self.close_slow()
+            else:
+                await self.send_snapshot()
+
+        counters = self.stream.pop_counters()
+        if counters:
+            await aincr_many(counters)
+
+    async def send_snapshot(self):
+        version, frame = await aget_snapshot(self.view, self.wire_format)
+        self.stream.reset(version)
+        await self.send(**wire.get_frame_kwargs(frame))
+
+    async def send_message(self, message):
+        await self.send(**wire.get_frame_kwargs(wire.encode({'message': message}, self.wire_format)))
+
+    async def close_slow(self):
+        self.stream.count("lobby_slow_disconnects")
+        version = self.stream.version
+        await self.send_message({"type": "resume", "token": get_resume_token(self.view, version), "version": version})
+        await self.channel_layer.group_discard(get_group_name(self.view), self.channel_name)
+        self.view = None
+        await self.close(code=SLOW_CONSUMER_CLOSE_CODE)
+
+
+class GameRoomConsumer(AsyncWebsocketConsumer):
+    """
+    WebSocket consumer of one room, served at `ws/room/<id_code>/`.
+
+    The socket joins the group of its room only (game_rooms.room_events) and receives its
+    `join`/`leave` events and the `bid`/`challenge`/`roll` events of its game. Authenticated
+    players play through it; their commands are sent to the game worker owning the table
+    (game.sharding), which answers this socket with a `reply` carrying the public state and
+    the player's dice. Like the lobby, it speaks the wire format negotiated as the subprotocol.
+
+    Methods:
+    - connect(self): Rejects unknown rooms, otherwise joins the group of the room and accepts the connection.
+    - disconnect(self, code): Leaves the group of the room.
+    - receive(self, text_data, bytes_data): {"type": "bid", "bid": [quantity, face]},
+      {"type": "challenge", "spot_on": false} or {"type": "state"}.
+    - room_event(self, event): Forwards the frame of an event of the room to the client.
+    - game_reply(self, event): Sends the answer of the game worker to the client.
+    """
+
+    id_code = None
+    wire_format = wire.DEFAULT_FORMAT
+
+    async def connect(self):
+        id_code = self.scope["url_route"]["kwargs"]["id_code"]
+        if not await RoomModel.objects.filter(id_code=id_code).aexists():
+            await self.close()
+            return
+
+        self.id_code = id_code
+        subprotocol = wire.select_subprotocol(self.scope)
+        self.wire_format = subprotocol or wire.DEFAULT_FORMAT
+        await self.channel_layer.group_add(get_room_group_name(id_code), self.channel_name)
+        await self.accept(subprotocol)
+
+    async def disconnect(self, code):
+        if self.id_code is not None:
+            await self.channel_layer.group_discard(get_room_group_name(self.id_code), self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        from game import engine, sharding
+
+        content = parse_message(text_data, bytes_data)
+        if content is None:
+            return
+
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated:
+            await self.send_error("Authentication credentials were not provided.")
+            return
+
+        command, data = content.get("type"), {}
+        if command == "bid":
+            try:
+                quantity, face = (int(value) for value in content["bid"])
+            except (KeyError, TypeError, ValueError):
+                quantity = face = 0
+            if quantity < 1 or not 1 <= face <= engine.FACES:
+                await self.send_error("A bid is [quantity, face].")
+                return
+            data["bid"] = engine.encode_bid(quantity, face)
+        elif command == "challenge":
+            data["spot_on"] = bool(content.get("spot_on"))
+        elif command != "state":
+            await self.send_error(f"Unknown command '{command}'.")
+            return
+
+        owner = await sharding.asend_command(self.id_code, command, user_id=user.pk,
+                                             reply_channel=self.channel_name, **data)
+        if owner is None:
+            await self.send_error("No game worker is available.")
+
+    async def room_event(self, event):
+        await self.send(**wire.get_frame_kwargs(event['frames'][self.wire_format]))
+
+    async def game_reply(self, event):
+        reply = {key: value for key, value in event.items() if key != "type"}
+        await self.send_message({"type": "reply", **reply})
 
-        self.send(text_data=json.dumps({
-            'message': message,
-        }))
+    async def send_error(self, error):
+        await self.send_message({"type": "error", "error": error})
 
-    def get_all_rooms(self):
-        rooms = RoomModel.objects.filter(is_started=False)
-        serializer = RoomSerializer(instance=rooms, many=True)
-        return serializer.data
\ No newline at end of file
+    async def send_message(self, message):
+        await self.send(**wire.get_frame_kwargs(wire.encode({'message': message}, self.wire_format)))
@@ -1,8 +1,9 @@
+from django.conf import settings
 from rest_framework.response import Response
 from rest_framework import status
+import hmac
 import jwt
-from django.conf import settings
-from authorization.models import User
+from authorization.token_service import authenticate
 
 def jwt_required(funct):
     def wrapper(self, request, *args, **kwargs):
@@ -10,13 +11,14 @@ def jwt_required(funct):
         token = request.headers.get("Authorization", None)
         if token is not None or token != "":
             try:
-                payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
+                user = authenticate(token)
             except jwt.ExpiredSignatureError:
                 return Response({'errors': 'Token has expired.'}, status=status.HTTP_401_UNAUTHORIZED)
             except jwt.InvalidTokenError:
                 return Response({'errors': 'Invalid token.'}, status=status.HTTP_401_UNAUTHORIZED)
 
-            user = User.objects.get(pk=payload["user_id"])
+            if user is None:
+                return Response({'errors': 'User not found.'}, status=status.HTTP_401_UNAUTHORIZED)
             request.data["user"] = user
         else:
             return Response({'errors': 'Token is missing.'}, status=status.HTTP_401_UNAUTHORIZED)
@@ -25,3 +27,16 @@ def jwt_required(funct):
     return wrapper
 
 
+def metrics_token_required(funct):
+    """Serve the view only to requests carrying `Authorization: Bearer <GAME_ROOMS_METRICS_TOKEN>`."""
+    def wrapper(self, request, *args, **kwargs):
+        expected = settings.GAME_ROOMS_METRICS_TOKEN
+        if not expected:
+            return Response({'errors': 'Metrics are disabled.'}, status=status.HTTP_404_NOT_FOUND)
+
+        token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if not hmac.compare_digest(token.encode(), expected.encode()):
+            return Response({'errors': 'Invalid metrics token.'}, status=status.HTTP_401_UNAUTHORIZED)
+        return funct(self, request, *args, **kwargs)
+
+    return wrapper
@@ -1,7 +1,49 @@
 from django.db.models import CharField
+from django.db import connections, router
+from django.conf import settings
 from rest_framework.validators import ValidationError
+import hashlib
 import string
-import random
+
+LETTERS = string.ascii_uppercase
+DIGITS = string.digits
+CODE_SPACE = (len(LETTERS) * len(DIGITS)) ** 3  # 17 576 000 codes
+HALF_BITS = 13  # Feistel network over 2 ** 26 >= CODE_SPACE values
+HALF_MASK = (1 << HALF_BITS) - 1
+ROUNDS = 4
+
+
+def get_round_keys():
+    digest = hashlib.sha256(settings.GAME_ROOMS_ID_CODE_KEY.encode()).digest()
+    return [int.from_bytes(digest[4 * i:4 * i + 4], "big") for i in range(ROUNDS)]
+
+
+def permute(number, round_keys):
+    """
+    Map 0 <= number < CODE_SPACE onto 0 <= result < CODE_SPACE, one to one.
+
+    A balanced Feistel network is a permutation of 26-bit integers whatever the round
+    function is; results outside the code space are fed back in (cycle walking) until
+    one lands inside, which keeps the mapping a permutation of the code space.
+    """
+    while True:
+        left, right = number >> HALF_BITS, number & HALF_MASK
+        for key in round_keys:
+            left, right = right, left ^ (((right * 0x9E3779B1 + key) ^ (right >> 5)) & HALF_MASK)
+        number = (left << HALF_BITS) | right
+        if number < CODE_SPACE:
+            return number
+
+
+def encode_code(number):
+    """Encode 0 <= number < CODE_SPACE as 'A1B2C3' (letter, digit, letter, digit, letter, digit)."""
+    symbols = []
+    for _ in range(3):
+        number, digit = divmod(number, len(DIGITS))
+        number, letter = divmod(number, len(LETTERS))
+        symbols.append(f"{LETTERS[letter]}{DIGITS[digit]}")
+    return "".join(reversed(symbols))
+
 
 class IdCodeField(CharField):
     """
@@ -9,15 +51,22 @@ class IdCodeField(CharField):
     The format of the code is three uppercase letters interspersed with three digits.
     Example: 'A1B2C3'
 
+    Codes are allocated without reading the table: a dedicated database sequence hands out
+    0, 1, 2, ... and a keyed Feistel permutation (GAME_ROOMS_ID_CODE_KEY) scatters those
+    numbers over the whole code space, so concurrent inserts never pick the same code and
+    consecutive rooms do not get guessable codes. The sequence cycles after CODE_SPACE
+    rooms, and rooms created before the sequence hold codes it will hand out again: an insert
+    whose code is taken is retried with the next sequence value (see RoomModel.save).
+
     Methods:
     __init__ - Initializes the IdCodeField with a maximum length of 6 characters and ensures
                 that the field's value is unique within the database.
-    generate_code - Generates a unique ID code consisting of 6 characters:
-                    Uppercase letter, digit, uppercase letter, digit, uppercase letter, digit.
-    generate_unique_code - Generates a unique ID code that does not already exist in the database.
-                            Keeps generating codes until a unique one is found.
+    get_sequence_name - Returns the name of the database sequence backing the field.
+    create_sequence - Creates the database sequence if it does not exist (run after migrate).
+    generate_unique_code - Takes the next sequence value and maps it to a unique ID code.
+    is_code_conflict - Tells whether an IntegrityError is a violation of the field's unique constraint.
     pre_save - Prepares the field's value before saving the model instance.
-                Generates a unique ID code and assigns it to the field.
+                Generates a unique ID code for new instances only.
     validate - Validates the value of the field before saving the model instance.
                 Ensures that the field is not empty.
     """
@@ -29,24 +78,31 @@ class IdCodeField(CharField):
         kwargs["unique"] = True
         super().__init__(*args, **kwargs)
 
-    def generate_code(self):
-        """Generate unique id code. Example ('A1B2C3') """
-        letters = string.ascii_uppercase
-        digits = string.digits
-        return f"{random.choice(letters)}{random.choice(digits)}{random.choice(letters)}{random.choice(digits)}{random.choice(letters)}{random.choice(digits)}"
+    def get_sequence_name(self):
+        return f"{self.model._meta.db_table}_{self.column}_seq"
+
+    def create_sequence(self, using):
+        connection = connections[using]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE SEQUENCE IF NOT EXISTS {connection.ops.quote_name(self.get_sequence_name())} "
+                f"MINVALUE 0 MAXVALUE {CODE_SPACE - 1} START 0 CYCLE"
+            )
 
     def generate_unique_code(self):
-        while True:
-            new_code = self.generate_code()
-            try:
-                room = self.model.objects.get(**{self.attname: new_code})
-            except self.model.DoesNotExist:
-                return new_code
+        connection = connections[router.db_for_write(self.model)]
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT nextval(%s)", [self.get_sequence_name()])
+            number = cursor.fetchone()[0]
+        return encode_code(permute(number, get_round_keys()))
 
+    def is_code_conflict(self, error):
+        constraint = getattr(getattr(error.__cause__, "diag", None), "constraint_name", None) or ""
+        return constraint.startswith(f"{self.model._meta.db_table}_{self.column}_")
 
     def pre_save(self, model_instance, add):
-        value = self.generate_unique_code()
-        setattr(model_instance, self.attname, value)
+        if add and not getattr(model_instance, self.attname):
+            setattr(model_instance, self.attname, self.generate_unique_code())
 
         return super().pre_save(model_instance, add)
 
@@ -54,6 +110,3 @@ class IdCodeField(CharField):
         if not value:
             raise ValidationError(f"{self.name} cannot be empty")
         super().validate(value, model_instance)
-
-
-
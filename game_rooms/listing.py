@@ -0,0 +1,124 @@
+"""
+Paginated listing of the lobby for REST clients (`GET /api/room/`).
+
+Lists the rooms that have not started yet, in lobby order (created_at, id), with keyset
+pagination: a page ends with an opaque `next` cursor holding the (created_at, id) of its last
+room, and the following page starts strictly after it. Unlike offsets, a cursor stays correct
+while rooms are created and started, and every page is one index range scan.
+
+Filters, all optional:
+- `is_private=true|false`,
+- `free=true`: rooms with a free seat,
+- `max_players=<2..6>`,
+- `limit=<1..GAME_ROOMS_LIST_MAX_PAGE_SIZE>`, GAME_ROOMS_LIST_PAGE_SIZE by default.
+
+Responses carry a weak ETag made of the lobby version (see game_rooms.lobby), which changes
+with every broadcast change of a room. A poll sending it back in `If-None-Match` is answered
+304 Not Modified from Redis alone. The list is exactly as fresh as the lobby sockets.
+"""
+
+import base64
+import json
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils.dateparse import parse_datetime
+from .models import RoomModel
+from .serializers import get_summary_rows, build_room_summaries
+
+BOOLEANS = {"true": True, "1": True, "false": False, "0": False}
+
+
+def get_list_etag(version):
+    return f'W/"lobby-{version}"'
+
+
+def etag_matches(if_none_match, etag):
+    """Weak comparison of an `If-None-Match` header with an ETag."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in tags)
+
+
+def encode_cursor(created_at, pk):
+    data = json.dumps([created_at.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return (created_at, id) of a cursor; raises ValueError if it is not one."""
+    try:
+        created_at, pk = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        created_at = parse_datetime(created_at)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor.")
+    if created_at is None or not isinstance(pk, int):
+        raise ValueError("Invalid cursor.")
+    return created_at, pk
+
+
+def parse_boolean(params, name):
+    value = params.get(name)
+    if value is None:
+        return None
+    if value.lower() not in BOOLEANS:
+        raise ValueError(f"{name} must be true or false.")
+    return BOOLEANS[value.lower()]
+
+
+def parse_integer(params, name, low, high, default=None):
+    value = params.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        value = None
+    if value is None or not low <= value <= high:
+        raise ValueError(f"{name} must be from {low} to {high}.")
+    return value
+
+
+def get_list_queryset(params):
+    """Return the filtered open rooms asked for by the query parameters; raises ValueError for invalid ones."""
+    queryset = RoomModel.objects.open()
+
+    is_private = parse_boolean(params, "is_private")
+    if is_private is not None:
+        queryset = queryset.filter(is_private=is_private)
+
+    max_players = parse_integer(params, "max_players", 2, 6)
+    if max_players is not None:
+        queryset = queryset.filter(max_players=max_players)
+
+    free = parse_boolean(params, "free")
+    if free is not None:
+        queryset = queryset.filter(player_count__lt=F("max_players")) if free \
+            else queryset.filter(player_count__gte=F("max_players"))
+
+    cursor = params.get("cursor")
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        # (created_at, id) > cursor, with a plain range on created_at the index scan can start from.
+        queryset = queryset.filter(Q(created_at__gte=created_at), Q(created_at__gt=created_at) | Q(id__gt=pk))
+
+    return queryset
+
+
+def get_room_page(params):
+    """
+    Return {"data": [room summary, ...], "next": cursor or None} for the query parameters, in one query.
+
+    Raises ValueError for invalid parameters.
+    """
+    limit = parse_integer(params, "limit", 1, settings.GAME_ROOMS_LIST_MAX_PAGE_SIZE,
+                          default=settings.GAME_ROOMS_LIST_PAGE_SIZE)
+    # One room more than asked tells whether there is a next page.
+    rows = list(get_summary_rows(get_list_queryset(params)[:limit + 1]))
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+
+    return {"data": build_room_summaries(rows), "next": next_cursor}
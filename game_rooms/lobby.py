@@ -0,0 +1,100 @@
+"""
+Lobby state shared by the members of the lobby groups.
+
+The lobby is described by a snapshot (all rooms that have not started yet) and a
+stream of deltas (`create`, `update`, `delete`, and `started` for a batch of rooms
+started by the sweeper). Every delta is tagged with a monotonically increasing version
+taken from a Redis counter, and every snapshot carries the version it is consistent
+with. A client applies deltas whose version is exactly `last_version + 1`; on a gap it
+asks for a fresh snapshot. Snapshots are served from game_rooms.lobby_cache.
+
+Room changes reach the lobby through game_rooms.outbox, which may send several deltas in
+one `batch` message: its `data` lists the deltas in version order and its own version is
+the one of the last delta.
+
+Clients may follow a filtered view of the lobby instead of all of it (game_rooms.lobby_views).
+Each view has its own group and versions, and only receives the deltas of its rooms.
+
+Every message is encoded once per group send, in every wire format (game_rooms.wire). Next to
+the frames, the group message carries its view and its first and last version, which lobby
+sockets use to notice that they missed deltas (game_rooms.backpressure).
+"""
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from .models import RoomModel
+from .redis_client import get_redis, get_async_redis
+from .serializers import serialize_room_summaries
+from . import lobby_cache, lobby_views, wire
+
+
+def get_lobby_version(view=lobby_views.DEFAULT_VIEW):
+    """Return the version of the last delta sent to a lobby view (0 if none was sent yet)."""
+    version = get_redis().get(lobby_views.get_version_key(view))
+    return int(version or 0)
+
+
+async def aget_lobby_version(view=lobby_views.DEFAULT_VIEW):
+    version = await get_async_redis().get(lobby_views.get_version_key(view))
+    return int(version or 0)
+
+
+def get_open_rooms():
+    """Serialize all rooms that have not yet started, in one query."""
+    return serialize_room_summaries(RoomModel.objects.open())
+
+
+def get_delta(event_type, message, data, version):
+    return {"message": message,
+            "type": event_type,
+            "version": version,
+            "data": data
+            }
+
+
+def get_lobby_message(delta, view):
+    first_version = delta["data"][0]["version"] if delta["type"] == "batch" else delta["version"]
+    return {
+        "type": "chat.message",
+        "frames": wire.encode_frames({"message": delta}),
+        "view": view,
+        "first_version": first_version,
+        "version": delta["version"],
+    }
+
+
+def send_lobby_message(delta, view=lobby_views.DEFAULT_VIEW):
+    channel_layer = get_channel_layer()
+    async_to_sync(channel_layer.group_send)(lobby_views.get_group_name(view), get_lobby_message(delta, view))
+
+
+def send_lobby_event(event_type, message, data, upserts=(), removals=()):
+    """Send one delta to the lobby, see `send_lobby_events`."""
+    send_lobby_events([(event_type, message, data)], upserts, removals)
+
+
+def send_lobby_events(deltas, upserts=(), removals=()):
+    """
+    Send several deltas given as [(event_type, message, data), ...] in one message per lobby view.
+
+    Every view receives the deltas of its rooms only. A single delta is sent as is, more are
+    wrapped in a `batch` message. The cached lobby (see game_rooms.lobby_cache) is updated with
+    `upserts`/`removals` in the same Redis transaction that reserves the versions of every view.
+    """
+    if not deltas:
+        return
+
+    previous = lobby_cache.get_rooms(lobby_views.get_delta_id_codes(deltas))
+    view_deltas = lobby_views.get_view_deltas(deltas, previous)
+    versions = lobby_cache.update_rooms(upserts, removals, {view: len(items) for view, items in view_deltas.items()})
+
+    for view, items in view_deltas.items():
+        last = versions[view]
+        first = last - len(items) + 1
+        items = [get_delta(*delta, version) for version, delta in enumerate(items, start=first)]
+
+        if len(items) == 1:
+            send_lobby_message(items[0], view)
+        else:
+            send_lobby_message(get_delta("batch", f"{len(items)} rooms changed.", items, last), view)
+
@@ -0,0 +1,305 @@
+"""
+Redis cache of the lobby snapshot.
+
+Keys (prefix GAME_ROOMS_LOBBY_CACHE_PREFIX):
+- `rooms`: hash id_code -> JSON of the room summary, `order`: sorted set id_code -> created_at,
+  updated incrementally by every lobby delta.
+- `ready`: set once `rooms`/`order` were loaded from the database, until then they are partial.
+  It expires after GAME_ROOMS_LOBBY_CACHE_TTL, so a delta lost in a crash heals on the next reload.
+- `snapshot:<view>`: the complete, already encoded text frame sent to a client connecting to a
+  view of the lobby (see game_rooms.lobby_views).
+- `snapshot:<view>:<format>`: the same snapshot in the other wire formats (game_rooms.wire),
+  derived from the JSON one and stored behind its version (`<version>|<frame>`).
+
+Every change updates `rooms`/`order`, increments the versions of the views it reaches and drops
+their snapshots in one MULTI, so a connect costs a single GET while nothing changes, and
+rebuilding a snapshot after a change reads Redis only. The database is queried only when the
+cache is cold. A rebuilt snapshot is stored only if the version of its view did not move in the
+meantime.
+"""
+
+import json
+import time
+from django.conf import settings
+from redis.exceptions import WatchError
+from .models import RoomModel
+from .redis_client import get_redis, get_async_redis
+from .serializers import build_room_summaries, get_summary_rows, serialize_room_entries
+from .lobby_views import DEFAULT_VIEW, VIEWS, get_version_key
+from . import wire
+
+
+GET_SNAPSHOT_SCRIPT = """
+local snapshot = redis.call('GET', KEYS[1])
+if snapshot then
+    redis.call('HINCRBY', KEYS[2], 'lobby_snapshot_cache_hits', 1)
+else
+    redis.call('HINCRBY', KEYS[2], 'lobby_snapshot_cache_misses', 1)
+end
+return snapshot
+"""
+
+SET_SNAPSHOT_SCRIPT = """
+if (redis.call('GET', KEYS[1]) or '0') == ARGV[1] then
+    redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+end
+"""
+
+
+def get_key(name):
+    return f"{settings.GAME_ROOMS_LOBBY_CACHE_PREFIX}{name}"
+
+
+SNAPSHOT_HEADER = '{"message": {"type": "snapshot", "version": '
+
+
+def encode_snapshot(version, room_texts):
+    """Join already encoded room summaries into the text frame of a snapshot message."""
+    return f'{SNAPSHOT_HEADER}{int(version)}, "data": [{", ".join(room_texts)}]}}}}'
+
+
+def get_snapshot_version(text):
+    """Return the version of a JSON snapshot frame, read from its header."""
+    return int(text[len(SNAPSHOT_HEADER):text.index(",", len(SNAPSHOT_HEADER))])
+
+
+def get_snapshot_key(view, wire_format=wire.JSON):
+    if wire_format == wire.JSON:
+        return get_key(f"snapshot:{view}")
+    return get_key(f"snapshot:{view}:{wire_format}")
+
+
+def get_snapshot_keys(views):
+    return [get_snapshot_key(view, wire_format) for view in views for wire_format in wire.FORMATS]
+
+
+def get_rooms(id_codes):
+    """Return {id_code: summary} of the cached rooms among `id_codes`."""
+    if not id_codes:
+        return {}
+    texts = get_redis().hmget(get_key("rooms"), id_codes)
+    return {id_code: json.loads(text) for id_code, text in zip(id_codes, texts) if text is not None}
+
+
+def update_rooms(upserts=(), removals=(), versions=None):
+    """
+    Apply room changes to the cache and reserve the next versions of the views, atomically.
+
+    upserts: [(summary, created_at), ...] of rooms visible in the lobby.
+    removals: id_codes of rooms that left the lobby.
+    versions: {view: how many consecutive versions to reserve}, one version of the whole lobby by default.
+    Returns {view: the last reserved version}.
+    """
+    versions = versions or {DEFAULT_VIEW: 1}
+    pipe = get_redis().pipeline(transaction=True)
+
+    if upserts:
+        pipe.hset(get_key("rooms"), mapping={
+            summary["id_code"]: json.dumps(summary) for summary, _ in upserts
+        })
+        pipe.zadd(get_key("order"), {
+            summary["id_code"]: created_at.timestamp() for summary, created_at in upserts
+        })
+    if removals:
+        pipe.hdel(get_key("rooms"), *removals)
+        pipe.zrem(get_key("order"), *removals)
+
+    for view, count in versions.items():
+        pipe.incrby(get_version_key(view), count)
+    pipe.delete(*get_snapshot_keys(versions))
+
+    reserved = pipe.execute()[-len(versions) - 1:-1]
+    return dict(zip(versions, reserved))
+
+
+def clear():
+    """Drop the cached lobby; the next connect reloads it from the database."""
+    get_redis().delete(get_key("rooms"), get_key("order"), get_key("ready"), *get_snapshot_keys(VIEWS))
+
+
+def get_cached_text(redis_result):
+    return redis_result.decode() if redis_result is not None else None
+
+
+def read_cached_rooms(pipe, view):
+    pipe.get(get_version_key(view))
+    pipe.exists(get_key("ready"))
+    pipe.zrange(get_key("order"), 0, -1)
+    pipe.hgetall(get_key("rooms"))
+
+
+def filter_room_texts(view, room_texts):
+    if view == DEFAULT_VIEW:
+        return list(room_texts)
+    return [text for text in room_texts if VIEWS[view](json.loads(text))]
+
+
+def assemble_cached_rooms(view, version, ready, order, rooms):
+    """Return (version, snapshot text) of the view from cached rooms, or None if they were never loaded."""
+    if not ready:
+        return None
+
+    version = int(version or 0)
+    room_texts = filter_room_texts(view, (rooms[id_code].decode() for id_code in order if id_code in rooms))
+    return version, encode_snapshot(version, room_texts)
+
+
+def get_fill_mapping(summaries, created):
+    """Return the `rooms` and `order` contents for summaries loaded from the database."""
+    rooms, order = {}, {}
+    for summary in summaries:
+        id_code = summary["id_code"]
+        rooms[id_code] = json.dumps(summary)
+        order[id_code] = created[id_code].timestamp() if id_code in created else time.time()
+    return rooms, order
+
+
+def write_loaded_rooms(pipe, view, rooms, order, text):
+    pipe.delete(get_key("rooms"), get_key("order"))
+    if rooms:
+        pipe.hset(get_key("rooms"), mapping=rooms)
+        pipe.zadd(get_key("order"), order)
+    pipe.set(get_key("ready"), 1, ex=settings.GAME_ROOMS_LOBBY_CACHE_TTL)
+    pipe.set(get_snapshot_key(view), text, ex=settings.GAME_ROOMS_LOBBY_CACHE_TTL)
+
+
+def read_versions(values):
+    """Return (version of the whole lobby, version of the view) from an MGET of both keys."""
+    return tuple(int(value or 0) for value in values)
+
+
+def load_open_rooms():
+    entries = serialize_room_entries(RoomModel.objects.open())
+    return [summary for summary, _ in entries], {summary["id_code"]: created_at for summary, created_at in entries}
+
+
+def get_snapshot_text(view=DEFAULT_VIEW):
+    """Return the encoded snapshot message of a lobby view for a connecting client."""
+    redis = get_redis()
+    text = get_cached_text(redis.eval(
+        GET_SNAPSHOT_SCRIPT, 2, get_snapshot_key(view), settings.GAME_ROOMS_METRICS_KEY
+    ))
+    if text is not None:
+        return text
+
+    pipe = redis.pipeline(transaction=True)
+    read_cached_rooms(pipe, view)
+    cached = assemble_cached_rooms(view, *pipe.execute())
+    if cached is not None:
+        version, text = cached
+        redis.eval(SET_SNAPSHOT_SCRIPT, 2, get_version_key(view), get_snapshot_key(view),
+                   version, text, settings.GAME_ROOMS_LOBBY_CACHE_TTL)
+        return text
+
+    # Every change moves the version of the whole lobby, so it guards the rooms of all views.
+    lobby_version, version = read_versions(redis.mget(settings.GAME_ROOMS_LOBBY_VERSION_KEY, get_version_key(view)))
+    summaries, scores = load_open_rooms()
+    rooms, order = get_fill_mapping(summaries, scores)
+    text = encode_snapshot(version, filter_room_texts(view, rooms.values()))
+
+    with redis.pipeline(transaction=True) as pipe:
+        try:
+            pipe.watch(settings.GAME_ROOMS_LOBBY_VERSION_KEY)
+            if int(pipe.get(settings.GAME_ROOMS_LOBBY_VERSION_KEY) or 0) == lobby_version:
+                pipe.multi()
+                write_loaded_rooms(pipe, view, rooms, order, text)
+                pipe.execute()
+        except WatchError:
+            pass
+
+    return text
+
+
+async def aload_open_rooms():
+    rows = get_summary_rows(RoomModel.objects.open()).aiterator(chunk_size=settings.GAME_ROOMS_LOBBY_CHUNK_SIZE)
+    rows = [row async for row in rows]
+    return build_room_summaries(rows), {row["id_code"]: row["created_at"] for row in rows}
+
+
+async def aget_snapshot_text(view=DEFAULT_VIEW):
+    """Async counterpart of `get_snapshot_text`."""
+    redis = get_async_redis()
+    text = get_cached_text(await redis.eval(
+        GET_SNAPSHOT_SCRIPT, 2, get_snapshot_key(view), settings.GAME_ROOMS_METRICS_KEY
+    ))
+    if text is not None:
+        return text
+
+    async with redis.pipeline(transaction=True) as pipe:
+        read_cached_rooms(pipe, view)
+        cached = assemble_cached_rooms(view, *await pipe.execute())
+    if cached is not None:
+        version, text = cached
+        await redis.eval(SET_SNAPSHOT_SCRIPT, 2, get_version_key(view), get_snapshot_key(view),
+                         version, text, settings.GAME_ROOMS_LOBBY_CACHE_TTL)
+        return text
+
+    lobby_version, version = read_versions(
+        await redis.mget(settings.GAME_ROOMS_LOBBY_VERSION_KEY, get_version_key(view))
+    )
+    summaries, scores = await aload_open_rooms()
+    rooms, order = get_fill_mapping(summaries, scores)
+    text = encode_snapshot(version, filter_room_texts(view, rooms.values()))
+
+    async with redis.pipeline(transaction=True) as pipe:
+        try:
+            await pipe.watch(settings.GAME_ROOMS_LOBBY_VERSION_KEY)
+            if int(await pipe.get(settings.GAME_ROOMS_LOBBY_VERSION_KEY) or 0) == lobby_version:
+                pipe.multi()
+                write_loaded_rooms(pipe, view, rooms, order, text)
+                await pipe.execute()
+        except WatchError:
+            pass
+
+    return text
+
+
+def split_versioned_frame(value):
+    version, _, frame = value.partition(b"|")
+    return int(version), frame
+
+
+def encode_derived_snapshot(text, wire_format):
+    """Return (version, frame, stored value) of a snapshot in a wire format other than JSON."""
+    message = wire.get_columnar_snapshot(text)
+    frame = wire.encode({"message": message}, wire_format)
+    return message["version"], frame, b"%d|" % message["version"] + frame
+
+
+def get_snapshot(view=DEFAULT_VIEW, wire_format=wire.DEFAULT_FORMAT):
+    """Return (version, frame) of the snapshot message of a lobby view encoded in a wire format, as text or bytes."""
+    if wire_format == wire.JSON:
+        text = get_snapshot_text(view)
+        return get_snapshot_version(text), text
+
+    redis = get_redis()
+    value = redis.get(get_snapshot_key(view, wire_format))
+    if value is not None:
+        return split_versioned_frame(value)
+
+    version, frame, value = encode_derived_snapshot(get_snapshot_text(view), wire_format)
+    redis.eval(SET_SNAPSHOT_SCRIPT, 2, get_version_key(view), get_snapshot_key(view, wire_format),
+               version, value, settings.GAME_ROOMS_LOBBY_CACHE_TTL)
+    return version, frame
+
+
+async def aget_snapshot(view=DEFAULT_VIEW, wire_format=wire.DEFAULT_FORMAT):
+    """Async counterpart of `get_snapshot`."""
+    if wire_format == wire.JSON:
+        text = await aget_snapshot_text(view)
+        return get_snapshot_version(text), text
+
+    redis = get_async_redis()
+    value = await redis.get(get_snapshot_key(view, wire_format))
+    if value is not None:
+        return split_versioned_frame(value)
+
+    version, frame, value = encode_derived_snapshot(await aget_snapshot_text(view), wire_format)
+    await redis.eval(SET_SNAPSHOT_SCRIPT, 2, get_version_key(view), get_snapshot_key(view, wire_format),
+                     version, value, settings.GAME_ROOMS_LOBBY_CACHE_TTL)
+    return version, frame
+
+
+def get_snapshot_frame(view=DEFAULT_VIEW, wire_format=wire.DEFAULT_FORMAT):
+    """Return the snapshot message of a lobby view encoded in a wire format, as text or bytes."""
+    return get_snapshot(view, wire_format)[1]
@@ -0,0 +1,105 @@
+"""
+Filtered views of the lobby.
+
+A lobby client subscribes to one view and receives only the rooms it matches:
+- `all`: every room that has not started yet,
+- `public`: rooms without a password,
+- `free`: rooms with a free seat,
+- `public_free`: public rooms with a free seat.
+
+Every view has its own group (`rooms` for `all`, `rooms.<view>` for the others), its own
+version counter and its own cached snapshot, so the clients of a view see consecutive versions
+and detect gaps exactly like the clients of the whole lobby (see game_rooms.lobby).
+
+A room change becomes, for every view, the delta its clients need: a room entering the view is
+a `create`, a room leaving it is a `delete`, and a room outside the view before and after the
+change is not sent to that view at all.
+"""
+
+from urllib.parse import parse_qs
+from django.conf import settings
+
+DEFAULT_VIEW = "all"
+
+
+def is_public(summary):
+    return not summary["is_private"]
+
+
+def has_free_seat(summary):
+    return len(summary["players_list"]) < summary["max_players"]
+
+
+VIEWS = {
+    "all": lambda summary: True,
+    "public": is_public,
+    "free": has_free_seat,
+    "public_free": lambda summary: is_public(summary) and has_free_seat(summary),
+}
+
+
+def get_group_name(view):
+    if view == DEFAULT_VIEW:
+        return settings.GAME_ROOMS_CHANNEL_GROUP_NAME
+    return f"{settings.GAME_ROOMS_CHANNEL_GROUP_NAME}.{view}"
+
+
+def get_version_key(view):
+    if view == DEFAULT_VIEW:
+        return settings.GAME_ROOMS_LOBBY_VERSION_KEY
+    return f"{settings.GAME_ROOMS_LOBBY_VERSION_KEY}:{view}"
+
+
+def was_visible(view, previous, id_code):
+    """Whether the room was in the view; a room missing from `previous` is assumed to be."""
+    summary = previous.get(id_code)
+    return summary is None or VIEWS[view](summary)
+
+
+def get_view_delta(view, delta, previous):
+    """
+    Return the (event_type, message, data) delta as seen by the clients of `view`, or None.
+
+    previous: {id_code: summary} of the rooms before the change, as cached by game_rooms.lobby_cache.
+    """
+    event_type, message, data = delta
+
+    if event_type == "started":
+        rooms = [room for room in data if was_visible(view, previous, room["id_code"])]
+        return (event_type, f"{len(rooms)} rooms started.", rooms) if rooms else None
+
+    was = event_type != "create" and was_visible(view, previous, data["id_code"])
+    now = event_type in ("create", "update") and VIEWS[view](data)
+
+    if now:
+        return (event_type if was else "create", message, data)
+    if was:
+        return ("delete", message, data)
+    return None
+
+
+def get_view_deltas(deltas, previous):
+    """Return {view: [delta, ...]} for the views that have something to receive."""
+    view_deltas = {}
+    for view in VIEWS:
+        items = [item for item in (get_view_delta(view, delta, previous) for delta in deltas) if item]
+        if items:
+            view_deltas[view] = items
+    return view_deltas
+
+
+def get_delta_id_codes(deltas):
+    """Return the id_codes of the rooms the deltas are about."""
+    id_codes = []
+    for event_type, _, data in deltas:
+        if event_type == "started":
+            id_codes.extend(room["id_code"] for room in data)
+        else:
+            id_codes.append(data["id_code"])
+    return id_codes
+
+
+def get_requested_view(scope):
+    """Return the view asked for in the query string of a socket (`?view=public`), or None if it is unknown."""
+    view = parse_qs(scope.get("query_string", b"").decode()).get("view", [DEFAULT_VIEW])[-1]
+    return view if view in VIEWS else None
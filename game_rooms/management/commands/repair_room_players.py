@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from game_rooms.membership import repair_players
+from game_rooms.models import RoomModel
+
+
+class Command(BaseCommand):
+    help = "Recompute the player_count and player_names of rooms from their players_list (see game_rooms.membership)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rooms locked and checked per transaction.")
+        parser.add_argument("--dry-run", action="store_true", help="Only list the rooms that drifted.")
+
+    def handle(self, *args, **options):
+        drifted = repair_players(RoomModel, batch_size=options["batch_size"], dry_run=options["dry_run"])
+
+        for id_code in drifted:
+            self.stdout.write(id_code)
+        action = "drifted" if options["dry_run"] else "repaired"
+        self.stdout.write(self.style.SUCCESS(f"{len(drifted)} rooms {action}."))
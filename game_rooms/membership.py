@@ -0,0 +1,194 @@
+"""
+Room membership service.
+
+Every change runs in one transaction and issues only the statements it needs:
+- adding the author when a room is created: one INSERT into the players_list through table,
+- joining a room: one statement that takes a seat with a conditional
+  UPDATE ... WHERE player_count < max_players and inserts the player only if it got one, in a
+  savepoint that undoes the seat when a concurrent join of the same user won the player row,
+- leaving a room: one statement that deletes the player and frees its seat.
+`RoomModel.player_count` is the number of players, kept by these statements and bounded by a
+CHECK constraint, so capacity never depends on a read made before the write and concurrent joins
+need no SELECT ... FOR UPDATE. The join taking the last seat starts the room in the same UPDATE.
+The same statements keep `RoomModel.player_names`, the usernames of the players in joining order,
+so lobby payloads are read from the room table alone. A player renamed while seated leaves a
+stale name behind; `manage.py repair_room_players` recomputes both columns from players_list.
+
+The room row itself is never re-saved for a membership change; the lobby is told about the
+change through game_rooms.outbox, and the sockets of the room get a `join` or `leave` event
+(game_rooms.room_events), once the transaction commits. A room started by its last join has
+its start timer cancelled and its table opened (game.sharding) at the same time.
+"""
+
+from django.db import connections, router, transaction
+
+
+def get_through_model(room):
+    return room._meta.get_field("players_list").remote_field.through
+
+
+def send_room_update_on_commit(room, event_type, user_pk, started=False):
+    from game.sharding import start_tables
+    from .outbox import enqueue
+    from .room_events import send_room_event
+    from .timers import cancel_room_start
+
+    id_code = room.id_code
+
+    def send():
+        enqueue("update", id_code)
+        send_room_event(id_code, event_type, {"user_id": user_pk})
+        if started:
+            cancel_room_start(id_code)
+            start_tables([id_code])
+
+    transaction.on_commit(send)
+
+
+def add_author(room):
+    """Add the author of a just created room to its players. Called by RoomModel.save on insert only."""
+    get_through_model(room).objects.create(roommodel_id=room.pk, user_id=room.author_id)
+
+
+def get_names(room):
+    through = get_through_model(room)
+    quote = connections[router.db_for_write(through)].ops.quote_name
+    return {
+        "room": quote(room._meta.db_table),
+        "through": quote(through._meta.db_table),
+        "user": quote(through._meta.get_field("user").related_model._meta.db_table),
+        **{column: quote(column) for column in (
+            "id", "id_code", "player_count", "player_names", "max_players", "is_started", "delete_at", "roommodel_id",
+            "user_id", "username",
+        )},
+    }
+
+
+def add_player(room, user_pk):
+    """
+    Seat the user in the room, and start the room if that was its last free seat.
+
+    Returns False if the user already was a player, or if the room is full or started. On success
+    `room.player_count`, `room.player_names` and `room.is_started` are refreshed.
+    """
+    through = get_through_model(room)
+    connection = connections[router.db_for_write(through)]
+    names = get_names(room)
+
+    # The seat is taken under the row lock of the UPDATE, so concurrent joins queue on the room
+    # row for the duration of one statement and never take more seats than max_players.
+    sql = (
+        "WITH seat AS ("
+        "UPDATE {room} SET {player_count} = {player_count} + 1, "
+        "{player_names} = array_append({player_names}, (SELECT {username} FROM {user} WHERE {id} = %s)), "
+        "{is_started} = {player_count} + 1 >= {max_players}, "
+        # A room whose timed start was cancelled gets a delete_at when it fills, for the purge.
+        "{delete_at} = CASE WHEN {player_count} + 1 >= {max_players} THEN coalesce({delete_at}, now()) "
+        "ELSE {delete_at} END "
+        "WHERE {id} = %s AND NOT {is_started} AND {player_count} < {max_players} "
+        "AND NOT EXISTS (SELECT 1 FROM {through} WHERE {roommodel_id} = %s AND {user_id} = %s) "
+        "RETURNING {id}, {player_count}, {player_names}, {is_started}"
+        "), player AS ("
+        "INSERT INTO {through} ({roommodel_id}, {user_id}) SELECT {id}, %s FROM seat "
+        "ON CONFLICT DO NOTHING RETURNING {id}"
+        ") SELECT seat.{player_count}, seat.{player_names}, seat.{is_started}, player.{id} "
+        "FROM seat LEFT JOIN player ON TRUE"
+    ).format(**names)
+
+    with transaction.atomic(using=connection.alias, savepoint=False):
+        savepoint = transaction.savepoint(using=connection.alias)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [user_pk, room.pk, room.pk, user_pk, user_pk])
+            row = cursor.fetchone()
+
+        if row is not None and row[3] is None:
+            # A concurrent join of the same user committed its player row after this statement
+            # started: undo the whole seat UPDATE (count, names, start and delete_at).
+            transaction.savepoint_rollback(savepoint, using=connection.alias)
+            return False
+        transaction.savepoint_commit(savepoint, using=connection.alias)
+        if row is None:
+            return False
+
+        player_count, player_names, started, _ = row
+        room.player_count, room.player_names, room.is_started = player_count, player_names, started
+        send_room_update_on_commit(room, "join", user_pk, started=started)
+
+    return True
+
+
+def remove_player(room, user_pk):
+    """Remove the user from the room and free the seat. Returns False if the user was not a player."""
+    through = get_through_model(room)
+    connection = connections[router.db_for_write(through)]
+    sql = (
+        "WITH player AS ("
+        "DELETE FROM {through} WHERE {roommodel_id} = %s AND {user_id} = %s RETURNING {roommodel_id}"
+        ") UPDATE {room} SET {player_count} = {player_count} - 1, "
+        "{player_names} = array_remove({player_names}, (SELECT {username} FROM {user} WHERE {id} = %s)) "
+        "WHERE {id} IN (SELECT {roommodel_id} FROM player) RETURNING {player_count}, {player_names}"
+    ).format(**get_names(room))
+
+    with transaction.atomic(using=connection.alias, savepoint=False):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [room.pk, user_pk, user_pk])
+            row = cursor.fetchone()
+
+        if row is None:
+            return False
+
+        room.player_count, room.player_names = row
+        send_room_update_on_commit(room, "leave", user_pk)
+
+    return True
+
+
+def repair_players(model, batch_size=1000, dry_run=False):
+    """
+    Recompute `player_count` and `player_names` from players_list wherever they drifted.
+
+    Rooms are checked in batches of `batch_size` ids, each locked FOR UPDATE for its own short
+    transaction, so joins and leaves running meanwhile wait for the batch instead of being
+    overwritten. Returns the id_codes of the rooms that drifted; with `dry_run` nothing is written.
+    """
+    from .outbox import enqueue
+
+    connection = connections[router.db_for_write(model)]
+    names = get_names(model)
+    counted = (
+        "SELECT room.{id}, count(player.{id}) AS {player_count}, "
+        "coalesce(array_agg(account.{username} ORDER BY player.{id}) FILTER (WHERE player.{id} IS NOT NULL), "
+        "'{{}}') AS {player_names} "
+        "FROM {room} room LEFT JOIN {through} player ON player.{roommodel_id} = room.{id} "
+        "LEFT JOIN {user} account ON account.{id} = player.{user_id} "
+        "WHERE room.{id} = ANY(%s) GROUP BY room.{id}"
+    ).format(**names)
+    drifted = (
+        "({counted}) counted WHERE {room}.{id} = counted.{id} "
+        "AND ({room}.{player_count} <> counted.{player_count} OR {room}.{player_names} <> counted.{player_names})"
+    ).format(counted=counted, **names)
+    check = "SELECT {room}.{id_code}, {room}.{is_started} FROM {room}, ".format(**names) + drifted
+    repair = (
+        "UPDATE {room} SET {player_count} = counted.{player_count}, {player_names} = counted.{player_names} FROM "
+    ).format(**names) + drifted + " RETURNING {room}.{id_code}, {room}.{is_started}".format(**names)
+
+    repaired, last_id = [], 0
+    while True:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT {id} FROM {room} WHERE {id} > %s ORDER BY {id} LIMIT %s FOR UPDATE".format(**names),
+                [last_id, batch_size],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                return repaired
+
+            cursor.execute(check if dry_run else repair, [ids])
+            rows = cursor.fetchall()
+            if not dry_run:
+                for id_code, is_started in rows:
+                    if not is_started:
+                        transaction.on_commit(lambda id_code=id_code: enqueue("update", id_code))
+
+        repaired.extend(id_code for id_code, _ in rows)
+        last_id = ids[-1]
@@ -0,0 +1,39 @@
+"""
+Process-independent counters kept in one Redis hash (GAME_ROOMS_METRICS_KEY).
+
+Every worker increments the same counters, and `/api/room/metrics/` returns them for scraping.
+"""
+
+from django.conf import settings
+from .redis_client import get_redis, get_async_redis
+
+
+def incr(name, amount=1):
+    get_redis().hincrby(settings.GAME_ROOMS_METRICS_KEY, name, amount)
+
+
+async def aincr(name, amount=1):
+    await get_async_redis().hincrby(settings.GAME_ROOMS_METRICS_KEY, name, amount)
+
+
+def incr_many(counters):
+    """Increment several counters given as {name: amount} in one round trip."""
+    pipe = get_redis().pipeline(transaction=False)
+    for name, amount in counters.items():
+        pipe.hincrby(settings.GAME_ROOMS_METRICS_KEY, name, amount)
+    pipe.execute()
+
+
+async def aincr_many(counters):
+    async with get_async_redis().pipeline(transaction=False) as pipe:
+        for name, amount in counters.items():
+            pipe.hincrby(settings.GAME_ROOMS_METRICS_KEY, name, amount)
+        await pipe.execute()
+
+
+def get_metrics():
+    """Return all counters as {name: value}."""
+    return {
+        name.decode(): int(value)
+        for name, value in get_redis().hgetall(settings.GAME_ROOMS_METRICS_KEY).items()
+    }
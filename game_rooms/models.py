@@ -1,9 +1,41 @@
 from django.utils import timezone
-from django.db import models
-from . import fields
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import BrinIndex
+from django.db import models, connections, router, transaction, IntegrityError
+from . import fields, membership
 from django.conf import settings
-import time
-from authorization.models import User
+
+
+class RoomQuerySet(models.QuerySet):
+    """
+    QuerySet for RoomModel.
+
+    Methods:
+    - open(self): Rooms that have not started yet, in lobby order (created_at, id).
+    - start_expired(self, now=None): Starts every not started room whose delete_at has passed with a single
+                                     UPDATE ... RETURNING and returns [(id_code, name), ...] of the started rooms.
+                                     Bypasses save(), so no post_save signal is sent per room.
+    """
+
+    def open(self):
+        return self.filter(is_started=False).order_by("created_at", "id")
+
+    def start_expired(self, now=None):
+        if now is None:
+            now = timezone.now()
+
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        sql = (
+            f"UPDATE {quote(self.model._meta.db_table)} SET {quote('is_started')} = TRUE "
+            f"WHERE {quote('is_started')} = FALSE AND {quote('delete_at')} <= %s "
+            f"RETURNING {quote('id_code')}, {quote('name')}"
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [now])
+            return cursor.fetchall()
+
 
 class RoomModel(models.Model):
     """
@@ -16,17 +48,27 @@ class RoomModel(models.Model):
     - is_private (bool): Indicates if the room is private. Default is False.
     - password (str): The password for the room if it is private. Must be None or empty if is_private is False.
     - players_list (ManyToManyField): A list of players in the room. Must include the author.
+    - player_count (int): The number of players, never above max_players. Must not be set manually.
+    - player_names (list[str]): The usernames of the players in joining order, for lobby payloads.
+                                Must not be set manually.
     - author (ForeignKey): The user who created the room.
-    - is_started (bool): Indicates if the room has started. Must not be set manually.
+    - is_started (bool): Indicates if the room has started. Must not be set manually: rooms start through
+                         RoomQuerySet.start_expired (see game_rooms.tasks) or when their last seat is taken.
     - created_at (DateTimeField): The timestamp when the room was created. Must not be set manually.
     - delete_at (DateTimeField): The timestamp when the room will be deleted. Must not be set manually.
+                                 None while the start of an open room is cancelled (see game_rooms.timers).
 
     Methods:
-    - save(self, *args, **kwargs): Saves the room instance. Sets created_at and delete_at if the instance is new.
-                                     Adds the author to the players_list.
-    - add_user_to_list(self, user_pk): Adds a user to the players_list by their primary key.
+    - save(self, *args, **kwargs): Saves the room instance. If the instance is new, sets created_at and delete_at
+                                     and adds the author to the players_list in the same transaction.
+                                     An insert whose generated id_code is taken is retried with the next code.
+                                     player_count and player_names are kept by game_rooms.membership.
+    - insert_with_free_code(self, alias, *args, **kwargs): Inserts the room in a savepoint, retrying with the next
+                                                          sequence value up to GAME_ROOMS_ID_CODE_ATTEMPTS times
+                                                          while the generated id_code is taken.
+    - add_user_to_list(self, user_pk): Adds a user to the players_list by their primary key if a seat is free,
+                                       and starts the room when it fills (see game_rooms.membership).
     - delete_user_from_list(self, user_pk): Removes a user from the players_list by their primary key.
-    - start_create_timer(self): Starts a timer for 10 seconds and then sets is_started to True.
     """
 
     name = models.CharField(max_length=100)
@@ -39,6 +81,8 @@ class RoomModel(models.Model):
         settings.AUTH_USER_MODEL, related_name="rooms",
         blank=True
     )  # ---------------------------------------------- | DONE must have author in list
+    player_count = models.PositiveSmallIntegerField(default=0)  # ---------------------- | Must not be set
+    player_names = ArrayField(models.CharField(max_length=150), default=list, blank=True)  # | Must not be set
     author = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -47,36 +91,103 @@ class RoomModel(models.Model):
     is_started = models.BooleanField(default=False)  # -------------------------------- | Must not be set
     created_at = models.DateTimeField(blank=True,
                                       auto_now_add=True)  # --------------------------- | Must not be set
-    delete_at = models.DateTimeField(blank=True)  # ----------------------------------- | Must not be set
+    delete_at = models.DateTimeField(blank=True, null=True)  # ------------------------ | Must not be set
+
+    objects = RoomQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Timed starts (RoomQuerySet.start_expired) and the sweep of started rooms by delete_at.
+            models.Index(fields=["is_started", "delete_at"], name="room_started_delete_at_idx"),
+            # Open rooms in lobby order, carrying every summary field (game_rooms.serializers), so
+            # lobby loads and listing pages are index-only scans of the open rooms alone.
+            models.Index(
+                fields=["created_at", "id"],
+                include=["name", "max_players", "id_code", "is_started", "is_private", "author_id", "player_count",
+                         "player_names"],
+                condition=models.Q(is_started=False),
+                name="room_open_summary_idx",
+            ),
+        ]
+        constraints = [
+            models.CheckConstraint(check=models.Q(player_count__lte=models.F("max_players")),
+                                   name="room_player_count_lte_max_players"),
+        ]
 
     def __str__(self):
         return f"{self.name}"
 
     def save(self, *args, **kwargs):
-        if not self.pk:
-            self.created_at = timezone.now()
-            self.delete_at = self.created_at + timezone.timedelta(seconds=settings.SECONDS_BEFORE_START_GAME_ROOM) 
-            
-        super().save(*args, **kwargs)
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
 
-        self.players_list.add(self.author.pk)
+        self.created_at = timezone.now()
+        self.player_count = 1
+        self.player_names = [self.author.username]
+        self.delete_at = self.created_at + timezone.timedelta(seconds=settings.SECONDS_BEFORE_START_GAME_ROOM)
 
-            
-    def add_user_to_list(self, user_pk):
-        user = User.objects.get(pk=user_pk)
+        alias = router.db_for_write(RoomModel)
+        with transaction.atomic(using=alias, savepoint=False):
+            self.insert_with_free_code(alias, *args, **kwargs)
+            membership.add_author(self)
+
+    def insert_with_free_code(self, alias, *args, **kwargs):
+        field = self._meta.get_field("id_code")
+        generated = not self.id_code
+        for attempt in range(1, settings.GAME_ROOMS_ID_CODE_ATTEMPTS + 1):
+            try:
+                # A failed INSERT aborts the transaction; the savepoint keeps it usable for the retry.
+                with transaction.atomic(using=alias):
+                    return super().save(*args, **kwargs)
+            except IntegrityError as error:
+                if not generated or attempt == settings.GAME_ROOMS_ID_CODE_ATTEMPTS \
+                        or not field.is_code_conflict(error):
+                    raise
+                self.id_code = ""
 
-        self.players_list.add(user)
-        self.save(update_fields=["players_list"])
+    def add_user_to_list(self, user_pk):
+        return membership.add_player(self, user_pk)
 
     def delete_user_from_list(self, user_pk):
-        user = settings.AUTH_USER_MODEL.objects.get(pk=user_pk)
+        return membership.remove_player(self, user_pk)
+
+
+class ArchivedRoomModel(models.Model):
+    """
+    A purged room, as moved out of RoomModel by game_rooms.purge.
+
+    Append-only: rows are written once by the purge and never updated. The author and players
+    are kept as plain ids, so deleting a user does not touch the archive.
 
-        self.players_list.remove(user)
-        self.save(update_fields=["players_list"])
+    Attributes:
+    - room_id (int): The primary key the room had.
+    - id_code, name, max_players, is_private, is_started, created_at, delete_at: Copied from the room.
+      is_started is False and delete_at may be None for an open room purged for its age.
+    - author_id (int): The user who created the room.
+    - player_ids (list[int]): The players_list of the room when it was purged.
+    - player_names (list[str]): Their usernames, in joining order.
+    - archived_at (DateTimeField): When the room was purged.
+    """
 
-    def start_create_timer(self):
-        time.sleep(settings.SECONDS_BEFORE_START_GAME_ROOM)
+    room_id = models.BigIntegerField()
+    id_code = models.CharField(max_length=6)
+    name = models.CharField(max_length=100)
+    max_players = models.IntegerField()
+    is_private = models.BooleanField()
+    is_started = models.BooleanField()
+    author_id = models.BigIntegerField()
+    player_ids = ArrayField(models.BigIntegerField(), default=list)
+    player_names = ArrayField(models.CharField(max_length=150), default=list)
+    created_at = models.DateTimeField()
+    delete_at = models.DateTimeField(null=True)
+    archived_at = models.DateTimeField()
 
-        self.is_started = True
-        self.save(update_fields=["is_started"])
+    class Meta:
+        indexes = [
+            # Rows arrive in archived_at order, so a BRIN index stays tiny for range scans and cleanups.
+            BrinIndex(fields=["archived_at"], name="archived_room_archived_at_brin"),
+            models.Index(fields=["id_code"], name="archived_room_id_code_idx"),
+        ]
 
+    def __str__(self):
+        return f"{self.name} ({self.id_code})"
@@ -0,0 +1,154 @@
+"""
+Outbox of lobby changes.
+
+Room writes never talk to the channel layer themselves. Once their transaction commits they
+record `id_code -> kind` in a Redis hash with one script call, so the request does not wait
+for the lobby fan-out and a write that rolls back is never broadcast.
+
+The first change of a window also schedules `flush_lobby_outbox` GAME_ROOMS_OUTBOX_WINDOW
+seconds later. The flush takes every pending change at once, loads the current state of those
+rooms in one query and sends them to the lobby as one message. Several changes of the same
+room inside a window collapse into one entry: a `create` stays a `create`, and a room that
+left the lobby stays a `delete` or `started`. Rooms started by the expiry sweep are recorded as
+`started` and sent as one `started` delta. The periodic flush in CELERY_BEAT_SCHEDULE picks up
+changes whose scheduled flush was lost.
+
+Flushes hold a Redis lock from taking the changes to sending them. Without it a flush that
+loaded a room before it started could send it after the flush of its start, putting the
+started room back into the lobby with a higher version.
+"""
+
+from django.conf import settings
+from django.db import transaction
+from .redis_client import get_redis
+
+
+ENQUEUE_SCRIPT = """
+local kind = ARGV[2]
+for i = 3, #ARGV do
+    local previous = redis.call('HGET', KEYS[1], ARGV[i])
+    if kind == 'started' or (previous ~= 'delete' and previous ~= 'started'
+            and not (previous == 'create' and kind == 'update')) then
+        redis.call('HSET', KEYS[1], ARGV[i], kind)
+    end
+end
+redis.call('HINCRBY', KEYS[3], 'lobby_outbox_changes', #ARGV - 2)
+if ARGV[1] ~= '0' and redis.call('SET', KEYS[2], 1, 'NX', 'PX', ARGV[1]) then
+    return 1
+end
+return 0
+"""
+
+TAKE_SCRIPT = """
+local pending = redis.call('HGETALL', KEYS[1])
+redis.call('DEL', KEYS[1], KEYS[2])
+return pending
+"""
+
+MESSAGES = {
+    "create": "New room {name} created!",
+    "update": "Room {name} updated.",
+    "delete": "Room {name} started.",
+}
+
+FLUSH_LOCK = "flush-lock"
+
+
+def get_key(name):
+    return f"{settings.GAME_ROOMS_OUTBOX_PREFIX}{name}"
+
+
+def enqueue(kind, id_code):
+    """Record a `create`, `update` or `delete` of the room, and schedule a flush if none is pending."""
+    enqueue_many(kind, [id_code])
+
+
+def enqueue_many(kind, id_codes, schedule=True):
+    """
+    Record the same change of several rooms with one script call (`started` for the rooms started
+    by the sweep). With `schedule`, schedules a flush if none is pending.
+    """
+    from .tasks import flush_lobby_outbox
+
+    timeout = int(settings.GAME_ROOMS_OUTBOX_FLUSH_TIMEOUT * 1000) if schedule else 0
+    scheduled = get_redis().eval(
+        ENQUEUE_SCRIPT, 3, get_key("pending"), get_key("scheduled"), settings.GAME_ROOMS_METRICS_KEY,
+        timeout, kind, *id_codes,
+    )
+    if scheduled:
+        flush_lobby_outbox.apply_async(countdown=settings.GAME_ROOMS_OUTBOX_WINDOW)
+
+
+def enqueue_on_commit(kind, id_code):
+    """Record the change once the current transaction commits; nothing is recorded on rollback."""
+    transaction.on_commit(lambda: enqueue(kind, id_code))
+
+
+def enqueue_on_commit_many(kind, id_codes):
+    """Record the same change of several rooms once the current transaction commits."""
+    id_codes = list(id_codes)
+    transaction.on_commit(lambda: enqueue_many(kind, id_codes))
+
+
+def take_pending():
+    """Atomically remove and return the pending changes as {id_code: kind}."""
+    pending = get_redis().eval(TAKE_SCRIPT, 2, get_key("pending"), get_key("scheduled"))
+    return {pending[i].decode(): pending[i + 1].decode() for i in range(0, len(pending), 2)}
+
+
+def get_deltas(pending, entries):
+    """
+    Turn pending changes into lobby deltas using the current state of the rooms.
+
+    pending: {id_code: kind}, entries: {id_code: (summary, created_at)} of the rooms that still exist.
+    Returns (deltas, upserts, removals) as expected by lobby.send_lobby_events. The rooms recorded
+    as `started` that did start make one `started` delta, last.
+    """
+    deltas, upserts, removals, started = [], [], [], []
+
+    for id_code, kind in pending.items():
+        if id_code not in entries:
+            deltas.append(("delete", f"Room {id_code} deleted.", {"id_code": id_code}))
+            removals.append(id_code)
+            continue
+
+        summary, created_at = entries[id_code]
+        if summary["is_started"] and kind == "started":
+            started.append({"id_code": id_code, "name": summary["name"]})
+            removals.append(id_code)
+            continue
+        if summary["is_started"]:
+            kind = "delete"
+            removals.append(id_code)
+        else:
+            kind = "update" if kind in ("delete", "started") else kind
+            upserts.append((summary, created_at))
+        deltas.append((kind, MESSAGES[kind].format(name=summary["name"]), summary))
+
+    if started:
+        deltas.append(("started", f"{len(started)} rooms started.", started))
+    return deltas, upserts, removals
+
+
+def flush():
+    """Send every pending change to the lobby in one message. Returns the number of rooms sent."""
+    from .lobby import send_lobby_events
+    from .metrics import incr
+    from .models import RoomModel
+    from .serializers import serialize_room_entries
+
+    lock = get_redis().lock(get_key(FLUSH_LOCK), timeout=settings.GAME_ROOMS_OUTBOX_FLUSH_TIMEOUT,
+                            blocking_timeout=settings.GAME_ROOMS_OUTBOX_FLUSH_TIMEOUT)
+    with lock:
+        pending = take_pending()
+        if not pending:
+            return 0
+
+        entries = {
+            summary["id_code"]: (summary, created_at)
+            for summary, created_at in serialize_room_entries(RoomModel.objects.filter(id_code__in=pending))
+        }
+        send_lobby_events(*get_deltas(pending, entries))
+    incr("lobby_outbox_flushed", len(pending))
+
+    return len(pending)
@@ -0,0 +1,152 @@
+"""
+Purge of finished rooms.
+
+A room stays in RoomModel after its game started, so without a purge the room table and its
+players_list through table only grow. `purge_finished_rooms` (run by the periodic
+`purge_finished_rooms` task) removes, and with GAME_ROOMS_PURGE_ARCHIVE copies into
+ArchivedRoomModel with their players:
+- the rooms that started more than GAME_ROOMS_PURGE_AFTER seconds ago,
+- the open rooms created more than GAME_ROOMS_PURGE_OPEN_AFTER seconds ago. A room starts on
+  its own after SECONDS_BEFORE_START_GAME_ROOM, so these are rooms whose start was cancelled
+  (game_rooms.timers) and which never filled; their removal is sent to the lobby through
+  game_rooms.outbox.
+
+Every batch is one statement in its own short transaction:
+- it picks up to GAME_ROOMS_PURGE_BATCH_SIZE rooms, started ones in delete_at order through the
+  (is_started, delete_at) index or open ones in created_at order through the open rooms index,
+  locking them FOR UPDATE SKIP LOCKED, so rows busy elsewhere are left for a later run instead
+  of being waited for,
+- it deletes their players, the rows that cascade from the room (the game checkpoint) and the
+  rooms themselves with DELETE ... RETURNING, and inserts the returned rows into the archive.
+A batch gives up after GAME_ROOMS_PURGE_LOCK_TIMEOUT milliseconds of waiting for a lock. A run
+purges started rooms, then open ones, and stops after GAME_ROOMS_PURGE_MAX_BATCHES batches and pauses GAME_ROOMS_PURGE_PAUSE seconds
+between them, so the purge never holds locks for long nor saturates the database; a backlog is
+worked off over several runs. Every run adds the rows it purged to the metrics.
+"""
+
+import logging
+import time
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import CASCADE
+from django.utils import timezone
+from .metrics import incr_many
+from .models import RoomModel, ArchivedRoomModel
+from . import outbox
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_COLUMNS = ("id_code", "name", "max_players", "is_private", "is_started", "author_id", "player_names",
+                    "created_at", "delete_at")
+
+# Rooms picked by a batch of each kind: condition and order, both served by an index.
+SELECTIONS = {
+    "started": "{is_started} AND {delete_at} < %s ORDER BY {delete_at}",
+    "open": "NOT {is_started} AND {created_at} < %s ORDER BY {created_at}, {id}",
+}
+
+
+def get_cascades(model):
+    """Return [(table, column), ...] of the rows deleted with a room (on_delete=CASCADE relations)."""
+    return [
+        (relation.related_model._meta.db_table, relation.field.column)
+        for relation in model._meta.related_objects
+        if relation.on_delete is CASCADE
+    ]
+
+
+def get_purge_sql(connection, archive, kind="started"):
+    """One batch: lock, delete (and archive) rooms of a SELECTIONS kind; returns (rooms, players, id_codes) purged."""
+    quote = connection.ops.quote_name
+    room = quote(RoomModel._meta.db_table)
+    through = RoomModel.players_list.through
+    names = {
+        "room": room,
+        "through": quote(through._meta.db_table),
+        **{column: quote(column) for column in (
+            "id", "id_code", "is_started", "created_at", "delete_at", "roommodel_id", "user_id",
+        )},
+    }
+
+    parts = [
+        ("WITH batch AS ("
+         "SELECT {id} FROM {room} WHERE " + SELECTIONS[kind] + " LIMIT %s FOR UPDATE SKIP LOCKED"
+         "), players AS ("
+         "DELETE FROM {through} WHERE {roommodel_id} IN (SELECT {id} FROM batch) RETURNING {roommodel_id}, {user_id}"
+         ")").format(**names)
+    ]
+    for number, (table, column) in enumerate(get_cascades(RoomModel)):
+        parts.append(f", cascade_{number} AS (DELETE FROM {quote(table)} WHERE {quote(column)} IN "
+                     f"(SELECT {names['id']} FROM batch))")
+    parts.append(
+        ", rooms AS (DELETE FROM {room} WHERE {id} IN (SELECT {id} FROM batch) RETURNING *)".format(**names)
+    )
+
+    if archive:
+        columns = ", ".join(quote(column) for column in ARCHIVED_COLUMNS)
+        copied = ", ".join(f"rooms.{quote(column)}" for column in ARCHIVED_COLUMNS)
+        parts.append(
+            f", archived AS (INSERT INTO {quote(ArchivedRoomModel._meta.db_table)} "
+            f"({quote('room_id')}, {columns}, {quote('player_ids')}, {quote('archived_at')}) "
+            f"SELECT rooms.{names['id']}, {copied}, "
+            f"coalesce((SELECT array_agg(players.{names['user_id']} ORDER BY players.{names['user_id']}) "
+            f"FROM players WHERE players.{names['roommodel_id']} = rooms.{names['id']}), '{{}}'), %s FROM rooms)"
+        )
+
+    parts.append(" SELECT (SELECT count(*) FROM rooms), (SELECT count(*) FROM players), "
+                 f"(SELECT coalesce(array_agg({names['id_code']}), '{{}}') FROM rooms)")
+    return "".join(parts)
+
+
+def purge_batch(before, batch_size, archive=True, kind="started"):
+    """
+    Purge up to `batch_size` rooms started (or, for kind "open", created) before `before`.
+
+    Returns (rooms, players) purged. Purged open rooms are sent to the lobby as deleted.
+    """
+    connection = connections[router.db_for_write(RoomModel)]
+    params = [before, batch_size] + ([timezone.now()] if archive else [])
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute("SET LOCAL lock_timeout = %s", [f"{int(settings.GAME_ROOMS_PURGE_LOCK_TIMEOUT)}ms"])
+        cursor.execute(get_purge_sql(connection, archive, kind), params)
+        rooms, players, id_codes = cursor.fetchone()
+        if kind == "open" and id_codes:
+            outbox.enqueue_on_commit_many("delete", id_codes)
+    return rooms, players
+
+
+def purge_finished_rooms(now=None):
+    """
+    Run batches of started rooms, then of open ones, until none is left or GAME_ROOMS_PURGE_MAX_BATCHES ran.
+
+    Returns {"rooms_purged": n, "open_rooms_purged": n, "room_players_purged": n, "batches": n};
+    rooms_purged counts the open rooms too.
+    """
+    if now is None:
+        now = timezone.now()
+    cutoffs = {
+        "started": now - timezone.timedelta(seconds=settings.GAME_ROOMS_PURGE_AFTER),
+        "open": now - timezone.timedelta(seconds=settings.GAME_ROOMS_PURGE_OPEN_AFTER),
+    }
+    batch_size = settings.GAME_ROOMS_PURGE_BATCH_SIZE
+
+    report = {"rooms_purged": 0, "open_rooms_purged": 0, "room_players_purged": 0, "batches": 0}
+    for kind, before in cutoffs.items():
+        while report["batches"] < settings.GAME_ROOMS_PURGE_MAX_BATCHES:
+            if report["batches"]:
+                time.sleep(settings.GAME_ROOMS_PURGE_PAUSE)
+
+            rooms, players = purge_batch(before, batch_size, settings.GAME_ROOMS_PURGE_ARCHIVE, kind)
+            report["batches"] += 1
+            report["rooms_purged"] += rooms
+            report["room_players_purged"] += players
+            if kind == "open":
+                report["open_rooms_purged"] += rooms
+            if rooms < batch_size:
+                break
+
+    incr_many({"rooms_purged": report["rooms_purged"], "room_players_purged": report["room_players_purged"]})
+    logger.info("Purged %(rooms_purged)d rooms (%(open_rooms_purged)d open) and %(room_players_purged)d players "
+                "in %(batches)d batches", report)
+    return report
@@ -0,0 +1,34 @@
+import asyncio
+import weakref
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis import asyncio as aioredis
+
+
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_redis():
+    """Return the Redis client of the default cache (django-redis connection pool)."""
+    return get_redis_connection("default")
+
+
+def get_async_redis():
+    """
+    Return an asyncio Redis client bound to the running event loop.
+
+    asyncio connections cannot be shared between event loops, so one client is kept per loop.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = aioredis.Redis.from_url(settings.CACHES["default"]["LOCATION"])
+        _async_clients[loop] = client
+    return client
+
+
+async def aclose_async_redis():
+    """Close the Redis client of the running event loop, e.g. before a short-lived loop ends."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,32 @@
+"""
+Events of one room, sent to the sockets connected to `ws/room/<id_code>/` only.
+
+The lobby groups carry room summaries; what happens inside a room (players joining and
+leaving, bids, challenges and new rolls of the game) goes to the group of that room, so a
+socket receives the events of the room it is in and nothing else. Like lobby messages, events
+are encoded once per group send in every wire format (game_rooms.wire).
+"""
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from . import wire
+
+
+def get_room_group_name(id_code):
+    return f"{settings.GAME_ROOMS_ROOM_GROUP_PREFIX}{id_code}"
+
+
+def get_room_message(id_code, event_type, data):
+    event = {"type": event_type, "id_code": id_code, "data": data}
+    return {"type": "room.event", "frames": wire.encode_frames({"message": event})}
+
+
+def send_room_event(id_code, event_type, data):
+    async_to_sync(get_channel_layer().group_send)(
+        get_room_group_name(id_code), get_room_message(id_code, event_type, data)
+    )
+
+
+async def asend_room_event(id_code, event_type, data):
+    await get_channel_layer().group_send(get_room_group_name(id_code), get_room_message(id_code, event_type, data))
@@ -1,14 +1,11 @@
 from django.urls import re_path
-from .consumers import RoomConsumer
-
-websocket_urlpatterns = [
-    re_path('ws/room/', RoomConsumer.as_asgi()),
-]
-
-
-
-
-
+from django.conf import settings
+from .consumers import RoomConsumer, AsyncRoomConsumer, GameRoomConsumer
 
 
+LobbyConsumer = AsyncRoomConsumer if settings.GAME_ROOMS_CONSUMER == "async" else RoomConsumer
 
+websocket_urlpatterns = [
+    re_path(r'^ws/room/$', LobbyConsumer.as_asgi()),
+    re_path(r'^ws/room/(?P<id_code>[A-Z0-9]{6})/$', GameRoomConsumer.as_asgi()),
+]
@@ -1,7 +1,8 @@
 from rest_framework import serializers, validators
+from django.conf import settings
 from .models import RoomModel
-from werkzeug.security import generate_password_hash
 from authorization.models import User
+from authorization.password_service import hash_password
 
 
 class RoomSerializer(serializers.Serializer):
@@ -41,7 +42,7 @@ class RoomSerializer(serializers.Serializer):
             if data["is_private"]:
                 if data["password"] == "":
                     raise validators.ValidationError("If the room is private, it must have password")
-                data["password"] = generate_password_hash(data["password"])
+                data["password"] = hash_password(data["password"], profile="room")
             else:
                 data["password"] = ""
         except KeyError:
@@ -52,3 +53,47 @@ class RoomSerializer(serializers.Serializer):
     def create(self, validated_data):
         # print(validated_data)
         return RoomModel.objects.create(**validated_data)
+
+
+def build_room_summaries(rows):
+    """Assemble room dicts shaped like RoomSerializer data from `get_summary_rows` rows."""
+    return [
+        {
+            "name": row["name"],
+            "max_players": row["max_players"],
+            "id_code": row["id_code"],
+            "is_started": row["is_started"],
+            "is_private": row["is_private"],
+            "players_list": row["player_names"],
+            "author": row["author_id"],
+        }
+        for row in rows
+    ]
+
+
+def get_summary_rows(queryset):
+    """The values() rows of the summaries; the players come from `RoomModel.player_names`, without a join."""
+    return queryset.values("id", "name", "max_players", "id_code", "is_started", "is_private", "author_id",
+                           "player_names", "created_at")
+
+
+def serialize_room_summaries(queryset):
+    """
+    Read-only equivalent of `RoomSerializer(queryset, many=True).data` for lobby payloads.
+
+    Runs exactly one query on the room table whatever the number of rooms and builds plain dicts,
+    skipping DRF's per-field overhead.
+    """
+    return build_room_summaries(get_summary_rows(queryset))
+
+
+def serialize_room_entries(queryset):
+    """Like `serialize_room_summaries`, but returns [(summary, created_at), ...] for the lobby cache."""
+    rows = list(get_summary_rows(queryset))
+    return list(zip(build_room_summaries(rows), [row["created_at"] for row in rows]))
+
+
+async def aserialize_room_summaries(queryset):
+    """Async counterpart of `serialize_room_summaries`."""
+    rows = get_summary_rows(queryset).aiterator(chunk_size=settings.GAME_ROOMS_LOBBY_CHUNK_SIZE)
+    return build_room_summaries([row async for row in rows])
@@ -1,28 +1,17 @@
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
 from .models import RoomModel
-from .serializers import RoomSerializer
-from django.conf import settings
+from .outbox import enqueue_on_commit
 
 
 @receiver(post_save, sender=RoomModel)
-def send_new_room_created(sender, instance, **kwargs):  
-    room = RoomModel.objects.get(id_code=instance.id_code)
-
+def send_new_room_created(sender, instance, created, **kwargs):  
     if instance.is_started:
-        message = {"message": f"Room {instance.name} started.",
-               "type": "delete",
-               "data": RoomSerializer(instance=room).data
-            }
+        event_type = "delete"
+    elif created:
+        event_type = "create"
     else:
-        message = {"message": f"New room {instance.name} created!",
-               "type": "create",
-               "data": RoomSerializer(instance=room).data
-            }
+        event_type = "update"
 
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        settings.GAME_ROOMS_CHANNEL_GROUP_NAME, {"type": "chat.message", "message": message}
-    )
+    # The lobby reads the room once the transaction commits, the author included.
+    enqueue_on_commit(event_type, instance.id_code)
@@ -1,16 +1,43 @@
 from config.celery import app
 from .models import RoomModel
+from .timers import claim_room_start
+from .purge import purge_finished_rooms as purge_rooms
+from . import outbox
+
+
+def start_expired():
+    from game.sharding import start_tables
+
+    started = RoomModel.objects.start_expired()
+    if started:
+        # Through the outbox, so the starts are ordered with the flushes of other room changes.
+        outbox.enqueue_many("started", [id_code for id_code, _ in started], schedule=False)
+        outbox.flush()
+        start_tables([id_code for id_code, _ in started])
+
+    return started
 
 
 @app.task
-def start_room_timer(room_id_code):
-    try:
-        room = RoomModel.objects.get(id_code=room_id_code)
-        room.start_create_timer()
-        
-    except RoomModel.DoesNotExist:
+def start_room_timer(room_id_code, token=None):
+    if token is not None and not claim_room_start(room_id_code, token):
         return False
-    
-    return room.is_started
 
+    started = start_expired()
 
+    return room_id_code in [id_code for id_code, _ in started]
+
+
+@app.task
+def start_expired_rooms():
+    return len(start_expired())
+
+
+@app.task
+def flush_lobby_outbox():
+    return outbox.flush()
+
+
+@app.task
+def purge_finished_rooms():
+    return purge_rooms()
@@ -1,11 +1,44 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
+from django.core.management import call_command
 from rest_framework.test import APIClient
 from rest_framework import status
 from werkzeug.security import check_password_hash
-from .models import RoomModel
+from .models import RoomModel, ArchivedRoomModel
+from game.models import GameCheckpoint
 import jwt
+import json
+import msgpack
+import io
+import threading
 from django.conf import settings
-from django.test.utils import override_settings
+from django.utils import timezone
+from django.test.utils import override_settings, CaptureQueriesContext
+from django.db import connection, transaction, IntegrityError
+from unittest import mock
+from channels.testing import WebsocketCommunicator
+from authorization.models import User
+from authorization.token_service import issue_token
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.layers import get_channel_layer
+from .consumers import RoomConsumer, AsyncRoomConsumer
+from .routing import websocket_urlpatterns
+from .serializers import RoomSerializer, serialize_room_summaries
+from .membership import repair_players
+from .fields import CODE_SPACE, encode_code, permute, get_round_keys
+from .tasks import start_room_timer, start_expired_rooms, flush_lobby_outbox
+from .timers import schedule_room_start, reschedule_room_start, cancel_room_start
+from .lobby import get_open_rooms, get_lobby_version
+from . import lobby
+from .redis_client import get_redis, aclose_async_redis
+from redis.exceptions import LockError
+from . import backpressure, lobby_cache, lobby_views, outbox, purge, wire
+from .metrics import get_metrics
+
+
+def get_sent_deltas(send, view=lobby_views.DEFAULT_VIEW):
+    """Return the lobby messages a mocked send_lobby_message sent to a view."""
+    return [call.args[0] for call in send.call_args_list if call.args[1:] in ((), (view,))]
 
 
 class RoomViewTest(TestCase):
@@ -133,4 +166,986 @@ class RoomViewTest(TestCase):
         url = f"{self.url}{self.room_id_code}/"
 
         response = self.client.get(url)
-        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+class LobbyVersionTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username="username", password="password123")
+        outbox.take_pending()
+
+    def test_room_creation_sends_next_version(self):
+        version = get_lobby_version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            RoomModel.objects.create(name="room_name", max_players=2, author=self.user)
+        outbox.flush()
+
+        self.assertEqual(get_lobby_version(), version + 1)
+
+    def test_snapshot_contains_version_and_open_rooms(self):
+        lobby_cache.clear()
+        room = RoomModel.objects.create(name="room_name", max_players=2, author=self.user)
+
+        snapshot = json.loads(lobby_cache.get_snapshot_text())["message"]
+
+        self.assertEqual(snapshot["type"], "snapshot")
+        self.assertEqual(snapshot["version"], get_lobby_version())
+        self.assertIn(room.id_code, [data["id_code"] for data in snapshot["data"]])
+
+
+class RoomConsumerTest(TransactionTestCase):
+    consumer_class = RoomConsumer
+
+    async def test_snapshot_is_sent_only_to_connecting_client(self):
+        application = self.consumer_class.as_asgi()
+
+        first = WebsocketCommunicator(application, "/ws/room/")
+        connected, _ = await first.connect()
+        self.assertTrue(connected)
+        first_snapshot = await first.receive_json_from()
+        self.assertEqual(first_snapshot["message"]["type"], "snapshot")
+
+        second = WebsocketCommunicator(application, "/ws/room/")
+        await second.connect()
+        second_snapshot = await second.receive_json_from()
+
+        self.assertEqual(second_snapshot["message"]["type"], "snapshot")
+        self.assertTrue(await first.receive_nothing())
+
+        await second.send_json_to({"type": "snapshot"})
+        refreshed = await second.receive_json_from()
+        self.assertEqual(refreshed["message"]["version"], second_snapshot["message"]["version"])
+
+        await first.disconnect()
+        await second.disconnect()
+        await aclose_async_redis()
+
+
+class AsyncRoomConsumerTest(RoomConsumerTest):
+    consumer_class = AsyncRoomConsumer
+
+
+class RoomTimerTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create(username="username", password="password123")
+        self.room = RoomModel.objects.create(name="room_name", max_players=2, author=user)
+
+        patcher = mock.patch.object(start_room_timer, "apply_async")
+        self.apply_async = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fire(self, token):
+        RoomModel.objects.filter(pk=self.room.pk).update(delete_at=timezone.now())
+        return start_room_timer(room_id_code=self.room.id_code, token=token)
+
+    def test_timer_is_scheduled_with_countdown(self):
+        token = schedule_room_start(self.room.id_code)
+
+        self.apply_async.assert_called_once_with(
+            kwargs={"room_id_code": self.room.id_code, "token": token},
+            countdown=settings.SECONDS_BEFORE_START_GAME_ROOM,
+        )
+        self.assertTrue(self.fire(token))
+        self.room.refresh_from_db()
+        self.assertTrue(self.room.is_started)
+
+    def test_cancelled_timer_does_not_start_room(self):
+        token = schedule_room_start(self.room.id_code)
+
+        self.assertTrue(cancel_room_start(self.room.id_code))
+        self.assertFalse(start_room_timer(room_id_code=self.room.id_code, token=token))
+        # Neither does the sweep once the original start time has passed.
+        later = timezone.now() + timezone.timedelta(seconds=settings.SECONDS_BEFORE_START_GAME_ROOM + 1)
+        with mock.patch("django.utils.timezone.now", return_value=later):
+            self.assertEqual(start_expired_rooms(), 0)
+        self.room.refresh_from_db()
+        self.assertFalse(self.room.is_started)
+
+        reschedule_room_start(self.room.id_code, 0)
+        self.assertEqual(start_expired_rooms(), 1)
+
+    @mock.patch.object(flush_lobby_outbox, "apply_async")
+    def test_room_filled_after_cancel_gets_delete_at(self, apply_async):
+        cancel_room_start(self.room.id_code)
+        player = User.objects.create(username="player", password="password123")
+
+        self.assertTrue(self.room.add_user_to_list(player.pk))
+        self.room.refresh_from_db()
+        self.assertTrue(self.room.is_started)
+        self.assertIsNotNone(self.room.delete_at)
+
+    def test_rescheduled_timer_supersedes_old_one(self):
+        old_token = schedule_room_start(self.room.id_code)
+        new_token = reschedule_room_start(self.room.id_code, 30)
+
+        self.assertFalse(self.fire(old_token))
+        self.assertTrue(self.fire(new_token))
+        self.assertFalse(self.fire(new_token))
+
+    def test_reschedule_moves_delete_at(self):
+        reschedule_room_start(self.room.id_code, 30)
+
+        self.room.refresh_from_db()
+        self.assertGreater(self.room.delete_at, timezone.now() + timezone.timedelta(seconds=20))
+
+
+class StartExpiredRoomsTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username="username", password="password123")
+
+    def create_room(self, delete_at):
+        room = RoomModel.objects.create(name="room_name", max_players=2, author=self.user)
+        RoomModel.objects.filter(pk=room.pk).update(delete_at=delete_at)
+        return room
+
+    def test_expired_rooms_are_started_in_one_statement(self):
+        past = timezone.now() - timezone.timedelta(seconds=1)
+        expired = [self.create_room(past), self.create_room(past)]
+        pending = self.create_room(timezone.now() + timezone.timedelta(minutes=1))
+
+        with self.assertNumQueries(1):
+            started = RoomModel.objects.start_expired()
+
+        self.assertCountEqual([id_code for id_code, _ in started], [room.id_code for room in expired])
+        self.assertFalse(RoomModel.objects.get(pk=pending.pk).is_started)
+
+    def test_sweep_sends_one_lobby_event(self):
+        past = timezone.now() - timezone.timedelta(seconds=1)
+        self.create_room(past)
+        self.create_room(past)
+        version = get_lobby_version()
+
+        self.assertEqual(start_expired_rooms(), 2)
+        self.assertEqual(get_lobby_version(), version + 1)
+        self.assertEqual(start_expired_rooms(), 0)
+
+
+class IdCodeFieldTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username="username", password="password123")
+
+    def test_code_format(self):
+        self.assertEqual(encode_code(0), "A0A0A0")
+        self.assertEqual(encode_code(CODE_SPACE - 1), "Z9Z9Z9")
+        self.assertRegex(encode_code(permute(12345, get_round_keys())), r"^([A-Z][0-9]){3}$")
+
+    def test_permutation_has_no_collisions(self):
+        round_keys = get_round_keys()
+        numbers = [permute(number, round_keys) for number in range(20000)]
+
+        self.assertEqual(len(set(numbers)), len(numbers))
+        self.assertTrue(all(0 <= number < CODE_SPACE for number in numbers))
+
+    def test_code_is_allocated_without_reading_the_table(self):
+        room = RoomModel(name="room_name", max_players=2, author=self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            room.save()
+
+        statements = [query["sql"] for query in queries if "SAVEPOINT" not in query["sql"]]
+        self.assertIn("nextval", statements[0])
+        self.assertTrue(statements[1].startswith('INSERT INTO "game_rooms_roommodel"'))
+        self.assertRegex(room.id_code, r"^([A-Z][0-9]){3}$")
+
+    def test_taken_code_is_skipped(self):
+        room = RoomModel.objects.create(name="room_name", max_players=2, author=self.user)
+        sequence = RoomModel._meta.get_field("id_code").get_sequence_name()
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT last_value FROM {connection.ops.quote_name(sequence)}")
+            number = cursor.fetchone()[0]
+        # A room from before the sequence holds the code of the next sequence value.
+        taken = encode_code(permute(number + 1, get_round_keys()))
+        RoomModel.objects.filter(pk=room.pk).update(id_code=taken)
+
+        other = RoomModel.objects.create(name="room_name", max_players=2, author=self.user)
+
+        self.assertEqual(other.id_code, encode_code(permute(number + 2, get_round_keys())))
+        self.assertEqual(list(other.players_list.values_list("pk", flat=True)), [self.user.pk])
+        with override_settings(GAME_ROOMS_ID_CODE_ATTEMPTS=1):
+            RoomModel.objects.filter(pk=other.pk).update(
+                id_code=encode_code(permute(number + 3, get_round_keys())))
+            with self.assertRaises(IntegrityError):
+                RoomModel.objects.create(name="room_name", max_players=2, author=self.user)
+
+    def test_code_is_kept_on_save(self):
+        room = RoomModel.objects.create(name="room_name", max_players=2, author=self.user)
+        id_code = room.id_code
+
+        room.name = "new_name"
+        room.save()
+
+        self.assertEqual(RoomModel.objects.get(pk=room.pk).id_code, id_code)
+
+
+class RoomMembershipTest(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create(username="author", password="password123")
+        self.player = User.objects.create(username="player", password="password123")
+        self.room = RoomModel.objects.create(name="room_name", max_players=3, author=self.author)
+
+    def players(self):
+        return set(self.room.players_list.values_list("pk", flat=True))
+
+    def test_create_adds_author_once(self):
+        with self.assertNumQueries(5):  # savepoint, nextval, room INSERT, release, author INSERT
+            room = RoomModel.objects.create(name="room_name", max_players=2, author=self.author)
+
+        self.assertEqual(list(room.players_list.values_list("pk", flat=True)), [self.author.pk])
+
+    def test_save_of_existing_room_does_not_touch_players(self):
+        self.room.is_started = True
+
+        with self.assertNumQueries(1):
+            self.room.save(update_fields=["is_started"])
+
+    def test_join_is_one_statement(self):
+        with self.captureOnCommitCallbacks() as callbacks, self.assertNumQueries(3):  # savepoint, join, release
+            self.assertTrue(self.room.add_user_to_list(self.player.pk))
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.players(), {self.author.pk, self.player.pk})
+
+    def test_repeated_join_changes_nothing(self):
+        self.room.add_user_to_list(self.player.pk)
+
+        with self.captureOnCommitCallbacks() as callbacks, self.assertNumQueries(3):
+            self.assertFalse(self.room.add_user_to_list(self.player.pk))
+
+        self.assertEqual(callbacks, [])
+
+    def test_leave_is_one_statement(self):
+        self.room.add_user_to_list(self.player.pk)
+
+        with self.assertNumQueries(1):
+            self.assertTrue(self.room.delete_user_from_list(self.player.pk))
+
+        self.assertEqual(self.players(), {self.author.pk})
+
+    @mock.patch("game.sharding.start_tables")
+    @mock.patch.object(flush_lobby_outbox, "apply_async")
+    def test_last_seat_starts_the_room_and_full_room_refuses_joins(self, apply_async, start_tables):
+        third = User.objects.create(username="third", password="password123")
+        fourth = User.objects.create(username="fourth", password="password123")
+        self.assertTrue(self.room.add_user_to_list(self.player.pk))
+        self.assertFalse(self.room.is_started)
+
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(3):
+            self.assertTrue(self.room.add_user_to_list(third.pk))
+
+        self.assertTrue(self.room.is_started)
+        start_tables.assert_called_once_with([self.room.id_code])
+        self.assertFalse(self.room.add_user_to_list(fourth.pk))
+        self.room.refresh_from_db()
+        self.assertEqual((self.room.player_count, self.room.is_started), (3, True))
+        self.assertEqual(self.players(), {self.author.pk, self.player.pk, third.pk})
+
+    def test_leave_frees_the_seat(self):
+        self.room.add_user_to_list(self.player.pk)
+        self.room.delete_user_from_list(self.player.pk)
+        self.assertFalse(self.room.delete_user_from_list(self.player.pk))
+
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.player_count, 1)
+
+    def test_join_and_leave_keep_player_names(self):
+        self.room.add_user_to_list(self.player.pk)
+        self.assertEqual(self.room.player_names, ["author", "player"])
+
+        self.room.delete_user_from_list(self.author.pk)
+        self.room.refresh_from_db()
+        self.assertEqual((self.room.player_count, self.room.player_names), (1, ["player"]))
+
+    @mock.patch.object(flush_lobby_outbox, "apply_async")
+    def test_repair_recomputes_drifted_rooms(self, apply_async):
+        self.room.add_user_to_list(self.player.pk)
+        RoomModel.objects.create(name="other", max_players=3, author=self.author)
+        RoomModel.objects.filter(pk=self.room.pk).update(player_count=3, player_names=["ghost"])
+
+        out = io.StringIO()
+        call_command("repair_room_players", "--dry-run", stdout=out)
+        self.assertIn(self.room.id_code, out.getvalue())
+        self.assertEqual(RoomModel.objects.get(pk=self.room.pk).player_names, ["ghost"])
+
+        outbox.take_pending()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(repair_players(RoomModel, batch_size=1), [self.room.id_code])
+        self.room.refresh_from_db()
+        self.assertEqual((self.room.player_count, self.room.player_names), (2, ["author", "player"]))
+        self.assertEqual(outbox.take_pending(), {self.room.id_code: "update"})
+        self.assertEqual(repair_players(RoomModel), [])
+
+    def test_player_count_cannot_exceed_max_players(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            RoomModel.objects.filter(pk=self.room.pk).update(player_count=4)
+
+
+@mock.patch("game.sharding.start_tables")
+@mock.patch.object(flush_lobby_outbox, "apply_async")
+class RoomMembershipConcurrencyTest(TransactionTestCase):
+    """Hundreds of threads race for the seats of a few rooms; no room may ever take more players than it seats."""
+
+    threads = 240
+    connections = 40
+
+    def setUp(self):
+        author = User.objects.create(username="author", password="password123")
+        self.users = User.objects.bulk_create(
+            [User(username=f"player_{number}", password="password123") for number in range(self.threads)]
+        )
+        self.rooms = [RoomModel.objects.create(name=f"room_{number}", max_players=6, author=author)
+                      for number in range(4)]
+
+    def test_concurrent_joins_never_over_admit(self, apply_async, start_tables):
+        start = threading.Event()
+        slots = threading.BoundedSemaphore(self.connections)
+        joined = []
+
+        def join(room, user):
+            start.wait()
+            with slots:
+                try:
+                    if room.add_user_to_list(user.pk):
+                        joined.append((room.pk, user.pk))
+                finally:
+                    connection.close()
+
+        threads = [threading.Thread(target=join, args=(self.rooms[number % len(self.rooms)], user))
+                   for number, user in enumerate(self.users)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(joined), len(self.rooms) * 5)
+        through = RoomModel.players_list.through
+        for room in RoomModel.objects.filter(pk__in=[room.pk for room in self.rooms]):
+            self.assertEqual(room.player_count, 6)
+            self.assertEqual(through.objects.filter(roommodel_id=room.pk).count(), 6)
+            self.assertTrue(room.is_started)
+        self.assertEqual(start_tables.call_count, len(self.rooms))
+
+    def test_concurrent_joins_of_one_user_take_one_seat(self, apply_async, start_tables):
+        room, user = self.rooms[0], self.users[0]
+        start = threading.Event()
+        results = []
+
+        def join():
+            start.wait()
+            try:
+                results.append(room.add_user_to_list(user.pk))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=join) for _ in range(self.connections)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count(True), 1)
+        room.refresh_from_db()
+        self.assertEqual((room.player_count, room.is_started), (2, False))
+
+    def test_lost_race_for_a_last_seat_is_undone(self, apply_async, start_tables):
+        room, user = self.rooms[0], self.users[0]
+        RoomModel.objects.filter(pk=room.pk).update(max_players=2)
+        cancel_room_start(room.id_code)
+        inserted, release = threading.Event(), threading.Event()
+
+        def join_first():
+            # Holds an uncommitted player row, so the join below takes the seat, then finds the
+            # row taken when it inserts the player.
+            try:
+                with transaction.atomic():
+                    RoomModel.players_list.through.objects.create(roommodel_id=room.pk, user_id=user.pk)
+                    inserted.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=join_first)
+        thread.start()
+        inserted.wait(10)
+        threading.Timer(0.5, release.set).start()
+        with mock.patch.object(transaction, "savepoint_rollback", wraps=transaction.savepoint_rollback) as rollback:
+            self.assertFalse(room.add_user_to_list(user.pk))
+        thread.join()
+
+        rollback.assert_called_once()
+
+        room.refresh_from_db()
+        self.assertEqual((room.player_count, room.player_names, room.is_started, room.delete_at),
+                         (1, ["author"], False, None))
+        self.assertEqual(start_expired_rooms(), 0)
+
+
+class RoomSummaryTest(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create(username="author", password="password123")
+        self.player = User.objects.create(username="player", password="password123")
+        for number in range(5):
+            room = RoomModel.objects.create(name=f"room_{number}", max_players=3, author=self.author)
+            room.add_user_to_list(self.player.pk)
+
+    def test_summaries_match_room_serializer(self):
+        rooms = RoomModel.objects.order_by("id")
+
+        self.assertEqual(serialize_room_summaries(rooms), RoomSerializer(instance=rooms, many=True).data)
+
+    def test_open_rooms_are_serialized_in_one_query(self):
+        with self.assertNumQueries(1):
+            rooms = get_open_rooms()
+
+        self.assertEqual(len(rooms), 5)
+        self.assertEqual(rooms[0]["players_list"], ["author", "player"])
+
+
+class LobbyCacheTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username="username", password="password123")
+        self.room = RoomModel.objects.create(name="room_name", max_players=2, author=self.user)
+        lobby_cache.clear()
+
+    def snapshot_id_codes(self):
+        return [room["id_code"] for room in json.loads(lobby_cache.get_snapshot_text())["message"]["data"]]
+
+    def test_connect_after_warm_up_is_a_cache_hit(self):
+        self.assertEqual(self.snapshot_id_codes(), [self.room.id_code])
+        hits = get_metrics().get("lobby_snapshot_cache_hits", 0)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.snapshot_id_codes(), [self.room.id_code])
+
+        self.assertEqual(get_metrics()["lobby_snapshot_cache_hits"], hits + 1)
+
+    def test_room_events_update_cache_without_database(self):
+        self.snapshot_id_codes()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            new_room = RoomModel.objects.create(name="new_room", max_players=2, author=self.user)
+        outbox.flush()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.snapshot_id_codes(), [self.room.id_code, new_room.id_code])
+
+        RoomModel.objects.filter(pk=self.room.pk).update(delete_at=timezone.now())
+        start_expired_rooms()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.snapshot_id_codes(), [new_room.id_code])
+
+    def test_snapshot_version_follows_deltas(self):
+        self.snapshot_id_codes()
+        start_expired_rooms()
+        RoomModel.objects.filter(pk=self.room.pk).update(delete_at=timezone.now())
+        start_expired_rooms()
+
+        snapshot = json.loads(lobby_cache.get_snapshot_text())["message"]
+        self.assertEqual(snapshot["version"], get_lobby_version())
+
+
+@mock.patch.object(flush_lobby_outbox, "apply_async")
+class LobbyOutboxTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username="username", password="password123")
+        self.player = User.objects.create(username="player", password="password123")
+        outbox.take_pending()
+
+    def create_room(self, name="room_name"):
+        with self.captureOnCommitCallbacks(execute=True):
+            return RoomModel.objects.create(name=name, max_players=3, author=self.user)
+
+    def test_changes_of_a_window_schedule_one_flush(self, apply_async):
+        self.create_room()
+        self.create_room()
+
+        apply_async.assert_called_once_with(countdown=settings.GAME_ROOMS_OUTBOX_WINDOW)
+        self.assertEqual(outbox.flush(), 2)
+
+        self.create_room()
+        self.assertEqual(apply_async.call_count, 2)
+
+    def test_changes_of_one_room_are_coalesced(self, apply_async):
+        room = self.create_room()
+        with self.captureOnCommitCallbacks(execute=True):
+            room.add_user_to_list(self.player.pk)
+        version = get_lobby_version()
+
+        with mock.patch("game_rooms.lobby.send_lobby_message") as send, self.assertNumQueries(1):
+            self.assertEqual(outbox.flush(), 1)
+
+        delta, = get_sent_deltas(send)
+        self.assertEqual(delta["type"], "create")
+        self.assertEqual(delta["version"], version + 1)
+        self.assertEqual(delta["data"]["players_list"], ["username", "player"])
+
+    def test_flush_sends_one_batch(self, apply_async):
+        rooms = [self.create_room(f"room_{number}") for number in range(3)]
+        version = get_lobby_version()
+
+        with mock.patch("game_rooms.lobby.send_lobby_message") as send:
+            outbox.flush()
+
+        batch, = get_sent_deltas(send)
+        self.assertEqual(batch["type"], "batch")
+        self.assertEqual(batch["version"], version + 3)
+        self.assertEqual([delta["version"] for delta in batch["data"]], [version + 1, version + 2, version + 3])
+        self.assertCountEqual([delta["data"]["id_code"] for delta in batch["data"]], [room.id_code for room in rooms])
+
+    def test_rolled_back_change_is_not_sent(self, apply_async):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                RoomModel.objects.create(name="room_name", max_players=3, author=self.user)
+                transaction.set_rollback(True)
+
+        self.assertEqual(callbacks, [])
+        apply_async.assert_not_called()
+        self.assertEqual(outbox.flush(), 0)
+
+    def test_sweep_starts_go_through_the_outbox(self, apply_async):
+        started = self.create_room("started")
+        self.create_room("pending")
+        outbox.flush()
+        with self.captureOnCommitCallbacks(execute=True):
+            started.add_user_to_list(self.player.pk)
+        RoomModel.objects.filter(pk=started.pk).update(delete_at=timezone.now())
+        version = get_lobby_version()
+
+        with mock.patch("game_rooms.lobby.send_lobby_message") as send:
+            self.assertEqual(start_expired_rooms(), 1)
+
+        # The pending update of the room is sent as its start, in the same flush.
+        delta, = get_sent_deltas(send)
+        self.assertEqual(delta["type"], "started")
+        self.assertEqual(delta["version"], version + 1)
+        self.assertEqual(delta["data"], [{"id_code": started.id_code, "name": "started"}])
+        self.assertEqual(outbox.take_pending(), {})
+
+    @override_settings(GAME_ROOMS_OUTBOX_FLUSH_TIMEOUT=0.2)
+    def test_flushes_do_not_overlap(self, apply_async):
+        self.create_room()
+
+        with get_redis().lock(outbox.get_key(outbox.FLUSH_LOCK), timeout=5):
+            with self.assertRaises(LockError):
+                outbox.flush()
+        self.assertEqual(outbox.flush(), 1)
+
+
+class LobbyViewTest(TestCase):
+
+    def summary(self, is_private=False, players=1, max_players=2):
+        return {"id_code": "A0A0A0", "name": "room_name", "max_players": max_players, "is_started": False,
+                "is_private": is_private, "players_list": ["player"] * players, "author": 1}
+
+    def test_rooms_entering_and_leaving_a_view(self):
+        private = self.summary(is_private=True)
+        full = self.summary(players=2)
+
+        self.assertEqual(lobby_views.get_view_delta("public", ("create", "", private), {}), None)
+        self.assertEqual(lobby_views.get_view_delta("all", ("create", "", private), {}), ("create", "", private))
+        self.assertEqual(lobby_views.get_view_delta("free", ("update", "", full), {"A0A0A0": self.summary()}),
+                         ("delete", "", full))
+        self.assertEqual(lobby_views.get_view_delta("public", ("update", "", self.summary()), {"A0A0A0": private}),
+                         ("create", "", self.summary()))
+        self.assertEqual(lobby_views.get_view_delta("public", ("update", "", private), {"A0A0A0": private}), None)
+
+    def test_unknown_previous_state_is_treated_as_visible(self):
+        full = self.summary(players=2)
+
+        self.assertEqual(lobby_views.get_view_delta("free", ("update", "", full), {}), ("delete", "", full))
+        started = [{"id_code": "A0A0A0", "name": "room_name"}, {"id_code": "B1B1B1", "name": "other"}]
+        _, message, data = lobby_views.get_view_delta("public", ("started", "", started), {"A0A0A0": full})
+        self.assertEqual(data, started)
+        self.assertEqual(message, "2 rooms started.")
+
+
+@mock.patch.object(flush_lobby_outbox, "apply_async")
+class LobbyViewRoutingTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username="username", password="password123")
+        self.public = RoomModel.objects.create(name="public", max_players=3, author=self.user)
+        self.private = RoomModel.objects.create(name="private", max_players=3, author=self.user,
+                                                is_private=True, password="hash")
+        outbox.take_pending()
+        lobby_cache.clear()
+
+    def snapshot(self, view):
+        return json.loads(lobby_cache.get_snapshot_text(view))["message"]
+
+    def test_views_receive_their_rooms_only(self, apply_async):
+        versions = {view: get_lobby_version(view) for view in lobby_views.VIEWS}
+        with self.captureOnCommitCallbacks(execute=True):
+            RoomModel.objects.create(name="hidden", max_players=3, author=self.user, is_private=True, password="hash")
+
+        with mock.patch("game_rooms.lobby.send_lobby_message") as send:
+            outbox.flush()
+
+        self.assertEqual(len(get_sent_deltas(send, "all")), 1)
+        self.assertEqual(len(get_sent_deltas(send, "free")), 1)
+        self.assertEqual(get_sent_deltas(send, "public"), [])
+        self.assertEqual(get_lobby_version(), versions["all"] + 1)
+        self.assertEqual(get_lobby_version("public"), versions["public"])
+
+    def test_view_snapshots_are_filtered_and_versioned(self, apply_async):
+        snapshot = self.snapshot("public")
+        self.assertEqual([room["id_code"] for room in snapshot["data"]], [self.public.id_code])
+        self.assertEqual(snapshot["version"], get_lobby_version("public"))
+        self.assertEqual(len(self.snapshot("all")["data"]), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.public.add_user_to_list(User.objects.create(username="player", password="password123").pk)
+            self.public.add_user_to_list(User.objects.create(username="other", password="password123").pk)
+        outbox.flush()
+
+        with self.assertNumQueries(0):
+            snapshot = self.snapshot("public_free")
+        self.assertEqual(snapshot["data"], [])
+        self.assertEqual(snapshot["version"], get_lobby_version("public_free"))
+        # Taking the last seat started the room, so it left every view.
+        self.assertEqual(self.snapshot("public")["data"], [])
+        self.assertEqual([room["id_code"] for room in self.snapshot("all")["data"]], [self.private.id_code])
+
+
+@mock.patch.object(flush_lobby_outbox, "apply_async")
+class GameRoomConsumerTest(TransactionTestCase):
+
+    def setUp(self):
+        self.author = User.objects.create(username="author", password="password123")
+        self.player = User.objects.create(username="player", password="password123")
+        self.private = RoomModel.objects.create(name="private", max_players=3, author=self.author,
+                                                is_private=True, password="hash")
+        self.application = URLRouter(websocket_urlpatterns)
+        lobby_cache.clear()
+
+    async def test_room_socket_receives_its_room_events_only(self, apply_async):
+        other = await RoomModel.objects.acreate(name="other", max_players=3, author=self.author)
+        room = WebsocketCommunicator(self.application, f"/ws/room/{self.private.id_code}/")
+        other_room = WebsocketCommunicator(self.application, f"/ws/room/{other.id_code}/")
+        self.assertTrue((await room.connect())[0])
+        self.assertTrue((await other_room.connect())[0])
+
+        await sync_to_async(self.private.add_user_to_list)(self.player.pk)
+
+        event = (await room.receive_json_from())["message"]
+        self.assertEqual(event, {"type": "join", "id_code": self.private.id_code, "data": {"user_id": self.player.pk}})
+        self.assertTrue(await other_room.receive_nothing())
+
+        await room.send_json_to({"type": "bid", "bid": [1, 2]})
+        self.assertEqual((await room.receive_json_from())["message"]["type"], "error")
+
+        await room.disconnect()
+        await other_room.disconnect()
+        await aclose_async_redis()
+
+    async def test_unknown_rooms_and_views_are_rejected(self, apply_async):
+        connected, _ = await WebsocketCommunicator(self.application, "/ws/room/Z9Z9Z9/").connect()
+        self.assertFalse(connected)
+        connected, _ = await WebsocketCommunicator(self.application, "/ws/room/?view=everything").connect()
+        self.assertFalse(connected)
+
+    async def test_lobby_socket_follows_its_view(self, apply_async):
+        communicator = WebsocketCommunicator(self.application, "/ws/room/?view=public")
+        self.assertTrue((await communicator.connect())[0])
+        snapshot = (await communicator.receive_json_from())["message"]
+        self.assertNotIn(self.private.id_code, [room["id_code"] for room in snapshot["data"]])
+
+        await communicator.send_json_to({"type": "subscribe", "view": "all"})
+        snapshot = (await communicator.receive_json_from())["message"]
+        self.assertIn(self.private.id_code, [room["id_code"] for room in snapshot["data"]])
+
+        await communicator.disconnect()
+        await aclose_async_redis()
+
+
+class WireFormatTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username="username", password="password123")
+        for number in range(3):
+            RoomModel.objects.create(name=f"room_{number}", max_players=3, author=self.user)
+        lobby_cache.clear()
+
+    def test_subprotocol_selection(self):
+        self.assertEqual(wire.select_subprotocol({"subprotocols": ["chat", wire.MSGPACK]}), wire.MSGPACK)
+        self.assertIsNone(wire.select_subprotocol({"subprotocols": ["chat"]}))
+        self.assertIsNone(wire.select_subprotocol({}))
+
+    def test_frames_are_encoded_once_per_format(self):
+        frames = wire.encode_frames({"message": {"type": "update", "version": 3}})
+
+        self.assertEqual(json.loads(frames[wire.JSON]), {"message": {"type": "update", "version": 3}})
+        self.assertEqual(msgpack.unpackb(frames[wire.MSGPACK]), {"message": {"type": "update", "version": 3}})
+
+    def test_msgpack_snapshot_is_columnar_and_cached(self):
+        snapshot = json.loads(lobby_cache.get_snapshot_text())["message"]
+        frame = lobby_cache.get_snapshot_frame(wire_format=wire.MSGPACK)
+
+        message = msgpack.unpackb(frame)["message"]
+        self.assertEqual(message["version"], snapshot["version"])
+        self.assertEqual(message["data"]["id_code"], [room["id_code"] for room in snapshot["data"]])
+        self.assertEqual(set(message["data"]), set(snapshot["data"][0]))
+        self.assertLess(len(frame), len(lobby_cache.get_snapshot_text()))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(lobby_cache.get_snapshot_frame(wire_format=wire.MSGPACK), frame)
+
+
+class BinaryRoomConsumerTest(TransactionTestCase):
+
+    async def test_msgpack_socket_gets_binary_frames(self):
+        communicator = WebsocketCommunicator(AsyncRoomConsumer.as_asgi(), "/ws/room/", subprotocols=[wire.MSGPACK])
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(subprotocol, wire.MSGPACK)
+        self.assertEqual(msgpack.unpackb(await communicator.receive_from())["message"]["type"], "snapshot")
+
+        summary = {"id_code": "A0A0A0", "name": "room_name", "max_players": 2, "is_started": False,
+                   "is_private": False, "players_list": [], "author": 1}
+        await sync_to_async(lobby.send_lobby_event)("update", "Room room_name updated.", summary)
+        delta = msgpack.unpackb(await communicator.receive_from())["message"]
+        self.assertEqual(delta["data"], summary)
+
+        await communicator.send_to(bytes_data=msgpack.packb({"type": "snapshot"}))
+        self.assertEqual(msgpack.unpackb(await communicator.receive_from())["message"]["type"], "snapshot")
+
+        await communicator.disconnect()
+        await aclose_async_redis()
+
+
+class LobbyStreamTest(TestCase):
+
+    def get_event(self, first_version, version):
+        return {"first_version": first_version, "version": version}
+
+    def test_forwards_deltas_in_order_and_skips_old_ones(self):
+        stream = backpressure.LobbyStream()
+        stream.reset(5)
+        self.assertEqual(stream.get_action(self.get_event(6, 8)), backpressure.FORWARD)
+        self.assertEqual(stream.version, 8)
+        self.assertEqual(stream.get_action(self.get_event(7, 7)), backpressure.SKIP)
+        self.assertEqual(stream.pop_counters(), {"lobby_deltas_coalesced": 1})
+
+    def test_gap_and_lag_resync(self):
+        stream = backpressure.LobbyStream()
+        self.assertEqual(stream.get_action(self.get_event(4, 4)), backpressure.RESYNC)
+        self.assertEqual(stream.get_action(self.get_event(1, 1), backlog=1000), backpressure.RESYNC)
+        # A short backlog is fine until the socket has not caught up for GAME_ROOMS_LOBBY_MAX_LAG.
+        self.assertEqual(stream.get_action(self.get_event(1, 1), backlog=1), backpressure.FORWARD)
+        stream.caught_up_at -= settings.GAME_ROOMS_LOBBY_MAX_LAG + 1
+        self.assertEqual(stream.get_action(self.get_event(2, 2), backlog=1), backpressure.RESYNC)
+        self.assertEqual(stream.pop_counters(), {
+            "lobby_deltas_dropped": 3, "lobby_deltas_coalesced": 2, "lobby_snapshots_resent": 3,
+        })
+
+    def test_caught_up_socket_does_not_lag(self):
+        stream = backpressure.LobbyStream()
+        stream.caught_up_at -= settings.GAME_ROOMS_LOBBY_MAX_LAG + 1
+        self.assertEqual(stream.get_action(self.get_event(1, 1), backlog=0), backpressure.FORWARD)
+        self.assertEqual(stream.get_action(self.get_event(2, 2), backlog=1), backpressure.FORWARD)
+
+    def test_backlog_of_channel_layers(self):
+        channel_layer = get_channel_layer()
+        self.assertEqual(backpressure.get_backlog(channel_layer, "specific.test!socket"), 0)
+        channel_layer.receive_buffer["specific.test!socket"].put_nowait({"type": "chat.message"})
+        self.addCleanup(channel_layer.receive_buffer.pop, "specific.test!socket")
+        self.assertEqual(backpressure.get_backlog(channel_layer, "specific.test!socket"), 1)
+
+        self.assertIsNone(backpressure.get_backlog(object(), "specific.test!socket"))
+        self.assertIsNone(backpressure.get_backlog(mock.Mock(receive_buffer={"channel": []}), "channel"))
+
+    @override_settings(GAME_ROOMS_LOBBY_MAX_RESYNCS=1)
+    def test_must_disconnect_after_too_many_resyncs(self):
+        stream = backpressure.LobbyStream()
+        stream.resync()
+        self.assertFalse(stream.must_disconnect())
+        stream.resync()
+        self.assertTrue(stream.must_disconnect())
+
+    def test_resume_token(self):
+        token = backpressure.get_resume_token("free", 42)
+        self.assertEqual(backpressure.read_resume_token(token), ("free", 42))
+        self.assertIsNone(backpressure.read_resume_token(token + "x"))
+
+
+class SlowLobbyConsumerTest(TransactionTestCase):
+
+    def setUp(self):
+        lobby_cache.clear()
+
+    async def send_late_delta(self, version):
+        summary = {"id_code": "A0A0A0", "name": "room_name", "max_players": 2, "is_started": False,
+                   "is_private": False, "players_list": [], "author": 1}
+        message = lobby.get_lobby_message(lobby.get_delta("update", "Room room_name updated.", summary, version), "all")
+        await get_channel_layer().group_send(lobby_views.get_group_name("all"), message)
+
+    @override_settings(GAME_ROOMS_LOBBY_MAX_RESYNCS=1)
+    @mock.patch("game_rooms.consumers.get_backlog", return_value=1000)
+    async def test_late_deltas_are_coalesced_then_socket_is_closed_with_resume_token(self, get_backlog):
+        application = AsyncRoomConsumer.as_asgi()
+        communicator = WebsocketCommunicator(application, "/ws/room/")
+        await communicator.connect()
+        version = (await communicator.receive_json_from())["message"]["version"]
+
+        await self.send_late_delta(version + 1)
+        self.assertEqual((await communicator.receive_json_from())["message"]["type"], "snapshot")
+
+        await self.send_late_delta(version + 1)
+        await self.send_late_delta(version + 2)
+        resume = (await communicator.receive_json_from())["message"]
+        self.assertEqual(resume["type"], "resume")
+        self.assertEqual(resume["version"], version)
+        self.assertEqual(await communicator.receive_output(), {"type": "websocket.close",
+                                                              "code": backpressure.SLOW_CONSUMER_CLOSE_CODE})
+        await communicator.wait()
+
+        resumed = WebsocketCommunicator(application, f"/ws/room/?resume={resume['token']}")
+        connected, _ = await resumed.connect()
+        self.assertTrue(connected)
+        self.assertEqual((await resumed.receive_json_from())["message"], {"type": "resumed", "version": version})
+        await resumed.disconnect()
+
+        metrics = await sync_to_async(get_metrics)()
+        self.assertGreaterEqual(metrics.get("lobby_slow_disconnects", 0), 1)
+        await aclose_async_redis()
+
+
+class RoomListTest(TestCase):
+    url = "/api/room/"
+
+    def setUp(self):
+        self.client = APIClient()
+        self.author = User.objects.create(username="author", password="password123")
+        self.player = User.objects.create(username="player", password="password123")
+        self.headers = {"Authorization": issue_token(self.author)}
+        self.rooms = [
+            RoomModel.objects.create(name=f"room_{number}", max_players=2, author=self.author,
+                                     is_private=number % 2 == 1, password="hash" if number % 2 else "")
+            for number in range(5)
+        ]
+        # A full room that has not started yet, as left by rooms created before player_count.
+        RoomModel.objects.filter(pk=self.rooms[0].pk).update(player_count=2)
+        RoomModel.objects.filter(pk=self.rooms[4].pk).update(is_started=True)
+
+    def get(self, **params):
+        return self.client.get(self.url, params, headers=self.headers)
+
+    def test_pages_follow_lobby_order(self):
+        first = self.get(limit=2)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual([room["name"] for room in first.data["data"]], ["room_0", "room_1"])
+
+        second = self.get(limit=2, cursor=first.data["next"])
+        self.assertEqual([room["name"] for room in second.data["data"]], ["room_2", "room_3"])
+        self.assertIsNone(second.data["next"])
+
+    def test_filters(self):
+        names = lambda response: [room["name"] for room in response.data["data"]]
+        self.assertEqual(names(self.get(is_private="false")), ["room_0", "room_2"])
+        self.assertEqual(names(self.get(free="true")), ["room_1", "room_2", "room_3"])
+        self.assertEqual(names(self.get(is_private="false", free="true")), ["room_2"])
+        self.assertEqual(names(self.get(max_players=3)), [])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.get(cursor="not-a-cursor").status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.get(limit=0).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.get(free="maybe").status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_matching_etag_is_not_modified_without_queries(self):
+        response = self.get()
+        etag = response.headers["ETag"]
+        self.assertEqual(etag, f'W/"lobby-{get_lobby_version()}"')
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, headers={**self.headers, "If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        get_redis().incr(settings.GAME_ROOMS_LOBBY_VERSION_KEY)
+        response = self.client.get(self.url, headers={**self.headers, "If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+
+class MetricsApiTest(TestCase):
+    url = "/api/room/metrics/"
+
+    def test_metrics_need_the_token(self):
+        with override_settings(GAME_ROOMS_METRICS_TOKEN=""):
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+
+        with override_settings(GAME_ROOMS_METRICS_TOKEN="scraper-token"):
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+            response = self.client.get(self.url, headers={"Authorization": "Bearer wrong"})
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+            response = self.client.get(self.url, headers={"Authorization": "Bearer scraper-token"})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json(), get_metrics())
+
+
+@override_settings(GAME_ROOMS_PURGE_AFTER=60, GAME_ROOMS_PURGE_BATCH_SIZE=2, GAME_ROOMS_PURGE_PAUSE=0)
+class PurgeFinishedRoomsTest(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create(username="author", password="password123")
+        self.player = User.objects.create(username="player", password="password123")
+        self.rooms = [RoomModel.objects.create(name=f"room_{number}", max_players=3, author=self.author)
+                      for number in range(4)]
+        self.rooms[0].add_user_to_list(self.player.pk)
+        started_long_ago = timezone.now() - timezone.timedelta(hours=1)
+        RoomModel.objects.filter(pk__in=[room.pk for room in self.rooms[:3]]).update(
+            is_started=True, delete_at=started_long_ago
+        )
+        GameCheckpoint.objects.create(room=self.rooms[0], seats=[], state={}, round=1, owner="worker")
+
+    def test_finished_rooms_are_archived_in_batches(self):
+        report = purge.purge_finished_rooms()
+        connection.check_constraints()
+
+        self.assertEqual(report, {"rooms_purged": 3, "open_rooms_purged": 0, "room_players_purged": 4, "batches": 3})
+        self.assertEqual(list(RoomModel.objects.values_list("pk", flat=True)), [self.rooms[3].pk])
+        self.assertFalse(GameCheckpoint.objects.exists())
+        self.assertEqual(RoomModel.players_list.through.objects.count(), 1)
+
+        archived = ArchivedRoomModel.objects.get(room_id=self.rooms[0].pk)
+        self.assertEqual(archived.id_code, self.rooms[0].id_code)
+        self.assertEqual(archived.player_ids, sorted([self.author.pk, self.player.pk]))
+        self.assertEqual(archived.player_names, ["author", "player"])
+        self.assertTrue(archived.is_started)
+        self.assertEqual(purge.purge_finished_rooms()["rooms_purged"], 0)
+
+    @mock.patch.object(flush_lobby_outbox, "apply_async")
+    def test_old_open_rooms_whose_start_was_cancelled_are_purged(self, apply_async):
+        abandoned = self.rooms[3]
+        cancel_room_start(abandoned.id_code)
+        RoomModel.objects.filter(pk=abandoned.pk).update(created_at=timezone.now() - timezone.timedelta(days=2))
+        outbox.take_pending()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            report = purge.purge_finished_rooms()
+
+        self.assertEqual((report["rooms_purged"], report["open_rooms_purged"]), (4, 1))
+        self.assertFalse(RoomModel.objects.exists())
+        archived = ArchivedRoomModel.objects.get(room_id=abandoned.pk)
+        self.assertEqual((archived.is_started, archived.delete_at), (False, None))
+        self.assertEqual(outbox.take_pending(), {abandoned.id_code: "delete"})
+
+    @override_settings(GAME_ROOMS_PURGE_ARCHIVE=False, GAME_ROOMS_PURGE_MAX_BATCHES=1)
+    def test_run_is_bounded_and_can_delete_without_archiving(self):
+        self.assertEqual(purge.purge_finished_rooms()["rooms_purged"], 2)
+        self.assertEqual(RoomModel.objects.count(), 2)
+        self.assertFalse(ArchivedRoomModel.objects.exists())
+
+    def test_recently_started_rooms_are_kept(self):
+        RoomModel.objects.filter(pk=self.rooms[1].pk).update(delete_at=timezone.now())
+        purge.purge_finished_rooms()
+        self.assertEqual(set(RoomModel.objects.values_list("pk", flat=True)), {self.rooms[1].pk, self.rooms[3].pk})
@@ -0,0 +1,75 @@
+"""
+Room start timers.
+
+A pending start is a Celery task scheduled with a countdown, so it waits in the broker /
+worker ETA queue instead of sleeping in a worker slot. Each schedule writes a fresh token
+to Redis and passes it to the task; the task only starts the room if its token is still
+the current one. Cancelling deletes the token and rescheduling replaces it, so stale
+tasks wake up and return without touching the room. Cancelling also clears the `delete_at` of
+an open room, so the sweep below does not start it either until it is rescheduled.
+
+A timer does not start its room on its own: it runs the same batch sweep as the periodic
+`start_expired_rooms` task, which starts every room whose `delete_at` has passed. Timers
+give rooms a punctual start, the periodic sweep covers timers that were lost.
+"""
+
+import uuid
+from django.conf import settings
+from django.utils import timezone
+from .redis_client import get_redis
+
+
+CLAIM_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def get_timer_key(id_code):
+    return f"{settings.GAME_ROOMS_TIMER_KEY_PREFIX}{id_code}"
+
+
+def schedule_room_start(id_code, delay=None):
+    """
+    Schedule the room start `delay` seconds from now (SECONDS_BEFORE_START_GAME_ROOM by default).
+
+    Any timer already pending for the room is superseded. Returns the timer token.
+    """
+    from .tasks import start_room_timer
+
+    if delay is None:
+        delay = settings.SECONDS_BEFORE_START_GAME_ROOM
+
+    token = uuid.uuid4().hex
+    get_redis().set(
+        get_timer_key(id_code), token, ex=int(delay) + settings.GAME_ROOMS_TIMER_TOKEN_TTL
+    )
+    start_room_timer.apply_async(kwargs={"room_id_code": id_code, "token": token}, countdown=delay)
+
+    return token
+
+
+def reschedule_room_start(id_code, delay):
+    """Move the room start, including its `delete_at` used by the sweeper, to `delay` seconds from now."""
+    from .models import RoomModel
+
+    delete_at = timezone.now() + timezone.timedelta(seconds=delay)
+    RoomModel.objects.filter(id_code=id_code, is_started=False).update(delete_at=delete_at)
+
+    return schedule_room_start(id_code, delay)
+
+
+def cancel_room_start(id_code):
+    """Cancel the pending room start, timer and sweep alike. Returns True if a timer was pending."""
+    from .models import RoomModel
+
+    RoomModel.objects.filter(id_code=id_code, is_started=False).update(delete_at=None)
+    return bool(get_redis().delete(get_timer_key(id_code)))
+
+
+def claim_room_start(id_code, token):
+    """Atomically consume the timer token. Returns True only for the current, not cancelled timer."""
+    redis = get_redis()
+    return bool(redis.eval(CLAIM_SCRIPT, 1, get_timer_key(id_code), token))
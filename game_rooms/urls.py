@@ -1,7 +1,8 @@
 from django.urls import path
-from .views import RoomApi
+from .views import RoomApi, MetricsApi
 
 urlpatterns = [
     path('', RoomApi.as_view()),
+    path('metrics/', MetricsApi.as_view()),
     path('<id_code>/', RoomApi.as_view()),
 ]
@@ -2,8 +2,11 @@ from rest_framework.views import APIView, Response
 from rest_framework import status
 from .serializers import RoomSerializer
 from .models import RoomModel
-from .decorators import jwt_required
-from .tasks import start_room_timer
+from .decorators import jwt_required, metrics_token_required
+from .timers import schedule_room_start
+from .metrics import get_metrics
+from .lobby import get_lobby_version
+from .listing import get_list_etag, etag_matches, get_room_page
 
 
 class RoomApi(APIView):
@@ -12,6 +15,7 @@ class RoomApi(APIView):
 
     Methods:
     - get(request, id_code=None): Handles GET requests to retrieve room details.
+        - Without `id_code`, returns a page of the rooms that have not started yet (see `list`).
         - If the room with the given `id_code` exists, returns a 200 OK response with the room data.
         - If the room does not exist, returns a 404 Not Found response with an error message.
         - Requires JWT authentication.
@@ -23,12 +27,20 @@ class RoomApi(APIView):
         - If the data is invalid, returns a 400 Bad Request response with validation errors.
         - Requires JWT authentication.
 
+    - list(request): Returns a 200 OK response with {"data": [...], "next": cursor} (see game_rooms.listing).
+        - Carries a weak ETag of the lobby version; a matching `If-None-Match` gets 304 Not Modified
+          without a database query.
+        - Invalid filters or cursors get a 400 Bad Request response with an error message.
+
     Raises:
     - KeyError: If the `name` or `user` key is missing from the request data.
     """
 
     @jwt_required
     def get(self, request, id_code=None):
+        if id_code is None:
+            return self.list(request)
+
         try:
             room = RoomModel.objects.get(id_code=id_code)
             serializer = RoomSerializer(instance=room)
@@ -38,6 +50,19 @@ class RoomApi(APIView):
         except RoomModel.DoesNotExist:
             return Response(data={f"Room with id_code '{id_code}' does not exist"}, status=status.HTTP_404_NOT_FOUND)
 
+    def list(self, request):
+        # The version is read before the rooms, so a page is never older than its ETag.
+        etag = get_list_etag(get_lobby_version())
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+        try:
+            page = get_room_page(request.query_params)
+        except ValueError as error:
+            return Response(data={"errors": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(data=page, status=status.HTTP_200_OK, headers={"ETag": etag})
+
     @jwt_required
     def post(self, request):
         try:
@@ -54,9 +79,25 @@ class RoomApi(APIView):
         if serializer.is_valid():
             serializer.save()
             room_id_code = serializer.data["id_code"]
-            start_room_timer.delay(room_id_code=room_id_code)
+            schedule_room_start(room_id_code)
 
             return Response(data={"message": f"Room {name} created successfully.", "data": serializer.data},
                             status=status.HTTP_201_CREATED)
 
         return Response(data={"errors": f"{serializer.errors}"}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class MetricsApi(APIView):
+    """
+    API view exposing the game_rooms counters for scraping (see game_rooms.metrics).
+
+    The counters describe internals (caches, dropped frames, sockets), so they are served only to
+    scrapers sending GAME_ROOMS_METRICS_TOKEN as a bearer token; without a token set the view is 404.
+
+    Methods:
+    - get(request): Returns a 200 OK response with {counter_name: value}.
+    """
+
+    @metrics_token_required
+    def get(self, request):
+        return Response(data=get_metrics(), status=status.HTTP_200_OK)
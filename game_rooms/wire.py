@@ -0,0 +1,76 @@
+"""
+Wire formats of the WebSocket messages.
+
+A client picks a format by offering a WebSocket subprotocol in the handshake:
+- `dices.json`, also used when the client offers none: JSON text frames, as before.
+- `dices.msgpack`: MessagePack binary frames with the same messages, except snapshots, whose
+  rooms are columnar: `data` maps every field to the list of its values, one per room, so the
+  field names are not repeated for every room.
+
+Broadcast messages are encoded in every format once, by the sender, and put on the channel
+layer as `frames` ({format: text or bytes}); consumers forward the frame of their format
+verbatim instead of encoding the message again for every socket.
+"""
+
+import json
+import msgpack
+
+JSON = "dices.json"
+MSGPACK = "dices.msgpack"
+FORMATS = (JSON, MSGPACK)
+DEFAULT_FORMAT = JSON
+
+
+def select_subprotocol(scope):
+    """Return the first subprotocol offered by the client that is a known format, or None."""
+    for subprotocol in scope.get("subprotocols", ()):
+        if subprotocol in FORMATS:
+            return subprotocol
+    return None
+
+
+def encode_json(message):
+    return json.dumps(message)
+
+
+def encode_msgpack(message):
+    return msgpack.packb(message, use_bin_type=True)
+
+
+def decode_msgpack(data):
+    """Decode a MessagePack frame sent by a client; raises ValueError if it is not valid."""
+    return msgpack.unpackb(data, raw=False)
+
+
+ENCODERS = {
+    JSON: encode_json,
+    MSGPACK: encode_msgpack,
+}
+
+
+def encode(message, wire_format=DEFAULT_FORMAT):
+    return ENCODERS[wire_format](message)
+
+
+def encode_frames(message):
+    """Return {format: frame} of a message, to be sent as is to the sockets of every format."""
+    return {wire_format: encoder(message) for wire_format, encoder in ENCODERS.items()}
+
+
+def get_frame_kwargs(frame):
+    """Return the `send` arguments of a frame: text for str, bytes otherwise."""
+    return {"text_data": frame} if isinstance(frame, str) else {"bytes_data": frame}
+
+
+def get_columns(rooms):
+    """Turn [{field: value}, ...] into {field: [value, ...]}, keeping the order of the rooms."""
+    if not rooms:
+        return {}
+    return {field: [room[field] for room in rooms] for field in rooms[0]}
+
+
+def get_columnar_snapshot(snapshot_text):
+    """Return the snapshot message of a JSON snapshot frame (see game_rooms.lobby_cache) with columnar rooms."""
+    message = json.loads(snapshot_text)["message"]
+    message["data"] = get_columns(message["data"])
+    return message